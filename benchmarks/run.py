@@ -0,0 +1,354 @@
+"""
+HTTP load benchmarks for the pkrecv API.
+
+The application is started through `wsgi.Gunicorn` on a local port with
+a seeded SQLite database, and every workload is driven by a number of
+client threads for a fixed duration.  Throughput and latency
+percentiles are written as JSON so that releases can be compared.
+
+The mean memory use of the workers is measured after the workloads have
+run, which shows what `--preload` saves per worker.
+
+Usage: python3 -m benchmarks.run [--duration SECONDS] [--output FILE]
+"""
+
+import argparse
+import base64
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Any, Callable, Dict, List, Tuple
+
+from pkrecv import app, wsgi
+from pkrecv.models import server, token
+from pkrecv.models.db import db
+
+KEY_TYPES = ["ssh-rsa", "ssh-ed25519", "ecdsa-sha2-nistp256"]
+
+Request = Tuple[str, str, Dict[str, str], Dict[str, str]]
+
+# Numbers the keys that are registered by every workload, so that no
+# workload registers a key that another one already has.
+registrations = itertools.count()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return int(s.getsockname()[1])
+
+
+def seed(uri: str, count: int) -> Dict[str, str]:
+    """
+    Create tokens and `count` servers, and return the tokens.
+    """
+    flask = app.init_app({
+        "sqlalchemy_database_uri": uri,
+        "sqlalchemy_track_modifications": False,
+    })
+    with flask.app_context():
+        tokens = {
+            "admin": token.add_token("admin", "benchmark"),
+            "server": token.add_token("server", "benchmark"),
+        }
+        servers = [
+            server.new_server(
+                "10.{}.{}.{}".format(i >> 16 & 255, i >> 8 & 255, i & 255),
+                22, "{} {}".format(KEY_TYPES[i % len(KEY_TYPES)], key_data(i)),
+                1
+            ) for i in range(count)
+        ]
+        server.insert_servers(servers)
+        db.session.commit()
+        db.session.remove()
+        db.engine.dispose()
+    return tokens
+
+
+def key_data(i: int) -> str:
+    return base64.b64encode(i.to_bytes(32, "big")).decode("ascii")
+
+
+def serve(options: Dict[str, Any], uri: str, port: int) -> None:
+    flask = app.init_app({
+        "sqlalchemy_database_uri": uri,
+        "sqlalchemy_track_modifications": False,
+    })
+    with flask.app_context():
+        db.engine.dispose()
+    bind = "127.0.0.1:{}".format(port)
+    gunicorn = wsgi.Gunicorn(
+        flask, dict(options, bind=bind, loglevel="error")
+    )
+    sys.argv = sys.argv[:1]
+    gunicorn.run()
+
+
+def wait_for(port: int, timeout: float = 10) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), 0.1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError("server did not start on port {}".format(port))
+
+
+def register(tokens: Dict[str, str]) -> Callable[[], Request]:
+    def request() -> Request:
+        i = next(registrations)
+        ip = "172.{}.{}.{}".format(i >> 16 & 255, i >> 8 & 255, i & 255)
+        body = {
+            "public_key": "ssh-ed25519 AAAA{:08d} bench".format(i),
+        }
+        headers = {
+            "Authorization": "Bearer " + tokens["server"],
+            "X-Forwarded-For": ip,
+        }
+        return "POST", "/api/v1/server", headers, body
+
+    return request
+
+
+def list_filtered(tokens: Dict[str, str]) -> Callable[[], Request]:
+    def request() -> Request:
+        ip = "10.0.{}.{}".format(random.randint(0, 3), random.randint(0, 255))
+        query = urllib.parse.urlencode({
+            "ip": ip,
+            "key_type": random.choice(KEY_TYPES),
+        })
+        headers = {
+            "Authorization": "Bearer " + tokens["admin"],
+        }
+        return "GET", "/api/v1/server?" + query, headers, {}
+
+    return request
+
+
+def token_crud(tokens: Dict[str, str]) -> Callable[[], Request]:
+    requests = itertools.cycle(["POST", "GET"])
+
+    def request() -> Request:
+        headers = {
+            "Authorization": "Bearer " + tokens["admin"],
+        }
+        method = next(requests)
+        if method == "POST":
+            return method, "/api/v1/token", headers, {"role": "none"}
+        return method, "/api/v1/token?limit=100", headers, {}
+
+    return request
+
+
+def bad_token(_: Dict[str, str]) -> Callable[[], Request]:
+    def request() -> Request:
+        headers = {
+            "Authorization": "Bearer {:064x}".format(random.getrandbits(32)),
+        }
+        return "GET", "/api/v1/server", headers, {}
+
+    return request
+
+
+def mixed(tokens: Dict[str, str]) -> Callable[[], Request]:
+    generators = [
+        (register(tokens), 4),
+        (list_filtered(tokens), 4),
+        (token_crud(tokens), 1),
+        (bad_token(tokens), 1),
+    ]
+    population = [g for g, weight in generators for _ in range(weight)]
+    return lambda: random.choice(population)()
+
+
+WORKLOADS = {
+    "register": register,
+    "list": list_filtered,
+    "token": token_crud,
+    "bad_token": bad_token,
+    "mixed": mixed,
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Nearest-rank percentile of sorted `values`.
+    """
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def drive(
+        port: int,
+        generator: Callable[[], Request],
+        duration: float,
+        concurrency: int
+) -> Dict[str, Any]:
+    """
+    Send requests from `concurrency` threads for `duration` seconds.
+    """
+    latencies = []  # type: List[float]
+    statuses = {}  # type: Dict[int, int]
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client() -> None:
+        connection = http.client.HTTPConnection("127.0.0.1", port)
+        local = []
+        codes = {}  # type: Dict[int, int]
+        while time.monotonic() < deadline:
+            method, path, headers, body = generator()
+            data = urllib.parse.urlencode(body) if body else None
+            if data:
+                headers = dict(
+                    headers,
+                    **{"Content-Type": "application/x-www-form-urlencoded"}
+                )
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, data, headers)
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status = 0
+            local.append(time.perf_counter() - start)
+            codes[status] = codes.get(status, 0) + 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+            for status, count in codes.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def worker_memory(arbiter: int) -> Dict[str, Any]:
+    """
+    Measure the mean memory use of the workers of a gunicorn arbiter.
+
+    USS is the memory that is private to a worker, i.e. what every
+    additional worker costs.  This requires /proc/<pid>/smaps_rollup.
+    """
+    workers = []
+    for entry in os.listdir("/proc"):
+        try:
+            with open("/proc/{}/stat".format(entry)) as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == arbiter:
+            workers.append(entry)
+
+    fields = {"Rss": "rss_kb", "Pss": "pss_kb", "Private_Clean": "uss_kb",
+              "Private_Dirty": "uss_kb"}
+    totals = dict.fromkeys(fields.values(), 0)
+    for pid in workers:
+        with open("/proc/{}/smaps_rollup".format(pid)) as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in fields:
+                    totals[fields[name]] += int(value.split()[0])
+
+    memory = {k: v // max(len(workers), 1) for k, v in totals.items()}
+    memory["workers"] = len(workers)
+    return memory
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--worker-class", default="sync")
+    parser.add_argument("--preload", action="store_true")
+    parser.add_argument("--servers", type=int, default=10000)
+    parser.add_argument(
+        "--workload",
+        action="append",
+        choices=sorted(WORKLOADS),
+        help="may be repeated; defaults to all workloads"
+    )
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        uri = "sqlite:///{}".format(os.path.join(tmp, "bench.sqlite"))
+        tokens = seed(uri, args.servers)
+
+        options = {
+            "workers": args.workers,
+            "worker_class": args.worker_class,
+            "preload_app": args.preload,
+        }
+        port = free_port()
+        process = multiprocessing.Process(
+            target=serve, args=(options, uri, port)
+        )
+        process.start()
+        try:
+            wait_for(port)
+            results = {
+                name: drive(
+                    port, WORKLOADS[name](tokens), args.duration,
+                    args.concurrency
+                )
+                for name in args.workload or sorted(WORKLOADS)
+            }
+            memory = worker_memory(process.pid)
+        finally:
+            process.terminate()
+            process.join()
+
+    report = json.dumps({
+        "config": {
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "worker_class": args.worker_class,
+            "preload": args.preload,
+            "servers": args.servers,
+        },
+        "results": results,
+        "memory": memory,
+    }, indent=2, sort_keys=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
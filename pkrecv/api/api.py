@@ -1,7 +1,18 @@
 from flask import Flask
 from flask_restful import Api
 
-from .server import Server
+from .compression import init_compression
+from .known_hosts import KnownHosts
+from .metrics import Metrics, init_metrics
+from .pool import Pool
+from .profiling import init_profiling
+from .replicas import init_replicas
+from .server import (
+    Server,
+    ServerBatch,
+    ServerChanges,
+    SharedFingerprints,
+)
 from .token import Token
 
 
@@ -12,3 +23,21 @@ def init_api(app: Flask) -> None:
     api = Api(app)
     api.add_resource(Token, "/api/v1/token")
     api.add_resource(Server, "/api/v1/server")
+    api.add_resource(ServerBatch, "/api/v1/server/batch")
+    api.add_resource(SharedFingerprints, "/api/v1/server/shared")
+    api.add_resource(ServerChanges, "/api/v1/server/changes")
+    api.add_resource(KnownHosts, "/api/v1/known_hosts")
+    api.add_resource(Pool, "/api/v1/pool")
+
+    if app.config.get("METRICS_ENABLED"):
+        init_metrics(app)
+        api.add_resource(Metrics, "/metrics")
+
+    if app.config.get("PROFILING_DIRECTORY"):
+        init_profiling(app)
+
+    if app.config.get("REPLICAS_URIS"):
+        init_replicas(app)
+
+    if app.config.get("COMPRESSION_ENABLED", True):
+        init_compression(app)
@@ -1,11 +1,15 @@
 import functools
 import json
+import math
 from typing import Any, Callable, Dict, Union
 
-from flask import Response, g
+from flask import Response, current_app, g
 from flask_httpauth import HTTPTokenAuth
 
-from ..models.token import get_tokens
+from ..metrics import registry
+from ..models.db import replica_reads
+from ..models.token import lookup_token
+from ..ratelimit import limiter
 
 auth = HTTPTokenAuth()
 login_required = auth.login_required
@@ -13,7 +17,7 @@ login_required = auth.login_required
 
 def role_required(*roles: str) -> Callable:
     """
-    Authorize a token.
+    Authorize a token and enforce its rate limits.
     """
 
     def decorator(f: Callable[..., Union[Dict, Response]]) -> Callable:
@@ -21,7 +25,19 @@ def role_required(*roles: str) -> Callable:
         def wrapper(*args: Any, **kwargs: Any) -> Union[Dict, Response]:
             token = g.get("token")
             if token and token.role in roles:
+                wait = limiter.check(token.id, token.role)
+                if wait:
+                    registry.inc("pkrecv_auth_total", result="limited")
+                    return Response(
+                        response=json.dumps({
+                            "message": "Too many requests"
+                        }),
+                        status=429,
+                        headers={"Retry-After": str(math.ceil(wait))},
+                        content_type="application/json"
+                    )
                 return f(*args, **kwargs)
+            registry.inc("pkrecv_auth_total", result="denied")
             return Response(
                 response=json.dumps({
                     "message": "Permission denied"
@@ -39,9 +55,18 @@ def role_required(*roles: str) -> Callable:
 def verify_token(token: str) -> bool:
     """
     Authenticate a token.
+
+    Tokens are looked up on a replica if `[replicas] tokens` is set.
     """
-    t = get_tokens(token=token)
-    if len(t) == 1:
-        g.token = t[0]
+    if not token:
+        registry.inc("pkrecv_auth_total", result="failure")
+        return False
+
+    with replica_reads(current_app.config.get("REPLICAS_TOKENS", False)):
+        t = lookup_token(token)
+    if t is not None:
+        g.token = t
+        registry.inc("pkrecv_auth_total", result="success")
         return True
+    registry.inc("pkrecv_auth_total", result="failure")
     return False
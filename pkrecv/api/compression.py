@@ -0,0 +1,121 @@
+import hashlib
+import zlib
+from typing import Callable, Dict, List, Tuple
+
+from flask import Flask, Response, current_app, request
+
+from ..cache import Cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Types of bodies that are worth compressing.
+MIMETYPES = ["application/json", "text/plain"]
+
+# Compressed bodies, keyed by their encoding and a digest of the
+# uncompressed body.
+compressed = Cache(size=32, ttl=3600)
+
+
+def gzip_compress(data: bytes, level: int) -> bytes:
+    # A window of 31 bits writes a gzip header without a timestamp, so
+    # that the output only depends on the input.
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def brotli_compress(data: bytes, level: int) -> bytes:
+    return brotli.compress(data, quality=level)  # type: ignore
+
+
+def zstd_compress(data: bytes, level: int) -> bytes:
+    compressor = zstandard.ZstdCompressor(level=level)
+    return compressor.compress(data)  # type: ignore
+
+
+# Available encodings with the config option of their level and its
+# default.
+ENCODERS = {
+    "gzip": (gzip_compress, "COMPRESSION_LEVEL", 6),
+}  # type: Dict[str, Tuple[Callable[[bytes, int], bytes], str, int]]
+if brotli is not None:
+    ENCODERS["br"] = (brotli_compress, "COMPRESSION_BROTLI_LEVEL", 5)
+if zstandard is not None:
+    ENCODERS["zstd"] = (zstd_compress, "COMPRESSION_ZSTD_LEVEL", 3)
+
+
+def encodings() -> List[str]:
+    """
+    Retrieve the available encodings, most preferred first.
+    """
+    return [e for e in ["zstd", "br", "gzip"] if e in ENCODERS]
+
+
+def compress(response: Response) -> Response:
+    """
+    Compress a response with the best encoding accepted by the client.
+
+    Only successful responses with a body of at least `threshold` bytes
+    are compressed.  Files of up to `COMPRESSION_MAX_FILE_SIZE` bytes
+    are read into memory to be compressed; larger files and streams
+    are passed through as is.
+    """
+    if (
+        response.status_code != 200
+        or response.mimetype not in MIMETYPES
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    config = current_app.config
+    if response.direct_passthrough:
+        size = response.content_length
+        limit = config.get("COMPRESSION_MAX_FILE_SIZE", 16 * 1024 * 1024)
+        if size is None or size > limit:
+            return response
+        response.direct_passthrough = False
+        response.make_sequence()
+
+    if response.is_streamed:
+        return response
+
+    data = response.get_data()
+    if len(data) < config.get("COMPRESSION_THRESHOLD", 1024):
+        return response
+
+    response.vary.add("Accept-Encoding")
+    encoding = request.accept_encodings.best_match(encodings())
+    if encoding is None:
+        return response
+
+    key = (encoding, hashlib.sha1(data).digest())
+    body = compressed.get(key)
+    if body is None:
+        encoder, option, level = ENCODERS[encoding]
+        body = encoder(data, config.get(option, level))
+        compressed.set(key, body)
+
+    # The ETag identifies the data rather than its bytes, so it is
+    # weakened instead of varying with the encoding.
+    tag, weak = response.get_etag()
+    if tag and not weak:
+        response.set_etag(tag, weak=True)
+
+    response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    """
+    Compress responses according to `Accept-Encoding`.
+    """
+    compressed.configure(app.config.get("COMPRESSION_CACHE_SIZE", 32), 3600)
+    app.after_request(compress)
@@ -0,0 +1,29 @@
+import functools
+import hashlib
+from typing import Any, Callable, Dict, Tuple, Union
+
+from flask import Response, request
+
+from ..models.db import get_generation
+
+
+def etag(f: Callable[..., Dict]) -> Callable:
+    """
+    Tag a list response with the data generation.
+
+    The tag combines the generation with a digest of the request
+    arguments.  A request whose `If-None-Match` matches the current tag
+    is answered with 304 Not Modified after a single lookup of the
+    generation, without querying the data.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args: Any, **kwargs: Any) -> Union[Response, Tuple]:
+        digest = hashlib.sha1(request.query_string + request.get_data())
+        tag = "{}-{}".format(get_generation(), digest.hexdigest()[:16])
+        headers = {"ETag": "\"{}\"".format(tag)}
+        if request.if_none_match.contains_weak(tag):
+            return Response(status=304, headers=headers)
+        return f(*args, **kwargs), 200, headers
+
+    return wrapper
@@ -0,0 +1,40 @@
+import os
+from typing import Tuple, Union
+
+from flask import Response, current_app, send_file
+from flask_restful import Resource
+
+from ..models.server import ServerError, export_known_hosts, get_known_hosts
+from .auth import login_required, role_required
+from .schema import Argument, Schema
+
+get_schema = Schema(
+    Argument("id"),
+    Argument("ip"),
+    Argument("key_type"),
+    Argument("fingerprint"),
+)
+
+
+class KnownHosts(Resource):  # type: ignore
+    @staticmethod
+    @login_required
+    @role_required("admin")
+    def get() -> Union[Response, Tuple]:
+        """
+        Retrieve servers in the ssh_known_hosts format.
+        """
+        args = get_schema.parse()
+
+        filters = {key: args[key] for key in args if args[key]}
+        path = current_app.config.get("KNOWN_HOSTS_FILE")
+        if path and not filters:
+            try:
+                export_known_hosts(path)
+            except ServerError as e:
+                return {"message": str(e)}, 500
+            return send_file(
+                os.path.abspath(path), mimetype="text/plain", cache_timeout=0
+            )
+
+        return Response(get_known_hosts(**filters), mimetype="text/plain")
@@ -0,0 +1,64 @@
+import time
+
+from flask import Flask, Response, current_app, g, request
+from flask_restful import Resource
+
+from ..metrics import registry
+from .auth import login_required, role_required
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def export() -> Response:
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+
+protected_export = login_required(role_required("admin")(export))
+
+
+class Metrics(Resource):  # type: ignore
+    @staticmethod
+    def get() -> Response:
+        """
+        Retrieve metrics in the Prometheus text format.
+
+        An admin token is required unless `public` is set in the
+        `[metrics]` configuration.
+        """
+        if current_app.config.get("METRICS_PUBLIC"):
+            return export()
+        return protected_export()
+
+
+def start_timer() -> None:
+    g.request_start = time.monotonic()
+
+
+def record_request(response: Response) -> Response:
+    """
+    Record the latency and status of a request.
+    """
+    start = g.get("request_start")
+    if start is not None:
+        endpoint = request.endpoint or "none"
+        registry.observe(
+            "pkrecv_http_request_duration_seconds",
+            time.monotonic() - start,
+            endpoint=endpoint,
+            method=request.method,
+        )
+        registry.inc(
+            "pkrecv_http_responses_total",
+            endpoint=endpoint,
+            method=request.method,
+            status=str(response.status_code),
+        )
+    return response
+
+
+def init_metrics(app: Flask) -> None:
+    """
+    Record request metrics.
+    """
+    app.before_request(start_timer)
+    app.after_request(record_request)
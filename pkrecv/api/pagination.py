@@ -0,0 +1,25 @@
+import base64
+import binascii
+from typing import List, Optional
+
+from munch import Munch
+
+
+def cursor(value: str) -> int:
+    """
+    Decode an opaque cursor into the last seen row id.
+    """
+    try:
+        return int(base64.urlsafe_b64decode(bytes(value, "ascii")))
+    except (binascii.Error, UnicodeError, ValueError):
+        raise ValueError("invalid cursor")
+
+
+def next_cursor(rows: List[Munch], limit: Optional[int]) -> Optional[str]:
+    """
+    Create a cursor for the page after `rows`, if there may be one.
+    """
+    if not limit or len(rows) < limit:
+        return None
+    data = bytes(str(rows[-1].id), "ascii")
+    return base64.urlsafe_b64encode(data).decode("ascii")
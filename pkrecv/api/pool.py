@@ -0,0 +1,17 @@
+from typing import Dict
+
+from flask_restful import Resource
+
+from ..models.pool import stats
+from .auth import login_required, role_required
+
+
+class Pool(Resource):  # type: ignore
+    @staticmethod
+    @login_required
+    @role_required("admin")
+    def get() -> Dict:
+        """
+        Retrieve connection pool counters for the serving process.
+        """
+        return {"pool": stats.as_dict()}
@@ -0,0 +1,73 @@
+import cProfile
+import os
+import random
+import time
+from typing import Optional
+
+from flask import Flask, Response, current_app, g, request
+
+from ..models.token import lookup_token
+from ..profiling import save
+
+
+def requested() -> bool:
+    """
+    Check whether a request asks to be profiled with an admin token.
+    """
+    header = current_app.config.get("PROFILING_HEADER", "X-Profile")
+    if not request.headers.get(header):
+        return False
+
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+
+    t = lookup_token(token.strip())
+    return t is not None and t.role == "admin"
+
+
+def start_profiler() -> None:
+    rate = current_app.config.get("PROFILING_SAMPLE_RATE", 0)
+    if random.random() < rate or requested():
+        g.profiler = cProfile.Profile()
+        g.profile_start = time.monotonic()
+        g.profiler.enable()
+
+
+def stop_profiler(response: Response) -> Response:
+    """
+    Write the profile of a sampled request.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+        try:
+            save(
+                profiler,
+                current_app.config["PROFILING_DIRECTORY"],
+                request.endpoint or "none",
+                time.monotonic() - g.profile_start,
+                current_app.config.get("PROFILING_MAX_FILES", 100),
+            )
+        except OSError as e:
+            current_app.logger.warning("unable to save profile: %s", e)
+    return response
+
+
+def discard_profiler(_: Optional[BaseException]) -> None:
+    """
+    Stop the profiler of a request that failed before it was written.
+    """
+    profiler = g.pop("profiler", None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def init_profiling(app: Flask) -> None:
+    """
+    Profile a sample of requests.
+    """
+    os.makedirs(app.config["PROFILING_DIRECTORY"], exist_ok=True)
+    app.before_request(start_profiler)
+    app.after_request(stop_profiler)
+    app.teardown_request(discard_profiler)
@@ -0,0 +1,93 @@
+import functools
+import struct
+import time
+from typing import Any, Callable
+
+from flask import Flask, Response, g, request
+
+from ..models.db import replica_reads
+from ..shared import SharedTable
+
+# A token is stored in a slot as its id and the time of its last write.
+SLOT = struct.Struct("<qd")
+
+
+class RecentWriters:
+    """
+    Tokens that have written within `ttl` seconds.
+
+    A write may be served by one gunicorn worker and the following read
+    by another, so the time of the last write of each token is kept in a
+    table that is shared by all workers.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.ttl = 5.0
+        self._table = SharedTable(SLOT)
+
+    def configure(self, ttl: float, slots: int = 1024) -> None:
+        """
+        Forget all writes and remember new ones for `ttl` seconds.
+
+        This is done in the process that forks the workers.
+        """
+        self._table.close()
+        self.enabled = ttl > 0
+        self.ttl = ttl
+        if self.enabled:
+            self._table.open(slots, "pkrecv-writers-")
+
+    def add(self, token_id: int) -> None:
+        if not self.enabled:
+            return
+        with self._table.locked():
+            offset, _ = self._table.find(token_id)
+            self._table.write(offset, token_id, time.monotonic())
+
+    def get(self, token_id: int) -> bool:
+        if not self.enabled:
+            return False
+        with self._table.locked(shared=True):
+            _, values = self._table.find(token_id)
+        return values is not None and time.monotonic() - values[1] < self.ttl
+
+
+# Tokens that have written recently, and that therefore read from the
+# primary.
+recent_writers = RecentWriters()
+
+
+def replica(f: Callable) -> Callable:
+    """
+    Read from a replica in a GET handler.
+
+    Tokens that have written within `[replicas] read_your_writes`
+    seconds read from the primary instead, so that they see their own
+    changes.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        token = g.get("token")
+        wrote = token is not None and recent_writers.get(token.id)
+        with replica_reads(not wrote):
+            return f(*args, **kwargs)
+
+    return wrapper
+
+
+def record_write(response: Response) -> Response:
+    token = g.get("token")
+    wrote = request.method != "GET" and response.status_code < 400
+    if token is not None and wrote:
+        recent_writers.add(token.id)
+    return response
+
+
+def init_replicas(app: Flask) -> None:
+    """
+    Remember the tokens that write.
+    """
+    recent_writers.configure(app.config.get("REPLICAS_READ_YOUR_WRITES", 5))
+    app.after_request(record_write)
@@ -0,0 +1,86 @@
+from typing import Any, Callable, Dict, List, Optional
+
+import flask_restful
+from flask import request
+from munch import Munch
+
+MISSING = (
+    "Missing required parameter in the JSON body or the post body or "
+    "the query string"
+)
+
+
+class Argument:
+    def __init__(
+            self,
+            name: str,
+            type: Callable = str,  # pylint: disable=redefined-builtin
+            required: bool = False,
+            action: str = "store",
+            dest: Optional[str] = None
+    ) -> None:
+        self.name = name
+        self.type = type
+        self.required = required
+        self.append = action == "append"
+        self.dest = dest or name
+
+    def convert(self, values: List[Any]) -> Any:
+        """
+        Convert the values found for an argument.
+        """
+        values = [v if v is None else self.type(v) for v in values]
+        if self.append:
+            return values
+        return values[0]
+
+
+class Schema:
+    """
+    A set of request arguments that is defined once, at import time.
+
+    This replaces constructing a `reqparse.RequestParser` on every
+    request, while keeping its semantics: arguments are read from the
+    JSON body and from the form and query string, and invalid or
+    missing arguments abort the request with a 400 error that maps the
+    argument name to a message.  Unlike reqparse, all errors are
+    reported at once.
+    """
+
+    def __init__(self, *arguments: Argument) -> None:
+        self.arguments = arguments
+        self.defaults = {a.dest: None for a in arguments}
+
+    def parse(self) -> Munch:
+        """
+        Parse the arguments in the current request.
+        """
+        json = request.get_json(silent=True) if request.is_json else None
+        if not isinstance(json, dict):
+            json = {}
+        values = request.values
+
+        result = Munch(self.defaults)
+        errors = {}  # type: Dict[str, str]
+        for arg in self.arguments:
+            found = values.getlist(arg.name)
+            if arg.name in json:
+                value = json[arg.name]
+                if isinstance(value, list) and arg.append:
+                    found = value + found
+                else:
+                    found = [value] + found
+
+            if not found:
+                if arg.required:
+                    errors[arg.name] = MISSING
+                continue
+
+            try:
+                result[arg.dest] = arg.convert(found)
+            except (TypeError, ValueError) as e:
+                errors[arg.name] = str(e)
+
+        if errors:
+            flask_restful.abort(400, message=errors)
+        return result
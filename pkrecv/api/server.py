@@ -1,28 +1,64 @@
 from typing import Dict, Tuple, Union
 
-from flask import g, request
-from flask_restful import Resource, reqparse
+from flask import current_app, g, request
+from flask_restful import Resource, inputs
 
-from ..models.server import ServerError, add_server, delete_server, get_servers
+from ..models.server import (
+    ServerBatchError,
+    ServerError,
+    add_server,
+    add_servers,
+    delete_server,
+    get_changes,
+    get_servers,
+    get_shared_fingerprints,
+)
 from .auth import login_required, role_required
+from .etag import etag
+from .pagination import cursor, next_cursor
+from .replicas import replica
+from .schema import Argument, Schema
+
+get_schema = Schema(
+    Argument("id"),
+    Argument("ip"),
+    Argument("key_type"),
+    Argument("fingerprint"),
+    Argument("limit", type=inputs.positive),
+    Argument("cursor", type=cursor, dest="after"),
+)
+
+shared_schema = Schema(Argument("limit", type=inputs.positive))
+
+changes_schema = Schema(
+    Argument("since", type=inputs.natural),
+    Argument("limit", type=inputs.positive),
+    Argument("wait", type=inputs.natural),
+)
+
+post_schema = Schema(Argument("public_key", required=True))
+
+batch_schema = Schema(
+    Argument("public_keys", required=True, action="append")
+)
+
+delete_schema = Schema(Argument("id", type=int, required=True))
 
 
 class Server(Resource):  # type: ignore
     @staticmethod
     @login_required
     @role_required("admin")
+    @replica
+    @etag
     def get() -> Dict:
         """
         Retrieve a list of servers.
         """
-        p = reqparse.RequestParser()
-        p.add_argument("id", type=str)
-        p.add_argument("ip", type=str)
-        p.add_argument("key_type", type=str)
-        args = p.parse_args()
+        args = get_schema.parse()
 
         servers = get_servers(**{key: args[key] for key in args if args[key]})
-        return {"servers": servers}
+        return {"servers": servers, "next": next_cursor(servers, args.limit)}
 
     @staticmethod
     @login_required
@@ -31,9 +67,7 @@ class Server(Resource):  # type: ignore
         """
         Add a server.
         """
-        p = reqparse.RequestParser()
-        p.add_argument("public_key", type=str, required=True)
-        args = p.parse_args()
+        args = post_schema.parse()
 
         ip = request.headers.get("X-Forwarded-For", request.remote_addr)
 
@@ -50,12 +84,71 @@ class Server(Resource):  # type: ignore
         """
         Delete a server.
         """
-        p = reqparse.RequestParser()
-        p.add_argument("id", type=int, required=True)
-        args = p.parse_args()
+        args = delete_schema.parse()
 
         try:
             delete_server(args.id)
         except ServerError as e:
             return {"message": str(e)}, 400
         return {"message": "deleted"}
+
+
+class ServerBatch(Resource):  # type: ignore
+    @staticmethod
+    @login_required
+    @role_required("admin", "server")
+    def post() -> Union[Dict, Tuple]:
+        """
+        Add several keys for a server.
+        """
+        args = batch_schema.parse()
+
+        ip = request.headers.get("X-Forwarded-For", request.remote_addr)
+
+        try:
+            add_servers(ip, 22, args["public_keys"], g.token.id)
+        except ServerBatchError as e:
+            return {"message": str(e), "errors": e.errors}, 400
+        return {"message": "added"}
+
+
+class SharedFingerprints(Resource):  # type: ignore
+    @staticmethod
+    @login_required
+    @role_required("admin")
+    @etag
+    def get() -> Dict:
+        """
+        Retrieve fingerprints that are registered for more than one ip,
+        e.g. host keys that were cloned with a machine image.
+        """
+        args = shared_schema.parse()
+        return {"fingerprints": get_shared_fingerprints(args.limit)}
+
+
+class ServerChanges(Resource):  # type: ignore
+    @staticmethod
+    @login_required
+    @role_required("admin")
+    def get() -> Dict:
+        """
+        Retrieve servers that were added or removed after the change
+        `since`.
+
+        If there are no such changes, the request is held open for up to
+        `wait` seconds until there are.  The `next` change number is
+        used as `since` in the following request.
+        """
+        args = changes_schema.parse()
+        config = current_app.config
+        since = args.since or 0
+        limit = min(args.limit or 1000, config.get("CHANGES_MAX_LIMIT", 1000))
+        wait = min(args.wait or 0, config.get("CHANGES_MAX_WAIT", 30))
+
+        changes = get_changes(
+            since, limit, wait, config.get("CHANGES_POLL_INTERVAL", 1)
+        )
+        return {
+            "changes": changes,
+            "next": changes[-1].seq if changes else since,
+        }
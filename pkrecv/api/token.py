@@ -1,20 +1,41 @@
 from typing import Dict, Tuple, Union
 
-from flask_restful import Resource, reqparse
+from flask_restful import Resource, inputs
 
 from ..models.token import TokenError, add_token, delete_token, get_tokens
 from .auth import login_required, role_required
+from .etag import etag
+from .pagination import cursor, next_cursor
+from .replicas import replica
+from .schema import Argument, Schema
+
+get_schema = Schema(
+    Argument("limit", type=inputs.positive),
+    Argument("cursor", type=cursor, dest="after"),
+)
+
+post_schema = Schema(
+    Argument("role", required=True),
+    Argument("description"),
+)
+
+delete_schema = Schema(Argument("id", type=int, required=True))
 
 
 class Token(Resource):  # type: ignore
     @staticmethod
     @login_required
     @role_required("admin")
+    @replica
+    @etag
     def get() -> Dict:
         """
         Retrieve a list of token IDs, roles and descriptions.
         """
-        return {"tokens": get_tokens()}
+        args = get_schema.parse()
+
+        tokens = get_tokens(**{key: args[key] for key in args if args[key]})
+        return {"tokens": tokens, "next": next_cursor(tokens, args.limit)}
 
     @staticmethod
     @login_required
@@ -23,10 +44,7 @@ class Token(Resource):  # type: ignore
         """
         Create a new token.
         """
-        p = reqparse.RequestParser()
-        p.add_argument("role", type=str, required=True)
-        p.add_argument("description", type=str)
-        args = p.parse_args()
+        args = post_schema.parse()
 
         try:
             token = add_token(args.role, args.description)
@@ -41,9 +59,7 @@ class Token(Resource):  # type: ignore
         """
         Delete a token.
         """
-        p = reqparse.RequestParser()
-        p.add_argument("id", type=int, required=True)
-        args = p.parse_args()
+        args = delete_schema.parse()
 
         try:
             delete_token(args.id)
@@ -2,7 +2,8 @@ from typing import Any, Dict
 
 from flask import Flask
 
-from .api.api import init_api
+from . import metrics, ratelimit
+from .models import migrate, server, token
 from .models.db import DBError, init_db
 
 
@@ -10,19 +11,63 @@ class AppError(Exception):
     pass
 
 
-def init_app(options: Dict[str, Any]) -> Flask:
+def init_app(options: Dict[str, Any], **sections: Dict[str, Any]) -> Flask:
     """
-    Initialize flask.
+    Initialize flask with the API and the database.
+    """
+    # flask_restful is only needed to serve requests, so it isn't
+    # imported by commands that only use the database.
+    from .api.api import init_api
+
+    app = init_models(options, **sections)
+    metrics.registry.configure(
+        app.config.get("METRICS_ENABLED", False),
+        app.config.get("METRICS_DIRECTORY"),
+        app.config.get("METRICS_INTERVAL", 1),
+    )
+    limits, role_limits = ratelimit.parse_limits(app.config, token.Token.roles)
+    ratelimit.limiter.configure(
+        app.config.get("RATELIMIT_ENABLED", False),
+        limits,
+        role_limits,
+        app.config.get("RATELIMIT_PATH"),
+        app.config.get("RATELIMIT_SLOTS", 4096),
+    )
+    init_api(app)
+    return app
+
+
+def init_models(options: Dict[str, Any], **sections: Dict[str, Any]) -> Flask:
+    """
+    Initialize flask with only the database.
+
+    Options in additional sections are prefixed with the section name,
+    e.g. `journal_mode` in `sqlite` becomes `SQLITE_JOURNAL_MODE`.
     """
     opts = {k.upper(): v for k, v in options.items()}
+    for section, values in sections.items():
+        for k, v in values.items():
+            opts["{}_{}".format(section, k).upper()] = v
     app = Flask(__name__)
-    app.app_context().push()  # type: ignore
     app.config.from_mapping(opts)  # type: ignore
 
-    init_api(app)
+    size = app.config.get("TOKEN_CACHE_SIZE", 1024)
+    token.cache.configure(size, app.config.get("TOKEN_CACHE_TTL", 30))
+    token.negative_cache.configure(
+        size, app.config.get("TOKEN_CACHE_NEGATIVE_TTL", 5)
+    )
+    token.signed_tokens.configure(
+        app.config.get("TOKEN_SECRET"),
+        app.config.get("TOKEN_REFRESH_INTERVAL", 30),
+        app.config.get("TOKEN_CACHE_NEGATIVE_TTL", 5),
+    )
+    server.known_hosts.configure(
+        64, app.config.get("KNOWN_HOSTS_CACHE_TTL", 60)
+    )
 
     try:
-        init_db(app)
+        with app.app_context():
+            init_db(app, migrate.latest_version())
     except DBError as e:
         raise AppError(e)
 
@@ -0,0 +1,91 @@
+import collections
+import threading
+import time
+from typing import Any, Hashable, Optional
+
+
+class Cache:
+    """
+    A bounded LRU cache with per-entry expiration.
+
+    Every entry is stamped with the generation that was current when it
+    was stored.  Bumping the generation with `invalidate()` makes all
+    existing entries stale, and lets callers that looked up a value
+    before the invalidation avoid storing it afterwards.
+    """
+
+    def __init__(self, size: int, ttl: float) -> None:
+        self.size = size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = collections.OrderedDict()  # type: ignore
+        self._lock = threading.Lock()
+
+    def configure(self, size: int, ttl: float) -> None:
+        """
+        Change the size and TTL of the cache and drop all entries.
+        """
+        with self._lock:
+            self.size = size
+            self.ttl = ttl
+            self._entries.clear()
+            self.generation += 1
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Retrieve a live entry or `default`.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires, generation = entry
+            if generation != self.generation or expires < time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(
+            self,
+            key: Hashable,
+            value: Any,
+            ttl: Optional[float] = None,
+            generation: Optional[int] = None
+    ) -> None:
+        """
+        Store an entry, evicting the least recently used one if needed.
+
+        If `generation` is given and the cache has been invalidated
+        since, the entry is discarded.
+        """
+        if self.size <= 0:
+            return
+
+        if ttl is None:
+            ttl = self.ttl
+
+        with self._lock:
+            if generation is None:
+                generation = self.generation
+            elif generation != self.generation:
+                return
+
+            expires = time.monotonic() + ttl
+            self._entries[key] = (value, expires, generation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """
+        Invalidate every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.generation += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -1,10 +1,23 @@
 import sys
+from typing import TextIO
 
 import click
+from flask import Flask
 from munch import Munch
 
-from . import app, config, wsgi
-from .models import token
+from . import app, config, profiling
+from .models import bulk, db, migrate, server, token
+
+# Configuration sections that are passed to flask.
+SECTIONS = [
+    "sqlite",
+    "pool",
+    "metrics",
+    "profiling",
+    "changes",
+    "ratelimit",
+    "replicas",
+]
 
 
 @click.group()
@@ -18,29 +31,149 @@ def cli(ctx: click.Context, config_file: str) -> None:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
 
+    ctx.obj = Munch(config=cfg)
+
+
+def init(ctx: click.Context, full: bool = False) -> Flask:
+    """
+    Initialize flask for a command.
+
+    Commands that only use the database skip the API, which keeps them
+    fast enough to be run in a loop by provisioning scripts.  They run
+    in an application context that is popped, and with connections that
+    are closed, when the command is done.  The server pushes a context
+    for every request instead.
+    """
+    cfg = ctx.obj.config
+    sections = {name: cfg.get_section(name, {}) for name in SECTIONS}
     try:
-        flask = app.init_app(cfg.get_section("flask", {}))
+        if full:
+            return app.init_app(cfg.get_section("flask", {}), **sections)
+        flask = app.init_models(cfg.get_section("flask", {}), **sections)
     except app.AppError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
 
-    gunicorn = wsgi.Gunicorn(flask, cfg.get_section("gunicorn", {}))
-    ctx.obj = Munch(gunicorn=gunicorn)
+    context = flask.app_context()
+    context.push()
+
+    def close() -> None:
+        db.db.engine.dispose()
+        context.pop()
+
+    ctx.call_on_close(close)
+    return flask
 
 
 @cli.command("add-token")
 @click.option("--role", required=True)
 @click.option("--description")
-def add_token(role: str, description: str) -> None:
+@click.option("--signed", is_flag=True)
+@click.pass_context
+def add_token(
+        ctx: click.Context, role: str, description: str, signed: bool
+) -> None:
+    init(ctx)
     try:
-        t = token.add_token(role, description)
+        t = token.add_token(role, description, signed)
     except token.TokenError as e:
         sys.stderr.write("ERROR: {}\n".format(e))
         sys.exit(1)
     print("Token: {}".format(t))
 
 
+@cli.command("migrate")
+@click.pass_context
+def migrate_db(ctx: click.Context) -> None:
+    init(ctx)
+    try:
+        applied = migrate.migrate()
+    except db.DBError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    for m in applied:
+        print("Applied migration {}: {}".format(m.version, m.description))
+    print("Schema version: {}".format(migrate.get_version()))
+
+
+@cli.command("import")
+@click.option("--token-id", type=int, required=True)
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS),
+              default="known_hosts")
+@click.option("--chunk-size", type=click.IntRange(1), default=10000)
+@click.option("--processes", type=click.IntRange(1))
+@click.argument("source", type=click.File("r"), default="-")
+@click.pass_context
+def import_servers(
+        ctx: click.Context,
+        token_id: int,
+        fmt: str,
+        chunk_size: int,
+        processes: int,
+        source: TextIO
+) -> None:
+    def progress(result: Munch) -> None:
+        sys.stderr.write(
+            "\rImported {} servers from {} lines".format(
+                result.servers, result.lines
+            )
+        )
+
+    init(ctx)
+    try:
+        result = bulk.import_servers(
+            source, fmt, token_id, chunk_size, processes, progress
+        )
+    except server.ServerError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+    sys.stderr.write("\n")
+    for number, error in result.errors:
+        sys.stderr.write("ERROR: line {}: {}\n".format(number, error))
+    if result.errors:
+        sys.exit(1)
+
+
+@cli.command("export")
+@click.option("--format", "fmt", type=click.Choice(bulk.FORMATS),
+              default="known_hosts")
+@click.argument("destination", type=click.File("w"), default="-")
+@click.pass_context
+def export_servers(ctx: click.Context, fmt: str, destination: TextIO) -> None:
+    init(ctx)
+    destination.writelines(bulk.export_servers(fmt))
+
+
+@cli.command("profile-report")
+@click.option("--directory")
+@click.option("--top", default=20)
+@click.option("--sort", type=click.Choice(profiling.SORT_KEYS),
+              default="cumulative")
+@click.option("--endpoint")
+@click.pass_context
+def profile_report(
+        ctx: click.Context, directory: str, top: int, sort: str, endpoint: str
+) -> None:
+    profiling_config = ctx.obj.config.get_section("profiling", {})
+    directory = directory or profiling_config.get("directory")
+    if not directory:
+        sys.stderr.write("ERROR: no profiling directory\n")
+        sys.exit(1)
+
+    try:
+        print(profiling.report(directory, top, sort, endpoint), end="")
+    except profiling.ProfilingError as e:
+        sys.stderr.write("ERROR: {}\n".format(e))
+        sys.exit(1)
+
+
 @cli.command()
 @click.pass_context
 def serve(ctx: click.Context) -> None:
-    ctx.obj.gunicorn.run()
+    # gunicorn is only imported by the command that needs it.
+    from . import wsgi
+
+    flask = init(ctx, full=True)
+    wsgi.Gunicorn(flask, ctx.obj.config.get_section("gunicorn", {})).run()
@@ -0,0 +1,263 @@
+import collections
+import glob
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# Upper bounds of histogram buckets, in seconds.  A bucket for +Inf is
+# always added.
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1)
+
+Metric = collections.namedtuple("Metric", "name kind description buckets")
+
+Key = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+METRICS = [
+    Metric(
+        "pkrecv_http_request_duration_seconds", "histogram",
+        "Request latency by endpoint and method.", REQUEST_BUCKETS
+    ),
+    Metric(
+        "pkrecv_http_responses_total", "counter",
+        "Responses by endpoint, method and status.", ()
+    ),
+    Metric(
+        "pkrecv_auth_total", "counter",
+        "Token authentication attempts by result.", ()
+    ),
+    Metric(
+        "pkrecv_db_query_duration_seconds", "histogram",
+        "Database query latency by operation.", QUERY_BUCKETS
+    ),
+]
+
+
+class Registry:
+    """
+    Counters and histograms for all processes serving the application.
+
+    Every process records into memory and periodically writes a
+    snapshot to `<directory>/<pid>.json`.  The exposition merges the
+    snapshots of all processes, so that the figures are correct no
+    matter which gunicorn worker is scraped.  Snapshots of exited
+    workers are kept, which keeps the counters monotonic.
+    """
+
+    def __init__(self, metrics: Sequence[Metric]) -> None:
+        self.metrics = collections.OrderedDict((m.name, m) for m in metrics)
+        self.enabled = False
+        self.directory = None  # type: Optional[str]
+        self.interval = 1.0
+        self._temporary = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.reset()
+
+    def configure(
+            self,
+            enabled: bool,
+            directory: Optional[str] = None,
+            interval: float = 1
+    ) -> None:
+        """
+        Enable or disable collection.
+
+        This is done in the process that forks the workers.  Snapshots
+        from earlier runs are removed from `directory`, and a temporary
+        directory is used if none is given.  The temporary directory is
+        removed by `cleanup()`.
+        """
+        self.cleanup()
+        self.enabled = enabled
+        self.interval = interval
+        if enabled:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+                for path in glob.glob(os.path.join(directory, "*.json")):
+                    os.remove(path)
+            else:
+                directory = tempfile.mkdtemp(prefix="pkrecv-metrics-")
+                self._temporary = True
+            self.directory = directory
+        self.reset()
+
+    def cleanup(self) -> None:
+        """
+        Remove the directory of snapshots if it is a temporary one.
+        """
+        if self._temporary and self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+        self.directory = None
+        self._temporary = False
+
+    def reset(self) -> None:
+        with self._lock:
+            self._pid = os.getpid()
+            self._values = {}  # type: Dict[Key, Any]
+            self._written = time.monotonic()
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        """
+        Increment a counter.
+        """
+        if not self.enabled:
+            return
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_pid()
+            self._values[key] = self._values.get(key, 0) + amount
+        self._maybe_write()
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        Add an observation to a histogram.
+        """
+        if not self.enabled:
+            return
+
+        buckets = self.metrics[name].buckets
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_pid()
+            # Non-cumulative bucket counts, the +Inf bucket and the sum.
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(buckets) + 2)
+            i = 0
+            while i < len(buckets) and value > buckets[i]:
+                i += 1
+            counts[i] += 1
+            counts[-1] += value
+        self._maybe_write()
+
+    def write(self) -> None:
+        """
+        Write a snapshot of the values recorded by this process.
+        """
+        if not self.directory:
+            return
+
+        with self._write_lock:
+            with self._lock:
+                self._check_pid()
+                snapshot = [
+                    [name, labels, value]
+                    for (name, labels), value in self._values.items()
+                ]
+                self._written = time.monotonic()
+
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump(snapshot, f)
+                name = "{}.json".format(self._pid)
+                os.replace(tmp, os.path.join(self.directory, name))
+            except OSError:
+                os.remove(tmp)
+                raise
+
+    def collect(self) -> Dict[Key, Any]:
+        """
+        Merge the values recorded by all processes.
+        """
+        if not self.directory:
+            with self._lock:
+                self._check_pid()
+                return {k: _copy(v) for k, v in self._values.items()}
+
+        self.write()
+        merged = {}  # type: Dict[Key, Any]
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                with open(path, "r") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            for name, labels, value in snapshot:
+                if name not in self.metrics:
+                    continue
+                key = (name, tuple(tuple(label) for label in labels))
+                merged[key] = _add(merged.get(key), value)
+        return merged
+
+    def render(self) -> str:
+        """
+        Render all metrics in the Prometheus text exposition format.
+        """
+        values = self.collect()
+        lines = []  # type: List[str]
+        for metric in self.metrics.values():
+            name = metric.name
+            lines.append("# HELP {} {}".format(name, metric.description))
+            lines.append("# TYPE {} {}".format(name, metric.kind))
+            for (key, labels), value in sorted(values.items()):
+                if key != name:
+                    continue
+                if metric.kind == "counter":
+                    lines.append(_sample(name, labels, value))
+                    continue
+
+                total = 0
+                bounds = [_number(b) for b in metric.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, value):
+                    total += count
+                    le = labels + (("le", bound), )
+                    lines.append(_sample(name + "_bucket", le, total))
+                lines.append(_sample(name + "_sum", labels, value[-1]))
+                lines.append(_sample(name + "_count", labels, total))
+        return "\n".join(lines) + "\n"
+
+    def _check_pid(self) -> None:
+        """
+        Drop values inherited from the parent of a forked worker.
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._values = {}
+            self._written = time.monotonic()
+
+    def _maybe_write(self) -> None:
+        if not self.directory:
+            return
+        if time.monotonic() - self._written >= self.interval:
+            self.write()
+
+
+def _copy(value: Any) -> Any:
+    return list(value) if isinstance(value, list) else value
+
+
+def _add(a: Any, b: Any) -> Any:
+    if a is None:
+        return _copy(b)
+    if isinstance(a, list):
+        return [x + y for x, y in zip(a, b)]
+    return a + b
+
+
+def _number(value: float) -> str:
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace(
+        "\n", "\\n"
+    )
+
+
+def _sample(name: str, labels: Sequence[Tuple[str, str]], value: Any) -> str:
+    if labels:
+        name += "{{{}}}".format(
+            ",".join("{}=\"{}\"".format(k, _escape(v)) for k, v in labels)
+        )
+    return "{} {}".format(name, _number(value))
+
+
+registry = Registry(METRICS)
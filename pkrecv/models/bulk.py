@@ -0,0 +1,216 @@
+import collections
+import itertools
+import json
+import multiprocessing
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from munch import Munch
+
+from .db import db, retry_busy
+from .server import (
+    Server,
+    ServerError,
+    columns,
+    insert_rows,
+    known_hosts,
+    known_hosts_line,
+    new_server,
+)
+from .token import Token
+
+FORMATS = ["known_hosts", "ndjson"]
+
+# Columns written by `export_servers()` in the ndjson format.
+EXPORT_COLUMNS = ["ip", "port", "key_type", "key_data", "key_comment"]
+
+Key = Tuple[str, int, str]
+Chunk = Tuple[str, int, List[Tuple[int, str]]]
+
+
+def parse_known_hosts(line: str) -> List[Key]:
+    """
+    Parse an ssh_known_hosts line into (ip, port, public key) tuples.
+    """
+    if line.startswith("@"):
+        raise ServerError("markers are not supported")
+
+    fields = line.split(None, 1)
+    if len(fields) != 2:
+        raise ServerError("invalid public key")
+
+    hosts, public_key = fields
+    keys = []
+    for host in hosts.split(","):
+        if host.startswith("|"):
+            raise ServerError("hashed hosts are not supported")
+
+        port = 22
+        if host.startswith("["):
+            host, sep, rest = host[1:].partition("]:")
+            if not sep or not rest.isdigit():
+                raise ServerError("invalid host {}".format(host))
+            port = int(rest)
+        keys.append((host, port, public_key))
+    return keys
+
+
+def parse_ndjson(line: str) -> List[Key]:
+    """
+    Parse a JSON object with an ip, an optional port and either a
+    public_key or its key_type, key_data and key_comment.
+    """
+    try:
+        obj = json.loads(line)
+    except ValueError:
+        raise ServerError("invalid JSON")
+    if not isinstance(obj, dict) or not isinstance(obj.get("ip"), str):
+        raise ServerError("missing ip")
+
+    public_key = obj.get("public_key")
+    if public_key is None:
+        public_key = " ".join(
+            str(obj.get(c) or "")
+            for c in ["key_type", "key_data", "key_comment"]
+        )
+    port = obj.get("port", 22)
+    if not isinstance(port, int) or isinstance(port, bool):
+        raise ServerError("invalid port {}".format(port))
+    return [(obj["ip"], port, str(public_key))]
+
+
+PARSERS = {
+    "known_hosts": parse_known_hosts,
+    "ndjson": parse_ndjson,
+}  # type: Dict[str, Callable[[str], List[Key]]]
+
+
+def parse_chunk(chunk: Chunk) -> Tuple[List[Dict], List[Tuple[int, str]]]:
+    """
+    Validate a chunk of numbered lines.
+
+    This runs in a worker process, so it only returns plain rows and
+    error messages.
+    """
+    fmt, token_id, lines = chunk
+    parse = PARSERS[fmt]
+    rows = []
+    errors = []
+    for number, line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+
+        try:
+            for ip, port, public_key in parse(line):
+                server = new_server(ip, port, public_key, token_id)
+                rows.append({c: getattr(server, c) for c in columns})
+        except ServerError as e:
+            errors.append((number, str(e)))
+    return rows, errors
+
+
+def chunks(
+        lines: Iterable[str], fmt: str, token_id: int, size: int
+) -> Iterator[Chunk]:
+    numbered = enumerate(lines, 1)
+    while True:
+        chunk = list(itertools.islice(numbered, size))
+        if not chunk:
+            return
+        yield fmt, token_id, chunk
+
+
+@retry_busy
+def commit_rows(rows: List[Dict]) -> int:
+    inserted = insert_rows(rows)
+    db.session.commit()
+    return inserted
+
+
+def import_servers(
+        lines: Iterable[str],
+        fmt: str,
+        token_id: int,
+        chunk_size: int = 10000,
+        processes: Optional[int] = None,
+        progress: Optional[Callable[[Munch], None]] = None
+) -> Munch:
+    """
+    Import servers from an iterable of lines in `fmt`.
+
+    Chunks of lines are validated in a pool of `processes` worker
+    processes, and each chunk is inserted in a transaction of its own.
+    Only a few chunks are in flight at any time, so input of any size is
+    imported in constant memory.  Invalid lines are skipped and
+    reported, with their line number, in the returned `errors`.  Keys
+    that are already registered, or repeated, are skipped and not
+    counted in `servers`.
+    `progress` is called with the counters after every chunk.
+    """
+    if fmt not in PARSERS:
+        raise ServerError("invalid format {}".format(fmt))
+    if Token.query.get(token_id) is None:
+        raise ServerError("invalid token id {}".format(token_id))
+
+    result = Munch(lines=0, servers=0, errors=[])
+
+    def handle(chunk: Chunk, parsed: Tuple[List, List]) -> None:
+        rows, errors = parsed
+        result.servers += commit_rows(rows)
+        result.lines = chunk[2][-1][0]
+        result.errors.extend(errors)
+        if progress:
+            progress(result)
+
+    try:
+        if processes == 1:
+            for chunk in chunks(lines, fmt, token_id, chunk_size):
+                handle(chunk, parse_chunk(chunk))
+            return result
+
+        with multiprocessing.Pool(processes) as pool:
+            window = 2 * (processes or multiprocessing.cpu_count())
+            pending = collections.deque()  # type: collections.deque
+            for chunk in chunks(lines, fmt, token_id, chunk_size):
+                parsed = pool.apply_async(parse_chunk, (chunk, ))
+                pending.append((chunk, parsed))
+                if len(pending) >= window:
+                    done, parsed = pending.popleft()
+                    handle(done, parsed.get())
+            while pending:
+                done, parsed = pending.popleft()
+                handle(done, parsed.get())
+        return result
+    finally:
+        known_hosts.invalidate()
+
+
+def export_servers(fmt: str, batch_size: int = 1000) -> Iterator[str]:
+    """
+    Stream all servers as lines in `fmt`.
+
+    Rows are fetched `batch_size` at a time from a server-side cursor
+    where the database supports it, so memory use is constant.
+    """
+    if fmt not in PARSERS:
+        raise ServerError("invalid format {}".format(fmt))
+
+    query = db.session.query(
+        *[getattr(Server, c) for c in EXPORT_COLUMNS]
+    ).order_by(Server.id).execution_options(
+        stream_results=True
+    ).yield_per(batch_size)
+
+    for row in query:
+        if fmt == "known_hosts":
+            yield known_hosts_line(*row)
+        else:
+            yield json.dumps(dict(zip(EXPORT_COLUMNS, row))) + "\n"
@@ -1,19 +1,88 @@
+import contextlib
 import datetime
 import functools
+import random
 import sqlite3
-from typing import Any, List, Optional, Union
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    Union,
+)
 
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
+import flask_sqlalchemy
+from flask import Flask, current_app
 from munch import Munch
-from sqlalchemy import Column, event
+from sqlalchemy import (
+    Column,
+    DateTime,
+    Integer,
+    String,
+    event,
+    inspect,
+    select,
+)
 from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.pool import _ConnectionRecord
+from sqlalchemy.exc import (
+    IntegrityError,
+    OperationalError,
+    SQLAlchemyError,
+)
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool, _ConnectionRecord
+from sqlalchemy.sql import Select
+
+from .. import metrics
+from . import pool
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):  # type: ignore
+    def apply_driver_hacks(
+            self, app: Flask, sa_url: Any, options: Dict
+    ) -> Any:
+        """
+        Apply the `[pool]` configuration to new engines.
+
+        In-memory SQLite databases keep their StaticPool, since they
+        only exist for as long as their single connection.
+        """
+        rv = super().apply_driver_hacks(app, sa_url, options)
+        if options.get("poolclass") is not StaticPool:
+            options.update(pool.engine_options(app.config))
+            if "poolclass" in options and sa_url.drivername == "sqlite":
+                connect_args = options.setdefault("connect_args", {})
+                connect_args["check_same_thread"] = False
+        return rv
+
 
 db = SQLAlchemy()
 column = functools.partial(Column, nullable=False)
 
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Tunable SQLite pragmas and their valid values, in the order that they
+# are applied.  See https://www.sqlite.org/pragma.html
+SQLITE_PRAGMAS = [
+    ("journal_mode", ["delete", "truncate", "persist", "memory", "wal"]),
+    ("synchronous", ["off", "normal", "full", "extra", "0", "1", "2", "3"]),
+    ("busy_timeout", int),
+    ("cache_size", int),
+    ("mmap_size", int),
+    ("temp_store", ["default", "file", "memory", "0", "1", "2"]),
+]
+
+# Pragmas applied to every new SQLite connection, set by `init_db()`.
+sqlite_pragmas = []  # type: List[str]
+
+# Names of the binds of read replicas, set by `init_db()`.
+replica_binds = []  # type: List[str]
+
 
 class DBError(Exception):
     pass
@@ -51,15 +120,169 @@ class Model(db.Model):  # type: ignore
             return value
 
         if isinstance(value, datetime.datetime):
-            return value.strftime("%Y-%m-%d %H:%M:%S")
+            return value.strftime(DATETIME_FORMAT)
 
         raise ValueError("unknown type for {}".format(value))
 
 
+class Serializer:
+    """
+    Serialize rows of a model without creating ORM objects.
+
+    The columns and the positions that need conversion are resolved
+    once, so each row is turned into a dict straight from the tuple
+    returned by the database.
+    """
+
+    def __init__(
+            self, model: Type[Model], exclude: Optional[List] = None
+    ) -> None:
+        if not exclude:
+            exclude = []
+
+        self.table = model.__table__
+        self.columns = [c for c in self.table.columns if c.key not in exclude]
+        self.keys = [c.key for c in self.columns]
+        self.datetimes = [
+            i for i, c in enumerate(self.columns)
+            if isinstance(c.type, DateTime)
+        ]
+
+    def select(self, **filters: Any) -> Select:
+        """
+        Create a statement that selects the serialized columns.
+        """
+        stmt = select(self.columns)
+        for key, value in filters.items():
+            stmt = stmt.where(self.table.c[key] == value)
+        return stmt
+
+    def all(self, stmt: Select) -> List[Munch]:
+        """
+        Execute a statement and serialize the resulting rows.
+        """
+        return self.serialize(db.session.execute(stmt, bind=read_bind()))
+
+    def serialize(self, rows: Iterable) -> List[Munch]:
+        keys = self.keys
+        datetimes = self.datetimes
+        result = []
+        for row in rows:
+            if datetimes:
+                row = list(row)
+                for i in datetimes:
+                    row[i] = row[i].strftime(DATETIME_FORMAT)
+            result.append(Munch(zip(keys, row)))
+        return result
+
+
+class SchemaVersion(Model):
+    __tablename__ = "schema_version"
+
+    version = column(Integer, primary_key=True, autoincrement=False)
+    description = column(String(128))
+    applied = column(DateTime, default=datetime.datetime.utcnow)
+
+
+class Generation(Model):
+    """
+    A counter that is incremented by every change to servers and
+    tokens, so that clients can tell whether anything has changed
+    without querying the data itself.
+    """
+
+    id = column(Integer, primary_key=True, autoincrement=False)
+    value = column(Integer, default=0)
+
+
+def get_generation() -> int:
+    query = select([Generation.value]).where(Generation.id == 1)
+    return db.session.execute(query, bind=read_bind()).scalar() or 0
+
+
+def bump_generation() -> None:
+    """
+    Increment the generation when the current transaction commits.
+
+    The increment is a single statement issued by `commit_generation()`,
+    so the generation row is only locked for as long as it takes to
+    commit rather than for the whole transaction.
+    """
+    db.session.info["bump_generation"] = True
+
+
+def commit_generation(session: Session) -> None:
+    """
+    Issue the increment requested by `bump_generation()`, if any.
+
+    Concurrent transactions that bump the generation are serialized
+    from this point until they have committed.
+    """
+    if session.info.pop("bump_generation", False):
+        session.execute(
+            Generation.__table__.update().where(Generation.id == 1).values(
+                value=Generation.value + 1
+            )
+        )
+
+
+@event.listens_for(Session, "before_commit")
+def increment_generation(session: Session) -> None:
+    if not session.transaction.nested:
+        commit_generation(session)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_generation(session: Session, previous: Any) -> None:
+    if previous.parent is None:
+        session.info.pop("bump_generation", None)
+
+
+@contextlib.contextmanager
+def replica_reads(enabled: bool = True) -> Iterator[None]:
+    """
+    Send reads by `Serializer` in the current session to a replica.
+
+    Replicas lag behind the primary, so this is only meant for reads
+    where slightly stale data is acceptable.
+    """
+    info = db.session.info
+    previous = info.get("replica", False)
+    info["replica"] = enabled
+    try:
+        yield
+    finally:
+        info["replica"] = previous
+
+
+def read_bind() -> Optional[Engine]:
+    """
+    Select the engine for a read in the current session.
+
+    None, i.e. the primary, is returned unless replicas are configured
+    and enabled with `replica_reads()`.  The replica is chosen once per
+    session, so that a request doesn't see different replication lags.
+    """
+    info = db.session.info
+    if not replica_binds or not info.get("replica"):
+        return None
+    if "replica_bind" not in info:
+        info["replica_bind"] = random.choice(replica_binds)
+    return db.get_engine(bind=info["replica_bind"])
+
+
+def dialect() -> str:
+    """
+    Retrieve the name of the database dialect, e.g. "sqlite".
+    """
+    return str(db.engine.dialect.name)
+
+
 @event.listens_for(Engine, "connect")
 def set_sqlite3_pragma(dbapi_connection: Any, _: _ConnectionRecord) -> None:
     """
-    Enforce foreign key constraints in SQLite3.
+    Enforce foreign key constraints and apply configured pragmas in
+    SQLite3.
 
     Reference:
     https://docs.sqlalchemy.org/en/latest/dialects/sqlite.html
@@ -67,15 +290,163 @@ def set_sqlite3_pragma(dbapi_connection: Any, _: _ConnectionRecord) -> None:
     if isinstance(dbapi_connection, sqlite3.Connection):
         cursor = dbapi_connection.cursor()
         cursor.execute("PRAGMA foreign_keys=ON")
+        for pragma in sqlite_pragmas:
+            cursor.execute(pragma)
         cursor.close()
 
 
-def init_db(app: Flask) -> None:
+@event.listens_for(Engine, "before_cursor_execute", named=True)
+def start_query_timer(context: Any, **_: Any) -> None:
+    # The start is kept on the context of the statement, which is
+    # discarded with it whether or not the statement succeeds.
+    if metrics.registry.enabled and context is not None:
+        context.query_start = time.monotonic()
+
+
+@event.listens_for(Engine, "after_cursor_execute", named=True)
+def record_query_time(context: Any, statement: str, **_: Any) -> None:
+    """
+    Record the number of queries and their duration, by operation.
+    """
+    start = getattr(context, "query_start", None)
+    if start is not None:
+        del context.query_start
+        elapsed = time.monotonic() - start
+        operation = statement.split(None, 1)[0].upper() if statement else ""
+        metrics.registry.observe(
+            "pkrecv_db_query_duration_seconds", elapsed, operation=operation
+        )
+
+
+def sqlite_options(options: Dict[str, Any]) -> List[str]:
+    """
+    Create PRAGMA statements from the `[sqlite]` configuration.
+    """
+    pragmas = []
+    for name, valid in SQLITE_PRAGMAS:
+        value = options.get(name)
+        if value is None:
+            continue
+
+        if valid is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise DBError("invalid value for {}: {}".format(name, value))
+        else:
+            # configparser treats on/off/0/1 as booleans.
+            if isinstance(value, bool):
+                value = ["off", "0"] if not value else ["on", "1"]
+            else:
+                value = [str(value).lower()]
+            value = next((v for v in value if v in valid), None)
+            if value is None:
+                raise DBError("invalid value for {}".format(name))
+        pragmas.append("PRAGMA {}={}".format(name, value))
+    return pragmas
+
+
+def is_busy(error: OperationalError) -> bool:
+    """
+    Check whether an error is caused by a locked SQLite database.
+    """
+    return isinstance(error.orig, sqlite3.OperationalError) and (
+        "locked" in str(error.orig) or "busy" in str(error.orig)
+    )
+
+
+def retry_busy(f: Callable) -> Callable:
+    """
+    Retry a write that failed because the SQLite database was busy.
+
+    The session is rolled back and the function is called again after
+    an exponentially growing, randomly jittered delay, up to
+    `SQLITE_BUSY_RETRIES` times.
+    """
+
+    @functools.wraps(f)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        retries = current_app.config.get("SQLITE_BUSY_RETRIES", 5)
+        delay = current_app.config.get("SQLITE_BUSY_DELAY", 0.01)
+        attempt = 0
+        while True:
+            try:
+                return f(*args, **kwargs)
+            except OperationalError as e:
+                db.session.rollback()
+                if attempt >= retries or not is_busy(e):
+                    raise
+                time.sleep(random.uniform(0, delay * 2**attempt))
+                attempt += 1
+
+    return wrapper
+
+
+def paginate(
+        stmt: Select,
+        key: Column,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None
+) -> Select:
+    """
+    Select at most `limit` rows ordered by `key`, starting after
+    `after`.
+
+    This is keyset pagination: with an index on `key` every page is a
+    range scan, no matter how deep into the table it is.
+    """
+    if after is not None:
+        stmt = stmt.where(key > after)
+    stmt = stmt.order_by(key)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+def init_db(app: Flask, version: int = 0) -> None:
     """
     Initialize the database.
+
+    A newly created database is recorded as being at schema `version`.
+    Existing databases are left as they are; see `migrate.migrate()`.
+    The URIs in `REPLICAS_URIS` are added as binds for `read_bind()`;
+    their schema is left to replication.
     """
+    sqlite_pragmas[:] = sqlite_options({
+        k[len("SQLITE_"):].lower(): v
+        for k, v in app.config.items() if k.startswith("SQLITE_")
+    })
+
+    try:
+        pool.engine_options(app.config)
+    except ValueError as e:
+        raise DBError(e)
+
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    uris = str(app.config.get("REPLICAS_URIS") or "").replace(",", " ")
+    replica_binds[:] = []
+    for i, uri in enumerate(uris.split()):
+        name = "replica{}".format(i)
+        binds[name] = uri
+        replica_binds.append(name)
+    app.config["SQLALCHEMY_BINDS"] = binds or None
+
     db.init_app(app)
     try:
-        db.create_all()
+        empty = not inspect(db.engine).get_table_names()
+        db.create_all(bind=None)
+        if empty and version:
+            db.engine.execute(
+                SchemaVersion.__table__.insert(),
+                version=version,
+                description="initial schema",
+                applied=datetime.datetime.utcnow(),
+            )
+        query = select([Generation.id]).where(Generation.id == 1)
+        if db.engine.execute(query).first() is None:
+            try:
+                db.engine.execute(
+                    Generation.__table__.insert(), id=1, value=0
+                )
+            except IntegrityError:
+                pass
     except SQLAlchemyError as e:
         raise DBError(e)
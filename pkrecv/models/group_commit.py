@@ -0,0 +1,143 @@
+import threading
+import time
+from typing import Callable, List
+
+from munch import Munch
+
+from .db import db, retry_busy
+
+
+class GroupCommitError(Exception):
+    pass
+
+
+class GroupCommit:
+    """
+    Coalesce concurrent writes into a single transaction.
+
+    The first writer to arrive becomes the leader.  It waits for up to
+    `window` seconds for other writers to queue their work, runs all of
+    it in its own session and commits once.  Every writer is woken up
+    only after that commit has returned, so no write is acknowledged
+    before it is durable.  If the combined transaction fails, each piece
+    of work is retried in a transaction of its own so that the error is
+    reported to the writer that caused it.
+
+    A leader only commits the batch that holds its own work.  Writers
+    that queued in the meantime are committed by the first of them,
+    which becomes the next leader, so no writer is held up by a steady
+    stream of others.
+    """
+
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._pending = []  # type: List[Munch]
+        self._leading = False
+
+    def submit(
+            self, work: Callable[[], None], window: float, size: int
+    ) -> None:
+        """
+        Run `work` as part of the next group commit.
+        """
+        request = Munch(
+            work=work,
+            done=threading.Event(),
+            error=None,
+            committed=False,
+            lead=False,
+        )
+        with self._cond:
+            self._pending.append(request)
+            leader = not self._leading
+            if leader:
+                self._leading = True
+            elif len(self._pending) >= size:
+                self._cond.notify()
+
+        if leader:
+            self._lead(window, size)
+
+        request.done.wait()
+        while request.lead:
+            # The previous leader has handed over before this work was
+            # committed.  Writers that queued during its commit are
+            # committed right away.
+            request.lead = False
+            request.done.clear()
+            self._lead(0, size)
+            request.done.wait()
+
+        if request.error is not None:
+            raise request.error
+
+    def _lead(self, window: float, size: int) -> None:
+        """
+        Commit the next batch and hand over to the first writer left.
+
+        If the leader is interrupted, e.g. by a timeout, the writers in
+        its batch fail with a `GroupCommitError` and the others are
+        still committed by the next leader.
+        """
+        batch = []  # type: List[Munch]
+        try:
+            deadline = time.monotonic() + window
+            with self._cond:
+                try:
+                    while len(self._pending) < size:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                finally:
+                    batch = self._pending[:size]
+                    self._pending = self._pending[size:]
+
+            self._commit(batch)
+        except BaseException:
+            db.session.rollback()
+            for request in batch:
+                if not request.committed and request.error is None:
+                    request.error = GroupCommitError(
+                        "the group commit was interrupted"
+                    )
+            raise
+        finally:
+            for request in batch:
+                request.done.set()
+            self._hand_over()
+
+    def _hand_over(self) -> None:
+        with self._cond:
+            if self._pending:
+                self._pending[0].lead = True
+                self._pending[0].done.set()
+            else:
+                self._leading = False
+
+    @staticmethod
+    def _commit(batch: List[Munch]) -> None:
+        try:
+            commit_all(batch)
+            return
+        except Exception as e:  # pylint: disable=broad-except
+            db.session.rollback()
+            if len(batch) == 1:
+                batch[0].error = e
+                return
+
+        for request in batch:
+            try:
+                commit_all([request])
+            except Exception as e:  # pylint: disable=broad-except
+                db.session.rollback()
+                request.error = e
+
+
+@retry_busy
+def commit_all(batch: List[Munch]) -> None:
+    for request in batch:
+        request.work()
+    db.session.commit()
+    for request in batch:
+        request.committed = True
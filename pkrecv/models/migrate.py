@@ -0,0 +1,194 @@
+import binascii
+import collections
+import datetime
+from typing import Callable, List
+
+from sqlalchemy import (
+    DateTime,
+    Index,
+    bindparam,
+    exists,
+    func,
+    inspect,
+    literal,
+    select,
+)
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import SQLAlchemyError
+
+from .db import DBError, Model, SchemaVersion, db
+from .server import (
+    Server,
+    ServerChange,
+    change_columns,
+    fingerprint,
+    natural_key,
+)
+
+Migration = collections.namedtuple("Migration", "version description apply")
+
+migrations = []  # type: List[Migration]
+
+
+def migration(version: int, description: str) -> Callable:
+    """
+    Register a function as the migration to `version`.
+    """
+
+    def decorator(f: Callable[[Connection], None]) -> Callable:
+        migrations.append(Migration(version, description, f))
+        migrations.sort(key=lambda m: m.version)
+        return f
+
+    return decorator
+
+
+def latest_version() -> int:
+    return migrations[-1].version if migrations else 0
+
+
+def get_version() -> int:
+    """
+    Retrieve the current schema version.
+    """
+    query = db.select([db.func.max(SchemaVersion.version)])
+    return db.engine.execute(query).scalar() or 0
+
+
+def migrate() -> List[Migration]:
+    """
+    Apply all pending migrations and return them.
+
+    Migrations run outside of an explicit transaction so that they can
+    use online DDL (e.g. CREATE INDEX CONCURRENTLY).  They must
+    therefore be idempotent, which lets an interrupted run simply be
+    restarted.
+    """
+    current = get_version()
+    applied = []
+    for m in migrations:
+        if m.version <= current:
+            continue
+
+        try:
+            with db.engine.connect() as connection:
+                m.apply(connection)
+                connection.execute(
+                    SchemaVersion.__table__.insert(),
+                    version=m.version,
+                    description=m.description,
+                    applied=datetime.datetime.utcnow(),
+                )
+        except SQLAlchemyError as e:
+            raise DBError(e)
+        applied.append(m)
+    return applied
+
+
+def create_index(connection: Connection, index: Index) -> None:
+    """
+    Create an index unless it already exists.
+
+    On PostgreSQL the index is built concurrently so that writers
+    aren't blocked while it is created.
+    """
+    table = index.table
+    existing = inspect(connection).get_indexes(table.name)
+    if index.name in [i["name"] for i in existing]:
+        return
+
+    if connection.dialect.name == "postgresql":
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        index.dialect_options["postgresql"]["concurrently"] = True
+        try:
+            index.create(connection)
+        finally:
+            index.dialect_options["postgresql"]["concurrently"] = False
+    else:
+        index.create(connection)
+
+
+def get_index(model: Model, name: str) -> Index:
+    for index in model.__table__.indexes:
+        if index.name == name:
+            return index
+    raise DBError("unknown index {}".format(name))
+
+
+@migration(1, "index server ip, key_type, created and token_id")
+def index_server(connection: Connection) -> None:
+    for name in ["ip", "key_type", "created", "token_id"]:
+        create_index(connection, get_index(Server, "ix_server_" + name))
+
+
+@migration(2, "remove duplicate server keys and make them unique")
+def unique_server_key(connection: Connection) -> None:
+    table = Server.__table__
+    keep = select([func.min(table.c.id)]).group_by(
+        *[table.c[c] for c in natural_key]
+    )
+    connection.execute(table.delete().where(table.c.id.notin_(keep)))
+    create_index(connection, get_index(Server, "uq_server_key"))
+
+
+@migration(3, "add and index server key fingerprints")
+def fingerprint_server(connection: Connection) -> None:
+    table = Server.__table__
+    names = [c["name"] for c in inspect(connection).get_columns(table.name)]
+    if "fingerprint" not in names:
+        connection.execute(
+            "ALTER TABLE server "
+            "ADD COLUMN fingerprint VARCHAR(64) NOT NULL DEFAULT ''"
+        )
+
+    query = select([table.c.id, table.c.key_data]).where(
+        table.c.fingerprint == ""
+    ).order_by(table.c.id).limit(1000)
+    update = table.update().where(table.c.id == bindparam("_id")).values(
+        fingerprint=bindparam("_fingerprint")
+    )
+    last = 0
+    while True:
+        rows = connection.execute(query.where(table.c.id > last)).fetchall()
+        if not rows:
+            break
+        last = rows[-1].id
+
+        params = []
+        for row in rows:
+            try:
+                params.append({
+                    "_id": row.id,
+                    "_fingerprint": fingerprint(row.key_data),
+                })
+            except binascii.Error:
+                continue
+        if params:
+            with connection.begin():
+                connection.execute(update, params)
+
+    create_index(connection, get_index(Server, "ix_server_fingerprint"))
+
+
+@migration(4, "record existing servers in the change log")
+def seed_server_change(connection: Connection) -> None:
+    # The change log may already have entries if the upgraded server
+    # accepted registrations before the migration ran, so only servers
+    # without an entry of their own are recorded.
+    table = Server.__table__
+    changes = ServerChange.__table__
+    logged = exists().where(changes.c.server_id == table.c.id).where(
+        changes.c.action == "insert"
+    )
+    query = select(
+        [literal("insert"), table.c.id]
+        + [table.c[c] for c in change_columns]
+        + [literal(datetime.datetime.utcnow(), DateTime)]
+    ).where(~logged).order_by(table.c.id)
+    with connection.begin():
+        connection.execute(
+            changes.insert().from_select(
+                ["action", "server_id"] + change_columns + ["created"],
+                query
+            )
+        )
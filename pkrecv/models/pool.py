@@ -0,0 +1,160 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Mapping
+
+from munch import Munch
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool, QueuePool, _ConnectionRecord
+
+# Typed settings in the `[pool]` section, and the create_engine()
+# arguments they correspond to.
+POOL_SETTINGS = [
+    ("size", int, "pool_size"),
+    ("max_overflow", int, "max_overflow"),
+    ("timeout", (int, float), "pool_timeout"),
+    ("recycle", int, "pool_recycle"),
+    ("pre_ping", bool, "pool_pre_ping"),
+    ("warmup", int, None),
+]
+
+
+class Stats:
+    """
+    Connection pool counters for this process.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._connections = {}  # type: Dict[int, float]
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._connections.clear()
+            self.connects = 0
+            self.closes = 0
+            self.checkouts = 0
+            self.checkins = 0
+            self.waits = 0
+            self.wait_time = 0.0
+            self.max_wait_time = 0.0
+            self.max_overflow = 0
+
+    def connect(self, record: _ConnectionRecord) -> None:
+        with self._lock:
+            self.connects += 1
+            self._connections[id(record)] = time.monotonic()
+
+    def close(self, record: _ConnectionRecord) -> None:
+        with self._lock:
+            if self._connections.pop(id(record), None) is not None:
+                self.closes += 1
+
+    def checkout(self) -> None:
+        with self._lock:
+            self.checkouts += 1
+
+    def checkin(self) -> None:
+        with self._lock:
+            self.checkins += 1
+
+    def wait(self, seconds: float, overflow: int) -> None:
+        with self._lock:
+            if seconds >= 0.001:
+                self.waits += 1
+            self.wait_time += seconds
+            self.max_wait_time = max(self.max_wait_time, seconds)
+            self.max_overflow = max(self.max_overflow, overflow)
+
+    def as_dict(self) -> Munch:
+        with self._lock:
+            now = time.monotonic()
+            ages = [now - created for created in self._connections.values()]
+            return Munch(
+                pid=os.getpid(),
+                connections=len(ages),
+                connects=self.connects,
+                closes=self.closes,
+                checkouts=self.checkouts,
+                checkins=self.checkins,
+                checked_out=self.checkouts - self.checkins,
+                waits=self.waits,
+                wait_time=self.wait_time,
+                max_wait_time=self.max_wait_time,
+                max_overflow=self.max_overflow,
+                max_connection_age=max(ages) if ages else 0.0,
+            )
+
+
+stats = Stats()
+
+
+class InstrumentedQueuePool(QueuePool):  # type: ignore
+    """
+    A QueuePool that records how long checkouts wait for a connection.
+    """
+
+    def _do_get(self) -> _ConnectionRecord:
+        start = time.monotonic()
+        try:
+            return super()._do_get()
+        finally:
+            stats.wait(time.monotonic() - start, self.overflow())
+
+
+@event.listens_for(Pool, "connect")
+def on_connect(_: Any, record: _ConnectionRecord) -> None:
+    stats.connect(record)
+
+
+@event.listens_for(Pool, "close")
+def on_close(_: Any, record: _ConnectionRecord) -> None:
+    stats.close(record)
+
+
+@event.listens_for(Pool, "checkout")
+def on_checkout(_: Any, __: _ConnectionRecord, ___: Any) -> None:
+    stats.checkout()
+
+
+@event.listens_for(Pool, "checkin")
+def on_checkin(_: Any, __: _ConnectionRecord) -> None:
+    stats.checkin()
+
+
+def engine_options(config: Mapping[str, Any]) -> Dict[str, Any]:
+    """
+    Create create_engine() arguments from the `[pool]` configuration.
+
+    A ValueError is raised if a setting has the wrong type.
+    """
+    options = {}  # type: Dict[str, Any]
+    for name, kind, argument in POOL_SETTINGS:
+        value = config.get("POOL_" + name.upper())
+        if value is None:
+            continue
+        if kind is not bool and isinstance(value, bool):
+            value = str(value)
+        if not isinstance(value, kind):
+            raise ValueError("invalid value for pool {}".format(name))
+        if argument:
+            options[argument] = value
+
+    if "pool_size" in options or "max_overflow" in options:
+        options["poolclass"] = InstrumentedQueuePool
+    return options
+
+
+def warm_up(engine: Engine, count: int) -> None:
+    """
+    Open `count` connections so that the first requests don't have to.
+    """
+    connections = []
+    try:
+        for _ in range(count):
+            connections.append(engine.connect())
+    finally:
+        for connection in connections:
+            connection.close()
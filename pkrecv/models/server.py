@@ -1,27 +1,94 @@
 import base64
 import binascii
+import collections
 import datetime
-from typing import Any, List
+import functools
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
 
-from sqlalchemy import DateTime, ForeignKey, Integer, String
-from sqlalchemy.orm import validates
+from flask import current_app
+from munch import Munch
+from sqlalchemy import (
+    DateTime,
+    ForeignKey,
+    Index,
+    Integer,
+    String,
+    and_,
+    event,
+    literal,
+    or_,
+    select,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, validates
 
-from .db import Model, column, db
+from ..cache import Cache
+from .db import (
+    Model,
+    Serializer,
+    bump_generation,
+    column,
+    commit_generation,
+    db,
+    dialect,
+    get_generation,
+    paginate,
+    retry_busy,
+)
+from .group_commit import GroupCommit
+
+# Rendered known_hosts documents, keyed by the data generation and
+# their filters, so that a write in any process makes them stale.  The
+# TTL only bounds how long unused documents are kept.
+known_hosts = Cache(size=64, ttl=60)
+
+group_commit = GroupCommit()
+
+# Notified whenever a change to the servers is committed in this
+# process, to wake up long-polling requests for the change log.
+changed = threading.Condition()
+
+# Columns that identify a registered key.
+natural_key = ["ip", "port", "key_type", "key_data"]
+
+# Columns that are set when a key is registered.
+columns = natural_key + ["key_comment", "fingerprint", "token_id"]
 
 
 class ServerError(Exception):
     pass
 
 
+class ServerBatchError(ServerError):
+    def __init__(self, errors: List[Optional[str]]) -> None:
+        super().__init__("invalid public keys")
+        self.errors = errors
+
+
 class Server(Model):
+    __table_args__ = (
+        Index("uq_server_key", *natural_key, unique=True),
+        # Covers both fingerprint lookups and the search for keys that
+        # are shared by several hosts.
+        Index("ix_server_fingerprint", "fingerprint", "ip"),
+    )
+
     id = column(Integer, primary_key=True)
-    ip = column(String(45))  # http://www.ipuptime.net/ipv4mapped.aspx
+    # http://www.ipuptime.net/ipv4mapped.aspx
+    ip = column(String(45), index=True)
     port = column(Integer, default=22)
-    key_type = column(String(32))
+    key_type = column(String(32), index=True)
     key_data = column(String(4096))
     key_comment = column(String(4096))
-    created = column(DateTime, default=datetime.datetime.utcnow)
-    token_id = column(Integer, ForeignKey("token.id"))
+    fingerprint = column(String(64))
+    created = column(DateTime, default=datetime.datetime.utcnow, index=True)
+    token_id = column(Integer, ForeignKey("token.id"), index=True)
 
     # pylint: disable=no-self-use
     @validates("key_type")
@@ -50,17 +117,332 @@ class Server(Model):
     # pylint: enable=no-self-use
 
 
-def get_servers(**filters: Any) -> List[Server]:
+class ServerChange(Model):
+    """
+    An insert or delete of a server, numbered by `seq`.
+    """
+
+    __tablename__ = "server_change"
+
+    seq = column(Integer, primary_key=True)
+    action = column(String(16))
+    server_id = column(Integer)
+    ip = column(String(45))
+    port = column(Integer)
+    key_type = column(String(32))
+    key_data = column(String(4096))
+    key_comment = column(String(4096))
+    fingerprint = column(String(64))
+    created = column(DateTime, default=datetime.datetime.utcnow)
+
+
+# Columns that are copied to the change log.
+change_columns = [
+    "ip", "port", "key_type", "key_data", "key_comment", "fingerprint"
+]
+
+serializer = Serializer(Server)
+change_serializer = Serializer(ServerChange)
+
+
+def get_servers(
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+        **filters: Any
+) -> List[Server]:
     """
     Retrieve a list of servers.
+
+    At most `limit` servers with an id greater than `after` are
+    returned.
     """
-    return [s.as_dict for s in Server.query.filter_by(**filters).all()]
+    stmt = serializer.select(**filters)
+    return serializer.all(paginate(stmt, Server.id, limit, after))
 
 
+@retry_busy
 def add_server(ip: str, port: int, public_key: str, token_id: int) -> None:
     """
     Add a server.
     """
+    commit_servers([new_server(ip, port, public_key, token_id)])
+    known_hosts.invalidate()
+
+
+@retry_busy
+def add_servers(
+        ip: str, port: int, public_keys: List[str], token_id: int
+) -> None:
+    """
+    Add several keys for a server in a single transaction.
+
+    Every key is validated before anything is inserted.  If any of them
+    is invalid, nothing is added and a `ServerBatchError` is raised with
+    one error message (or None) per key.
+    """
+    servers = []
+    errors = []  # type: List[Optional[str]]
+    for public_key in public_keys:
+        try:
+            servers.append(new_server(ip, port, public_key, token_id))
+            errors.append(None)
+        except ServerError as e:
+            errors.append(str(e))
+
+    if any(errors):
+        raise ServerBatchError(errors)
+
+    commit_servers(servers)
+    known_hosts.invalidate()
+
+
+def commit_servers(servers: List[Server]) -> None:
+    """
+    Insert and commit servers.
+
+    If `GROUP_COMMIT_WINDOW` is set, the insert is coalesced with those
+    of concurrent requests that arrive within that many milliseconds.
+    """
+    window = current_app.config.get("GROUP_COMMIT_WINDOW")
+    if window:
+        group_commit.submit(
+            functools.partial(insert_servers, servers),
+            window / 1000,
+            current_app.config.get("GROUP_COMMIT_SIZE", 64),
+        )
+    else:
+        insert_servers(servers)
+        db.session.commit()
+
+
+def insert_servers(servers: List[Server]) -> None:
+    """
+    Insert servers, skipping those whose key is already registered.
+
+    Re-registering a key is thus a no-op rather than a duplicate row.
+    The caller is responsible for committing.
+    """
+    insert_rows([{c: getattr(s, c) for c in columns} for s in servers])
+
+
+def insert_rows(rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert validated rows of `columns`, skipping registered keys.
+
+    Inserted rows are recorded in the change log.  The generation is
+    only incremented if a row was actually inserted.  The number of
+    inserted rows is returned.
+    """
+    rows = unique_rows(rows)
+    if not rows:
+        return 0
+
+    name = dialect()
+    if name == "postgresql":
+        ids = insert_returning(rows)
+    elif name == "sqlite":
+        ids = insert_ignore(rows)
+    else:
+        ids = insert_unregistered(rows)
+    if ids:
+        log_change("insert", id_ranges(ids))
+        bump_generation()
+    return len(ids)
+
+
+def insert_returning(
+        rows: List[Dict[str, Any]], batch_size: int = 1000
+) -> List[int]:
+    """
+    Insert rows in PostgreSQL and return the ids of those that were not
+    already registered.
+    """
+    table = Server.__table__
+    ids = []  # type: List[int]
+    for i in range(0, len(rows), batch_size):
+        stmt = postgresql.insert(table).values(
+            rows[i:i + batch_size]
+        ).on_conflict_do_nothing(index_elements=natural_key).returning(
+            table.c.id
+        )
+        ids.extend(r for r, in db.session.execute(stmt))
+    return ids
+
+
+def insert_ignore(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert rows in SQLite and return the ids of those that were not
+    already registered.
+
+    SQLite has a single writer, and a row that is ignored doesn't use up
+    an id, so the inserted rows are numbered consecutively up to the
+    last inserted rowid.
+    """
+    stmt = Server.__table__.insert().prefix_with("OR IGNORE")
+    inserted = db.session.execute(stmt, rows).rowcount
+    if not inserted:
+        return []
+    last = db.session.execute(select([db.func.last_insert_rowid()])).scalar()
+    return list(range(last - inserted + 1, last + 1))
+
+
+def insert_unregistered(rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert rows whose key isn't registered and return their ids.
+
+    Another transaction may register one of the keys between the check
+    and the insert.  The insert is then retried a row at a time, each
+    in a savepoint of its own, skipping rows that violate the unique
+    index.
+    """
+    registered = registered_keys(rows)
+    rows = [row for row in rows if key_of(row) not in registered]
+    if not rows:
+        return []
+
+    stmt = Server.__table__.insert()
+    try:
+        with db.session.begin_nested():
+            db.session.execute(stmt, rows)
+    except IntegrityError:
+        inserted = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(stmt, row)
+                inserted.append(row)
+            except IntegrityError:
+                pass
+        rows = inserted
+    return list(registered_keys(rows).values())
+
+
+def key_of(row: Dict[str, Any]) -> Tuple:
+    return tuple(row[c] for c in natural_key)
+
+
+def unique_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Drop rows whose key is repeated, keeping the first one.
+    """
+    seen = set()  # type: Set[Tuple]
+    unique = []
+    for row in rows:
+        key = key_of(row)
+        if key not in seen:
+            seen.add(key)
+            unique.append(row)
+    return unique
+
+
+def registered_keys(
+        rows: List[Dict[str, Any]], batch_size: int = 500
+) -> Dict[Tuple, int]:
+    """
+    Retrieve the ids of the keys of `rows` that are already registered.
+
+    Keys are looked up `batch_size` at a time, to keep the statements
+    within the limits of the database.
+    """
+    table = Server.__table__
+    registered = {}  # type: Dict[Tuple, int]
+    for i in range(0, len(rows), batch_size):
+        query = select(
+            [table.c[c] for c in natural_key] + [table.c.id]
+        ).where(
+            or_(
+                *[
+                    and_(*[table.c[c] == row[c] for c in natural_key])
+                    for row in rows[i:i + batch_size]
+                ]
+            )
+        )
+        registered.update(
+            (tuple(r[:-1]), r[-1]) for r in db.session.execute(query)
+        )
+    return registered
+
+
+def id_ranges(ids: List[int]) -> List[Tuple[int, int]]:
+    """
+    Collapse ids into inclusive ranges of consecutive ids.
+    """
+    ranges = []  # type: List[Tuple[int, int]]
+    for i in sorted(ids):
+        if ranges and ranges[-1][1] == i - 1:
+            ranges[-1] = (ranges[-1][0], i)
+        else:
+            ranges.append((i, i))
+    return ranges
+
+
+def log_change(action: str, change: Any) -> None:
+    """
+    Record a change to be written to the change log on commit.
+
+    Inserts are recorded as ranges of server ids and deletes as the
+    values of the deleted server.
+    """
+    db.session.info.setdefault("server_changes", []).append((action, change))
+
+
+def log_inserts(ranges: List[Tuple[int, int]], batch_size: int = 500) -> None:
+    """
+    Record the servers with an id in `ranges` as inserted.
+    """
+    table = Server.__table__
+    for i in range(0, len(ranges), batch_size):
+        query = select(
+            [literal("insert"), table.c.id]
+            + [table.c[c] for c in change_columns]
+            + [literal(datetime.datetime.utcnow(), DateTime)]
+        ).where(
+            or_(
+                *[
+                    table.c.id.between(first, last)
+                    for first, last in ranges[i:i + batch_size]
+                ]
+            )
+        ).order_by(table.c.id)
+        db.session.execute(
+            ServerChange.__table__.insert().from_select(
+                ["action", "server_id"] + change_columns + ["created"], query
+            )
+        )
+
+
+@event.listens_for(Session, "before_commit")
+def write_changes(session: Session) -> None:
+    """
+    Write the changes recorded by `log_change()` to the change log.
+
+    The generation is incremented first.  This serializes the writers
+    from here until they have committed, so the changes are numbered
+    in the order in which they are committed and a reader that has
+    seen one sequence number never misses a smaller one.
+    """
+    changes = session.info.get("server_changes")
+    if not changes or session.transaction.nested:
+        return
+
+    commit_generation(session)
+    for action, change in changes:
+        if action == "insert":
+            log_inserts(change)
+        else:
+            session.execute(ServerChange.__table__.insert(), change)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def discard_changes(session: Session, previous: Any) -> None:
+    if previous.parent is None:
+        session.info.pop("server_changes", None)
+
+
+def new_server(ip: str, port: int, public_key: str, token_id: int) -> Server:
+    """
+    Create a validated, but not yet added, server.
+    """
     key_type, key_data, key_comment = split_key(public_key)
     server = Server(
         ip=ip,
@@ -70,16 +452,172 @@ def add_server(ip: str, port: int, public_key: str, token_id: int) -> None:
         key_comment=key_comment,
         token_id=token_id,
     )
-    db.session.add(server)
-    db.session.commit()
+    server.fingerprint = fingerprint(key_data)
+    return server
+
+
+def fingerprint(key_data: str) -> str:
+    """
+    Compute the OpenSSH SHA256 fingerprint of base64-encoded key data.
+    """
+    digest = hashlib.sha256(base64.b64decode(key_data)).digest()
+    return "SHA256:" + base64.b64encode(digest).decode("ascii").rstrip("=")
+
 
+def get_shared_fingerprints(limit: Optional[int] = None) -> List[Munch]:
+    """
+    Retrieve fingerprints that are registered for more than one ip.
+
+    Both queries are answered from the `ix_server_fingerprint` index.
+    """
+    ips = db.func.count(db.distinct(Server.ip))
+    # Keys whose data could not be decoded when fingerprints were
+    # backfilled are left with an empty fingerprint.
+    query = db.session.query(Server.fingerprint).filter(
+        Server.fingerprint != ""
+    ).group_by(
+        Server.fingerprint
+    ).having(ips > 1).order_by(Server.fingerprint)
+    if limit:
+        query = query.limit(limit)
+
+    fingerprints = [f for f, in query]
+    if not fingerprints:
+        return []
+
+    shared = collections.OrderedDict(
+        (f, []) for f in fingerprints
+    )  # type: Dict[str, List[str]]
+    query = db.session.query(Server.fingerprint, Server.ip).filter(
+        Server.fingerprint.in_(fingerprints)
+    ).distinct().order_by(Server.fingerprint, Server.ip)
+    for f, ip in query:
+        shared[f].append(ip)
+    return [Munch(fingerprint=f, ips=ips) for f, ips in shared.items()]
 
+
+@retry_busy
 def delete_server(identifier: int) -> None:
     server = Server.query.filter_by(id=identifier).all()
     if len(server) != 1:
         raise ServerError("invalid server id {}".format(identifier))
+    change = {c: getattr(server[0], c) for c in change_columns}
+    change.update(
+        action="delete",
+        server_id=server[0].id,
+        created=datetime.datetime.utcnow(),
+    )
     db.session.delete(server[0])
+    log_change("delete", change)
+    bump_generation()
     db.session.commit()
+    known_hosts.invalidate()
+
+
+def get_changes(
+        since: int,
+        limit: Optional[int] = None,
+        wait: float = 0,
+        interval: float = 1
+) -> List[Munch]:
+    """
+    Retrieve changes with a sequence number greater than `since`.
+
+    If there are none, wait for up to `wait` seconds for them to arrive.
+    Changes committed by this process are noticed immediately; those
+    committed by other processes within `interval` seconds.  The
+    session is released while waiting, so a long-polling request
+    doesn't hold on to a pooled connection.
+    """
+    stmt = change_serializer.select().where(
+        ServerChange.seq > since
+    ).order_by(ServerChange.seq)
+    if limit:
+        stmt = stmt.limit(limit)
+
+    deadline = time.monotonic() + wait
+    while True:
+        changes = change_serializer.all(stmt)
+        remaining = deadline - time.monotonic()
+        if changes or remaining <= 0:
+            return changes
+
+        db.session.rollback()
+        with changed:
+            changed.wait(min(interval, remaining))
+
+
+@event.listens_for(Session, "after_commit")
+def notify_changes(session: Session) -> None:
+    if session.info.pop("server_changes", None):
+        with changed:
+            changed.notify_all()
+
+
+def get_known_hosts(**filters: Any) -> str:
+    """
+    Retrieve servers in the ssh_known_hosts format.
+
+    A document is only rendered again once the data has changed.
+    """
+    key = (get_generation(), tuple(sorted(filters.items())))
+    generation = known_hosts.generation
+    text = known_hosts.get(key)
+    if text is None:
+        text = render_known_hosts(**filters)
+        known_hosts.set(key, text, generation=generation)
+    return text
+
+
+def export_known_hosts(path: str) -> None:
+    """
+    Materialize all servers in the ssh_known_hosts format to `path`.
+
+    The file is only rewritten when the cached rendering is stale, and
+    it is replaced atomically so that readers never see a partial file.
+    """
+    key = (get_generation(), "file", path)
+    generation = known_hosts.generation
+    if known_hosts.get(key):
+        return
+
+    text = render_known_hosts()
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+        os.replace(tmp, path)
+    except OSError as e:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise ServerError(e)
+    known_hosts.set(key, True, generation=generation)
+
+
+def render_known_hosts(**filters: Any) -> str:
+    """
+    Render servers in the ssh_known_hosts format.
+
+    Only the necessary columns are selected, so no ORM objects are
+    created.
+    """
+    query = db.session.query(
+        Server.ip,
+        Server.port,
+        Server.key_type,
+        Server.key_data,
+        Server.key_comment,
+    ).filter_by(**filters).order_by(Server.id)
+
+    return "".join(known_hosts_line(*row) for row in query)
+
+
+def known_hosts_line(
+        ip: str, port: int, key_type: str, key_data: str, key_comment: str
+) -> str:
+    host = ip if port == 22 else "[{}]:{}".format(ip, port)
+    line = "{} {} {} {}".format(host, key_type, key_data, key_comment)
+    return line.rstrip() + "\n"
 
 
 def split_key(public_key: str) -> List[str]:
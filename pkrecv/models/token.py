@@ -2,13 +2,32 @@ import binascii
 import datetime
 import hashlib
 import os
-from typing import Any, List
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
+from itsdangerous import BadData, URLSafeSerializer
 from munch import Munch
-from sqlalchemy import DateTime, Integer, String
+from sqlalchemy import DateTime, Integer, String, select
 from sqlalchemy.orm import validates
 
-from .db import Model, column, db
+from ..cache import Cache
+from .db import (
+    Model,
+    Serializer,
+    bump_generation,
+    column,
+    db,
+    get_generation,
+    paginate,
+    retry_busy,
+)
+
+# Verified token hashes are mapped to their row in `cache`.  Unknown
+# hashes are remembered for a shorter time in `negative_cache`, in a
+# separate LRU so that a flood of bad tokens can't evict valid ones.
+cache = Cache(size=1024, ttl=30)
+negative_cache = Cache(size=1024, ttl=5)
 
 
 class TokenError(Exception):
@@ -39,36 +58,269 @@ class Token(Model):
         return self._to_dict(["token"])
 
 
-def get_tokens(**filters: Any) -> List[Token]:
+serializer = Serializer(Token, ["token"])
+
+
+class SignedTokens:
+    """
+    Verify tokens that are signed with a server secret.
+
+    A signed token carries its id and role, so a forged token is
+    rejected without touching the database.  To support revocation,
+    the id, role and SHA256 digest of every token is kept in memory; a
+    signed token is only valid while its row exists with the same
+    digest, since the id of a deleted token may be reused.
+
+    Every `interval` seconds the data generation is checked, and only
+    if it has changed are the tokens from the highest known id upwards
+    read.  All of them are read again only if a known token turns out
+    to have been deleted or replaced.
+
+    A correctly signed token that isn't known, with an id from the
+    highest known one upwards, may have been added by another process
+    since the last check, so it triggers a check at most once every
+    `miss_interval` seconds.  Tokens with a lower id have been deleted.
+    """
+
+    salt = "pkrecv-token"
+
+    def __init__(self) -> None:
+        self.secret = None  # type: Optional[str]
+        self.interval = 30.0
+        self.miss_interval = 5.0
+        self._serializer = None  # type: Optional[URLSafeSerializer]
+        self._tokens = {}  # type: Dict[int, Tuple[bytes, str]]
+        self._last = 0
+        self._seen = None  # type: Optional[int]
+        self._loaded = None  # type: Optional[float]
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def configure(
+            self,
+            secret: Optional[str],
+            interval: float,
+            miss_interval: float = 5.0
+    ) -> None:
+        with self._lock:
+            self.secret = secret
+            self.interval = interval
+            self.miss_interval = miss_interval
+            self._serializer = None
+            if secret:
+                self._serializer = URLSafeSerializer(secret, self.salt)
+            self._tokens = {}
+            self._last = 0
+            self._seen = None
+            self._loaded = None
+            self._generation += 1
+
+    def dumps(self, identifier: int, role: str) -> str:
+        """
+        Sign the id and role of a token.
+
+        A nonce is included so that a token never has the same value as
+        a deleted token with the same id.
+        """
+        if self._serializer is None:
+            raise TokenError("no token secret is configured")
+        nonce = generate_token(8).decode("ascii")
+        return self._serializer.dumps([identifier, role, nonce])
+
+    def loads(self, token: str) -> Optional[Munch]:
+        """
+        Retrieve the id and role of a signed token, if it is valid.
+        """
+        if self._serializer is None:
+            return None
+
+        try:
+            identifier, role, _ = self._serializer.loads(token)
+        except (BadData, TypeError, ValueError):
+            return None
+
+        digest = hashlib.sha256(bytes(token, "utf-8")).digest()
+        entry = self._load(self.interval).get(identifier)
+        if entry != (digest, role) and identifier >= self._last:
+            entry = self._load(self.miss_interval).get(identifier)
+        if entry != (digest, role):
+            return None
+        return Munch(id=identifier, role=role)
+
+    def invalidate(self) -> None:
+        """
+        Check for changes on the next lookup.
+        """
+        with self._lock:
+            self._seen = None
+            self._loaded = None
+            self._generation += 1
+
+    def _load(self, interval: float) -> Dict[int, Tuple[bytes, str]]:
+        """
+        Retrieve the tokens, checking for changes if they are older than
+        `interval` seconds.
+
+        The tokens are read without holding the lock.  Once they have
+        been loaded, other threads keep using them until a reload has
+        finished, so only one thread queries the database at a time.
+        """
+        with self._lock:
+            now = time.monotonic()
+            loaded = self._loaded
+            if loaded is not None and now - loaded < interval:
+                return self._tokens
+            if loaded is not None:
+                self._loaded = now
+            generation = self._generation
+            tokens = self._tokens
+            seen = self._seen
+
+        try:
+            current = get_generation()
+            if current != seen:
+                tokens = self._read(tokens)
+        except BaseException:
+            with self._lock:
+                if self._generation == generation:
+                    self._loaded = loaded
+            raise
+
+        with self._lock:
+            # Tokens that were read before an invalidation may be stale.
+            if self._generation == generation:
+                self._tokens = tokens
+                self._last = max(tokens, default=0)
+                self._seen = current
+                self._loaded = now
+        return tokens
+
+    @staticmethod
+    def _read(
+            tokens: Dict[int, Tuple[bytes, str]]
+    ) -> Dict[int, Tuple[bytes, str]]:
+        """
+        Read the tokens that may have changed since `tokens` was read.
+
+        Ids are assigned in increasing order, so new tokens have an id
+        above the highest known one, unless that one was deleted and its
+        id reused.  The highest known token is thus read again along
+        with the new ones, and the known ids are counted to tell whether
+        any of them were deleted.
+        """
+        query = select([Token.id, Token.token, Token.role])
+        last = max(tokens, default=None)
+        if last is not None:
+            rows = db.session.execute(query.where(Token.id >= last))
+            changed = {
+                i: (bytes.fromhex(digest), role) for i, digest, role in rows
+            }
+            count = db.session.execute(
+                select([db.func.count()]).where(Token.id <= last)
+            ).scalar()
+            if count == len(tokens) and changed.get(last) == tokens[last]:
+                tokens = dict(tokens)
+                tokens.update(changed)
+                return tokens
+
+        return {
+            i: (bytes.fromhex(digest), role)
+            for i, digest, role in db.session.execute(query)
+        }
+
+
+signed_tokens = SignedTokens()
+
+
+def get_tokens(
+        limit: Optional[int] = None,
+        after: Optional[int] = None,
+        **filters: Any
+) -> List[Token]:
     """
     Retrieve a list of tokens.
+
+    At most `limit` tokens with an id greater than `after` are returned.
     """
     token = filters.get("token")
     if token:
         filters["token"] = sha256(bytes(token, "utf-8"))
-    return [t.as_dict for t in Token.query.filter_by(**filters).all()]
+    stmt = serializer.select(**filters)
+    return serializer.all(paginate(stmt, Token.id, limit, after))
+
 
+def lookup_token(token: str) -> Optional[Munch]:
+    """
+    Retrieve a token by its plaintext value.
 
-def add_token(role: str, description: str) -> str:
+    Both hits and misses are cached, so revocation only takes effect in
+    other processes once the cache TTL has expired.  Signed tokens are
+    verified by `signed_tokens` instead, which only retrieves their id
+    and role.
+    """
+    if "." in token:
+        return signed_tokens.loads(token)
+
+    key = sha256(bytes(token, "utf-8"))
+    t = cache.get(key)
+    if t is not None:
+        return t
+    if negative_cache.get(key):
+        return None
+
+    generations = cache.generation, negative_cache.generation
+    tokens = serializer.all(serializer.select(token=key))
+    if len(tokens) == 1:
+        cache.set(key, tokens[0], generation=generations[0])
+        return tokens[0]
+    negative_cache.set(key, True, generation=generations[1])
+    return None
+
+
+def invalidate_cache() -> None:
+    """
+    Invalidate the token caches in this process.
+    """
+    cache.invalidate()
+    negative_cache.invalidate()
+    signed_tokens.invalidate()
+
+
+@retry_busy
+def add_token(role: str, description: str, signed: bool = False) -> str:
     """
     Add a token to the database.
+
+    A signed token can be verified without a query, but requires a
+    token secret.
     """
-    token = generate_token(32)
+    if signed and not signed_tokens.secret:
+        raise TokenError("no token secret is configured")
 
-    db.session.add(
-        Token(token=sha256(token), role=role, description=description)
-    )
+    token = generate_token(32)
+    t = Token(token=sha256(token), role=role, description=description)
+    db.session.add(t)
+    if signed:
+        # The id is only known once the row is flushed.
+        db.session.flush()
+        token = bytes(signed_tokens.dumps(t.id, role), "ascii")
+        t.token = sha256(token)
+    bump_generation()
     db.session.commit()
+    invalidate_cache()
 
     return token.decode("ascii")
 
 
+@retry_busy
 def delete_token(identifier: int) -> None:
     token = Token.query.filter_by(id=identifier).all()
     if len(token) != 1:
         raise TokenError("invalid token id {}".format(identifier))
     db.session.delete(token[0])
+    bump_generation()
     db.session.commit()
+    invalidate_cache()
 
 
 def generate_token(size: int) -> bytes:
@@ -0,0 +1,107 @@
+import cProfile
+import glob
+import io
+import os
+import pstats
+import re
+import tempfile
+import time
+from typing import List, Optional
+
+# Profiles are named `<time>-<pid>-<endpoint>-<duration>ms.prof`, so
+# that they sort in the order they were written.
+PROFILE_NAME = "{:.6f}-{}-{}-{}ms.prof"
+PROFILE_RE = re.compile(r"^[0-9.]+-[0-9]+-(.+)-([0-9]+)ms\.prof$")
+
+SORT_KEYS = ["cumulative", "tottime", "ncalls", "filename", "name"]
+
+
+class ProfilingError(Exception):
+    pass
+
+
+def save(
+        profiler: cProfile.Profile,
+        directory: str,
+        endpoint: str,
+        duration: float,
+        max_files: int
+) -> str:
+    """
+    Write the statistics of a profiled request.
+
+    The oldest profiles are removed once there are more than
+    `max_files` in `directory`.
+    """
+    name = PROFILE_NAME.format(
+        time.time(), os.getpid(), re.sub(r"[^\w.]", "_", endpoint),
+        int(duration * 1000)
+    )
+    path = os.path.join(directory, name)
+
+    # Write atomically, so that a report never reads a partial file.
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    try:
+        profiler.dump_stats(tmp)
+        os.replace(tmp, path)
+    except OSError:
+        os.remove(tmp)
+        raise
+
+    paths = profiles(directory)
+    for old in paths[:max(len(paths) - max_files, 0)]:
+        try:
+            os.remove(old)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def profiles(directory: str, endpoint: Optional[str] = None) -> List[str]:
+    """
+    Retrieve the paths of the profiles in `directory`, oldest first.
+    """
+    paths = []
+    for path in sorted(glob.glob(os.path.join(directory, "*.prof"))):
+        m = PROFILE_RE.match(os.path.basename(path))
+        if m and (endpoint is None or m.group(1) == endpoint):
+            paths.append(path)
+    return paths
+
+
+def report(
+        directory: str,
+        top: int = 20,
+        sort: str = "cumulative",
+        endpoint: Optional[str] = None
+) -> str:
+    """
+    Aggregate the profiles in `directory` into a report of the `top`
+    functions.
+    """
+    if sort not in SORT_KEYS:
+        raise ProfilingError("invalid sort key {}".format(sort))
+
+    paths = profiles(directory, endpoint)
+    if not paths:
+        raise ProfilingError("no profiles in {}".format(directory))
+
+    durations = []
+    for path in paths:
+        m = PROFILE_RE.match(os.path.basename(path))
+        durations.append(int(m.group(2)))
+
+    output = io.StringIO()
+    output.write(
+        "{} profiles, {}ms mean, {}ms max\n".format(
+            len(paths), sum(durations) // len(durations), max(durations)
+        )
+    )
+
+    try:
+        stats = pstats.Stats(*paths, stream=output)
+    except (OSError, TypeError, EOFError, ValueError) as e:
+        raise ProfilingError(e)
+    stats.sort_stats(sort).print_stats(top)
+    return output.getvalue()
@@ -0,0 +1,141 @@
+import collections
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .shared import SharedTable
+
+# A bucket is stored in a slot as its key, the number of available
+# tokens and the time at which that number was computed.
+SLOT = struct.Struct("<qdd")
+
+Limit = collections.namedtuple("Limit", "rate burst")
+
+
+class RateLimiter:
+    """
+    Token buckets for all processes serving the application.
+
+    Every token is limited by the bucket for its id, and optionally by a
+    bucket shared by all tokens with its role.  The buckets live in a
+    memory-mapped file that is created before gunicorn forks its
+    workers, so that the limits hold no matter which worker serves a
+    request.
+    """
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self.path = None  # type: Optional[str]
+        self.limits = {}  # type: Dict[str, Limit]
+        self.role_limits = {}  # type: Dict[str, Limit]
+        self._table = SharedTable(SLOT)
+        self._lock = threading.Lock()
+
+    def configure(
+            self,
+            enabled: bool,
+            limits: Dict[str, Limit],
+            role_limits: Dict[str, Limit],
+            path: Optional[str] = None,
+            slots: int = 4096
+    ) -> None:
+        """
+        Enable or disable rate limiting.
+
+        `limits` apply to each token with a role, and `role_limits` to
+        all tokens with a role together.  Buckets from earlier runs are
+        cleared, and an unlinked temporary file is used if no `path` is
+        given.
+        """
+        with self._lock:
+            self._table.close()
+            self.enabled = enabled and bool(limits or role_limits)
+            self.limits = limits
+            self.role_limits = role_limits
+            self.path = None
+            if not self.enabled:
+                return
+
+            self._table.open(slots, "pkrecv-ratelimit-", path)
+            self.path = path
+
+    def check(self, token_id: int, role: str) -> float:
+        """
+        Take a token from the buckets of a token and its role.
+
+        Nothing is taken unless every bucket has a token to spare, in
+        which case 0 is returned.  Otherwise, the number of seconds
+        until the request may be retried is returned.
+        """
+        if not self.enabled:
+            return 0
+
+        buckets = []  # type: List[Tuple[int, Limit]]
+        if role in self.limits:
+            buckets.append((token_id, self.limits[role]))
+        if role in self.role_limits:
+            index = sorted(self.role_limits).index(role)
+            buckets.append((-index - 1, self.role_limits[role]))
+        if not buckets:
+            return 0
+
+        with self._table.locked():
+            now = time.monotonic()
+            states = []
+            wait = 0.0
+            for key, limit in buckets:
+                offset, available = self._read(key, limit, now)
+                if available < 1:
+                    if limit.rate <= 0:
+                        wait = max(wait, 1.0)
+                    else:
+                        wait = max(wait, (1 - available) / limit.rate)
+                states.append((key, offset, available))
+
+            if wait == 0:
+                for key, offset, available in states:
+                    self._table.write(offset, key, available - 1, now)
+            return wait
+
+    def _read(self, key: int, limit: Limit, now: float) -> Tuple[int, float]:
+        """
+        Find the slot of a bucket and its refilled number of tokens.
+
+        Evicting a bucket resets it, which errs on the side of letting
+        requests through.
+        """
+        offset, values = self._table.find(key)
+        if values is None:
+            return offset, limit.burst
+        _, available, updated = values
+        available += (now - updated) * limit.rate
+        return offset, min(available, limit.burst)
+
+
+def parse_limits(
+        config: Dict,
+        roles: List[str]
+) -> Tuple[Dict[str, Limit], Dict[str, Limit]]:
+    """
+    Read the per-token and per-role limits of `roles` from flask config.
+
+    For a role such as `server`, `RATELIMIT_SERVER_RATE` is the number
+    of requests per second for each token, and `RATELIMIT_SERVER_BURST`
+    the number of requests that may be made at once.  The corresponding
+    `RATELIMIT_SERVER_TOTAL_*` options limit all tokens with the role.
+    """
+    limits = {}
+    role_limits = {}
+    for role in roles:
+        for prefix, result in [("", limits), ("TOTAL_", role_limits)]:
+            name = "RATELIMIT_{}_{}".format(role.upper(), prefix)
+            rate = config.get(name + "RATE")
+            if rate is None:
+                continue
+            burst = config.get(name + "BURST", max(rate, 1))
+            result[role] = Limit(float(rate), float(burst))
+    return limits, role_limits
+
+
+limiter = RateLimiter()
@@ -0,0 +1,99 @@
+import contextlib
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+import threading
+from typing import Iterator, Optional, Tuple
+
+# Number of slots to probe for a key before evicting the least recently
+# updated one.
+PROBES = 16
+
+
+class SharedTable:
+    """
+    A hash table of fixed-size slots for all processes serving the
+    application.
+
+    The slots live in a memory-mapped file that is created before
+    gunicorn forks its workers, so that every worker sees the same
+    table.  A slot is packed with `slot`, whose first field is its key
+    and whose last field is the time at which it was updated.  Key 0
+    marks an unused slot.  Access is serialized with `locked()`.
+    """
+
+    def __init__(self, slot: struct.Struct) -> None:
+        self.slot = slot
+        self.slots = 0
+        self._file = None  # type: Optional[int]
+        self._map = None  # type: Optional[mmap.mmap]
+        self._lock = threading.Lock()
+
+    def open(
+            self, slots: int, prefix: str, path: Optional[str] = None
+    ) -> None:
+        """
+        Create an empty table of `slots` slots.
+
+        An unlinked temporary file is used if no `path` is given.
+        """
+        self.close()
+        if path:
+            self._file = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        else:
+            # Workers inherit the descriptor and the shared mapping when
+            # they are forked, so the file isn't needed once it has been
+            # opened.
+            self._file, tmp = tempfile.mkstemp(prefix=prefix)
+            os.remove(tmp)
+        os.ftruncate(self._file, 0)
+        os.ftruncate(self._file, self.slot.size * slots)
+        self._map = mmap.mmap(self._file, self.slot.size * slots)
+        self.slots = slots
+
+    def close(self) -> None:
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            os.close(self._file)
+            self._file = None
+
+    @contextlib.contextmanager
+    def locked(self, shared: bool = False) -> Iterator[None]:
+        """
+        Lock the table for the threads of this process and for other
+        processes.  A `shared` lock only excludes writers.
+        """
+        with self._lock:
+            fcntl.lockf(self._file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._file, fcntl.LOCK_UN)
+
+    def find(self, key: int) -> Tuple[int, Optional[Tuple]]:
+        """
+        Find the slot of a key and its values.
+
+        If the key isn't in the table, the offset of an unused slot or
+        of the least recently updated one is returned with no values.
+        """
+        size = self.slot.size
+        start = key % self.slots
+        oldest = (start * size, float("inf"))
+        for i in range(PROBES):
+            offset = ((start + i) % self.slots) * size
+            values = self.slot.unpack_from(self._map, offset)
+            if values[0] == key:
+                return offset, values
+            if values[0] == 0:
+                return offset, None
+            if values[-1] < oldest[1]:
+                oldest = (offset, values[-1])
+        return oldest[0], None
+
+    def write(self, offset: int, *values: float) -> None:
+        self.slot.pack_into(self._map, offset, *values)
@@ -1,11 +1,28 @@
+import gc
 from argparse import ArgumentParser
-from typing import Dict, List
+from typing import Any, Dict, List
 
 from flask import Flask
 from gunicorn.app.base import BaseApplication
 
+from . import metrics
+from .models import pool
+from .models.db import db
+
+# Seconds that a long-poll leaves of the timeout of a sync worker.
+WAIT_MARGIN = 5
+
 
 class Gunicorn(BaseApplication):  # type: ignore
+    """
+    Serve the application with gunicorn.
+
+    With `preload_app`, the application is loaded once in the arbiter
+    and shared with the workers through copy-on-write memory.  Pooled
+    connections are never shared: the arbiter closes its connections
+    before every fork, and each worker starts with a pool of its own.
+    """
+
     def __init__(self, app: Flask, options: Dict) -> None:
         self.app = app
         self.options = options
@@ -15,8 +32,80 @@ class Gunicorn(BaseApplication):  # type: ignore
         pass
 
     def load_config(self) -> None:
+        self.cfg.set("pre_fork", self.pre_fork)
+        self.cfg.set("post_fork", self.post_fork)
+        self.cfg.set("worker_exit", worker_exit)
+        self.cfg.set("on_exit", on_exit)
         for key, value in self.options.items():
             self.cfg.set(key.lower(), value)
+        self.limit_wait()
+
+    def limit_wait(self) -> None:
+        """
+        Keep long-polls for changes within the timeout of sync workers.
+
+        The arbiter kills a sync worker that is busy with a request for
+        longer than `timeout` seconds, so `CHANGES_MAX_WAIT` is clamped
+        to `WAIT_MARGIN` seconds less than that.  A sync worker serves
+        nothing else while a request waits, so long-polling clients are
+        better served by an asynchronous worker class, e.g. gthread or
+        gevent, which is left as configured.
+        """
+        if self.cfg.worker_class_str != "sync" or not self.cfg.timeout:
+            return
+
+        config = self.app.config
+        limit = max(self.cfg.timeout - WAIT_MARGIN, 0)
+        config["CHANGES_MAX_WAIT"] = min(
+            config.get("CHANGES_MAX_WAIT", 30), limit
+        )
 
     def load(self) -> Flask:
+        if self.cfg.preload_app:
+            freeze()
         return self.app
+
+    def pre_fork(self, _: Any, __: Any) -> None:
+        """
+        Close the connections of the arbiter before forking a worker.
+        """
+        with self.app.app_context():
+            db.engine.dispose()
+
+    def post_fork(self, _: Any, __: Any) -> None:
+        """
+        Give a new worker a connection pool of its own.
+        """
+        with self.app.app_context():
+            db.engine.dispose()
+            warmup = self.app.config.get("POOL_WARMUP")
+            if warmup:
+                pool.warm_up(db.engine, warmup)
+
+
+def freeze() -> None:
+    """
+    Exclude the objects of a preloaded application from collection.
+
+    A collection writes to the header of every object that it visits,
+    which copies the pages that a worker shares with the arbiter.
+    Frozen objects are never visited.  `gc.freeze()` is available in
+    Python 3.7 and later.
+    """
+    if hasattr(gc, "freeze"):
+        gc.collect()
+        gc.freeze()
+
+
+def worker_exit(_: Any, __: Any) -> None:
+    """
+    Write the final metrics of a worker before it exits.
+    """
+    metrics.registry.write()
+
+
+def on_exit(_: Any) -> None:
+    """
+    Remove the temporary metrics directory when the arbiter exits.
+    """
+    metrics.registry.cleanup()
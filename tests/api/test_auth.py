@@ -1,7 +1,10 @@
+import json
+
 from flask import Response, g
 
 from pkrecv.api.auth import role_required, verify_token
-from pkrecv.models.token import add_token
+from pkrecv.models.token import add_token, signed_tokens
+from pkrecv.ratelimit import Limit, limiter
 
 from ..helpers import FlaskTestCase
 
@@ -95,6 +98,14 @@ class VerifyTokenTest(FlaskTestCase):
         self.assertEqual(g.token.role, "none")
         self.assertEqual(g.token.description, "none1 desc")
 
+    def test_success_signed(self) -> None:
+        signed_tokens.configure("secret", 30)
+        add_token("admin", "admin1 desc")
+        token = add_token("server", "server1 desc", signed=True)
+
+        self.assertTrue(verify_token(token))
+        self.assertEqual(g.token, {"id": 2, "role": "server"})
+
 
 class RoleRequiredTest(FlaskTestCase):
     def setUp(self) -> None:
@@ -141,6 +152,25 @@ class RoleRequiredTest(FlaskTestCase):
         self.assertEqual(self.require_none().status_code, 200)
         self.assertEqual(self.require_none_or_server().status_code, 200)
 
+    def test_rate_limit(self) -> None:
+        limiter.configure(True, {"server": Limit(0.1, 2)}, {})
+        self.addCleanup(limiter.configure, False, {}, {})
+
+        verify_token(self.server0)
+        self.assertEqual(self.require_server().status_code, 200)
+        self.assertEqual(self.require_server().status_code, 200)
+
+        res = self.require_server()
+        self.assertEqual(res.status_code, 429)
+        self.assertEqual(res.headers["Retry-After"], "10")
+        self.assertEqual(
+            json.loads(res.data.decode("utf-8")),
+            {"message": "Too many requests"}
+        )
+
+        verify_token(self.server1)
+        self.assertEqual(self.require_server().status_code, 200)
+
     @staticmethod
     @role_required("admin")
     def require_admin() -> Response:
@@ -0,0 +1,182 @@
+import gzip
+import json
+import os
+import tempfile
+from typing import Any
+from unittest import skipIf
+from unittest.mock import patch
+
+from pkrecv.api import compression
+from pkrecv.app import init_app
+from pkrecv.models.server import add_server
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase, push_context
+
+
+class CompressionTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        for i in range(32):
+            add_server("10.0.0.{}".format(i), 22, "ssh-rsa abcd", 1)
+
+    def get(self, path: str, encoding: str = "", tag: str = "") -> Any:
+        headers = dict(self.headers)
+        if encoding:
+            headers["Accept-Encoding"] = encoding
+        if tag:
+            headers["If-None-Match"] = tag
+        return self.client.get(path, headers=headers)
+
+    def test_gzip(self) -> None:
+        plain = self.get("/api/v1/server")
+        res = self.get("/api/v1/server", "gzip")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertEqual(res.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(res.content_length, len(res.data))
+        self.assertLess(len(res.data), len(plain.data))
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+        data = json.loads(gzip.decompress(res.data).decode("utf-8"))
+        self.assertEqual(len(data["servers"]), 32)
+
+    def test_not_accepted(self) -> None:
+        for encoding in ["", "identity", "gzip;q=0", "compress"]:
+            res = self.get("/api/v1/server", encoding)
+            self.assertNotIn("Content-Encoding", res.headers)
+            self.assertEqual(res.headers["Vary"], "Accept-Encoding")
+            json.loads(res.data.decode("utf-8"))
+
+    def test_preference(self) -> None:
+        encodings = ["zstd", "br", "gzip"]
+        with patch("pkrecv.api.compression.encodings") as mock:
+            mock.return_value = encodings
+            res = self.get("/api/v1/server", "gzip, br;q=0.5, zstd;q=0.5")
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+
+        res = self.get("/api/v1/server", "*")
+        self.assertEqual(
+            res.headers["Content-Encoding"], compression.encodings()[0]
+        )
+
+    def test_threshold(self) -> None:
+        size = len(self.get("/api/v1/server").data)
+
+        self.app.config["COMPRESSION_THRESHOLD"] = size + 1
+        res = self.get("/api/v1/server", "gzip")
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertNotIn("Vary", res.headers)
+
+        self.app.config["COMPRESSION_THRESHOLD"] = size
+        res = self.get("/api/v1/server", "gzip")
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+
+    def test_level(self) -> None:
+        self.app.config["COMPRESSION_LEVEL"] = 1
+        fast = self.get("/api/v1/server", "gzip").data
+        compression.compressed.invalidate()
+        self.app.config["COMPRESSION_LEVEL"] = 9
+        best = self.get("/api/v1/server", "gzip").data
+        self.assertNotEqual(fast, best)
+        self.assertEqual(gzip.decompress(fast), gzip.decompress(best))
+
+    def test_errors(self) -> None:
+        self.app.config["COMPRESSION_THRESHOLD"] = 0
+        res = self.client.get(
+            "/api/v1/server", headers={"Accept-Encoding": "gzip"}
+        )
+        self.assertEqual(res.status_code, 401)
+        self.assertNotIn("Content-Encoding", res.headers)
+
+    def test_cached(self) -> None:
+        with patch("pkrecv.api.compression.gzip_compress") as mock:
+            mock.return_value = b"compressed"
+            with patch.dict(compression.ENCODERS):
+                compression.ENCODERS["gzip"] = (
+                    mock, "COMPRESSION_LEVEL", 6
+                )
+                for _ in range(3):
+                    res = self.get("/api/v1/server", "gzip")
+                    self.assertEqual(res.data, b"compressed")
+                self.assertEqual(mock.call_count, 1)
+
+                add_server("10.0.0.100", 22, "ssh-rsa abcd", 1)
+                self.get("/api/v1/server", "gzip")
+                self.assertEqual(mock.call_count, 2)
+
+    def test_etag(self) -> None:
+        tag = self.get("/api/v1/server").headers["ETag"]
+
+        res = self.get("/api/v1/server", "gzip")
+        self.assertEqual(res.headers["ETag"], "W/" + tag)
+
+        res = self.get("/api/v1/server", "gzip", res.headers["ETag"])
+        self.assertEqual(res.status_code, 304)
+        self.assertNotIn("Content-Encoding", res.headers)
+
+    @skipIf(compression.brotli is None, "brotli is not installed")
+    def test_brotli(self) -> None:
+        plain = self.get("/api/v1/server")
+        res = self.get("/api/v1/server", "br")
+        self.assertEqual(res.headers["Content-Encoding"], "br")
+        self.assertEqual(compression.brotli.decompress(res.data), plain.data)
+
+    @skipIf(compression.zstandard is None, "zstandard is not installed")
+    def test_zstd(self) -> None:
+        plain = self.get("/api/v1/server")
+        res = self.get("/api/v1/server", "zstd")
+        self.assertEqual(res.headers["Content-Encoding"], "zstd")
+        decompressor = compression.zstandard.ZstdDecompressor()
+        self.assertEqual(decompressor.decompress(res.data), plain.data)
+
+    def test_known_hosts(self) -> None:
+        self.app.config["COMPRESSION_THRESHOLD"] = 0
+        plain = self.get("/api/v1/known_hosts")
+        res = self.get("/api/v1/known_hosts", "gzip")
+        self.assertEqual(res.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+    def test_known_hosts_file(self) -> None:
+        self.app.config["COMPRESSION_THRESHOLD"] = 0
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "known_hosts")
+            self.app.config["KNOWN_HOSTS_FILE"] = path
+
+            res = self.get("/api/v1/known_hosts", "gzip")
+            self.assertEqual(res.headers["Content-Encoding"], "gzip")
+            self.assertEqual(res.content_length, len(res.data))
+            with open(path, "rb") as f:
+                self.assertEqual(gzip.decompress(res.data), f.read())
+            res.close()
+
+            self.app.config["COMPRESSION_MAX_FILE_SIZE"] = 16
+            res = self.get("/api/v1/known_hosts", "gzip")
+            self.assertNotIn("Content-Encoding", res.headers)
+            with open(path, "rb") as f:
+                self.assertEqual(res.data, f.read())
+            res.close()
+
+    def test_disabled(self) -> None:
+        options = {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///",
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+            "COMPRESSION_ENABLED": False,
+        }
+        app = init_app(options)
+        push_context(self, app)
+        self.headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        for i in range(32):
+            add_server("10.0.0.{}".format(i), 22, "ssh-rsa abcd", 1)
+
+        self.client = app.test_client()
+        res = self.get("/api/v1/server", "gzip")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("Content-Encoding", res.headers)
+        self.assertNotIn("Vary", res.headers)
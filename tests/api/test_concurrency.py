@@ -0,0 +1,83 @@
+import base64
+import json
+import threading
+from typing import List
+
+from pkrecv.models.server import get_servers
+from pkrecv.models.token import add_token
+
+from ..helpers import ThreadedFlaskTestCase
+
+THREADS = 16
+REQUESTS = 10
+
+
+class ConcurrencyTest(ThreadedFlaskTestCase):
+    """
+    Serve requests from many threads, as gthread workers do.
+    """
+
+    @staticmethod
+    def run_threads(target: object, count: int) -> List[BaseException]:
+        errors = []  # type: List[BaseException]
+
+        def run(i: int) -> None:
+            try:
+                target(i)  # type: ignore
+            except BaseException as e:  # pylint: disable=broad-except
+                errors.append(e)
+
+        threads = [
+            threading.Thread(target=run, args=(i, )) for i in range(count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+    def test_post_get(self) -> None:
+        self.app.config["SQLITE_BUSY_RETRIES"] = 100
+        tokens = [add_token("server", str(i)) for i in range(THREADS)]
+        admin = add_token("admin", "admin")
+
+        def post(i: int) -> None:
+            client = self.app.test_client()
+            headers = {"Authorization": "Bearer {}".format(tokens[i])}
+            environ = {"REMOTE_ADDR": "10.0.0.{}".format(i)}
+            for j in range(REQUESTS):
+                key = base64.b64encode(bytes([i, j])).decode("ascii")
+                res = client.post(
+                    "/api/v1/server",
+                    headers=headers,
+                    data={"public_key": "ssh-rsa " + key},
+                    environ_base=environ,
+                )
+                assert res.status_code == 200, res.data
+
+                res = client.get("/api/v1/server", headers=headers)
+                assert res.status_code == 401, res.data
+
+        def get(_: int) -> None:
+            client = self.app.test_client()
+            headers = {"Authorization": "Bearer {}".format(admin)}
+            for _ in range(REQUESTS):
+                res = client.get("/api/v1/server", headers=headers)
+                assert res.status_code == 200, res.data
+                json.loads(res.data.decode("utf-8"))
+
+        def run(i: int) -> None:
+            if i < THREADS:
+                post(i)
+            else:
+                get(i)
+
+        self.assertEqual(self.run_threads(run, 2 * THREADS), [])
+
+        servers = get_servers()
+        self.assertEqual(len(servers), THREADS * REQUESTS)
+
+        # Every server was added with the token of its own thread.
+        for server in servers:
+            i = int(server.ip.split(".")[-1])
+            self.assertEqual(server.token_id, i + 1)
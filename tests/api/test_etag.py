@@ -0,0 +1,87 @@
+import json
+from typing import Any, List
+
+from sqlalchemy import event
+
+from pkrecv.models.db import db
+from pkrecv.models.server import add_server, delete_server
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase
+
+
+class ETagTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+
+    def get(self, path: str, tag: str = "", **data: Any) -> Any:
+        headers = dict(self.headers)
+        if tag:
+            headers["If-None-Match"] = tag
+        return self.client.get(path, headers=headers, data=data)
+
+    def test_not_modified(self) -> None:
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+
+        res = self.get("/api/v1/server")
+        tag = res.headers["ETag"]
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(data["servers"]), 1)
+
+        statements = []  # type: List[str]
+
+        def record(*args: Any) -> None:
+            statements.append(args[2])
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            res = self.get("/api/v1/server", tag)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers["ETag"], tag)
+        self.assertEqual(res.data, b"")
+        self.assertFalse([s for s in statements if "FROM server" in s])
+
+    def test_weak(self) -> None:
+        tag = self.get("/api/v1/server").headers["ETag"]
+        res = self.get("/api/v1/server", "W/" + tag)
+        self.assertEqual(res.status_code, 304)
+
+    def test_arguments(self) -> None:
+        tag = self.get("/api/v1/server").headers["ETag"]
+        res = self.get("/api/v1/server", tag, ip="ip")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res.headers["ETag"], tag)
+
+    def test_server_changes(self) -> None:
+        tag = self.get("/api/v1/server").headers["ETag"]
+
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+        res = self.get("/api/v1/server", tag)
+        self.assertEqual(res.status_code, 200)
+        tag = res.headers["ETag"]
+
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(self.get("/api/v1/server", tag).status_code, 304)
+
+        delete_server(1)
+        self.assertEqual(self.get("/api/v1/server", tag).status_code, 200)
+
+    def test_token_changes(self) -> None:
+        tag = self.get("/api/v1/token").headers["ETag"]
+        self.assertEqual(self.get("/api/v1/token", tag).status_code, 304)
+
+        add_token("server", "desc")
+        self.assertEqual(self.get("/api/v1/token", tag).status_code, 200)
+
+    def test_shared(self) -> None:
+        tag = self.get("/api/v1/server/shared").headers["ETag"]
+        res = self.get("/api/v1/server/shared", tag)
+        self.assertEqual(res.status_code, 304)
@@ -0,0 +1,141 @@
+import os
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from pkrecv.models.server import add_server, delete_server, fingerprint
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase
+
+
+class KnownHostsGetTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+
+    def test_unauthenticated(self) -> None:
+        res = self.client.get("/api/v1/known_hosts")
+        self.assertEqual(res.data, b"Unauthorized Access")
+        self.assertEqual(res.status_code, 401)
+
+    def test_unauthorized(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.get("/api/v1/known_hosts", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_no_filter(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd comment", 1)
+        add_server("10.0.0.2", 2222, "ssh-ed25519 data", 1)
+
+        res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.mimetype, "text/plain")
+        self.assertEqual(
+            res.data, b"10.0.0.1 ssh-rsa abcd comment\n"
+            b"[10.0.0.2]:2222 ssh-ed25519 data\n"
+        )
+
+    def test_filter(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        add_server("10.0.0.2", 22, "ssh-ed25519 data", 1)
+        add_server("10.0.0.2", 22, "ssh-rsa data", 1)
+
+        data = {
+            "ip": "10.0.0.2",
+            "key_type": "ssh-rsa",
+        }
+        res = self.client.get(
+            "/api/v1/known_hosts", headers=self.headers, data=data
+        )
+        self.assertEqual(res.data, b"10.0.0.2 ssh-rsa data\n")
+
+    def test_fingerprint_filter(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        add_server("10.0.0.2", 22, "ssh-rsa data", 1)
+
+        for key_data in ["abcd", "data"]:
+            data = {"fingerprint": fingerprint(key_data)}
+            res = self.client.get(
+                "/api/v1/known_hosts", headers=self.headers, data=data
+            )
+            self.assertIn(key_data, res.data.decode("utf-8"))
+            self.assertEqual(len(res.data.splitlines()), 1)
+
+    def test_cached(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        self.client.get("/api/v1/known_hosts", headers=self.headers)
+
+        with patch("pkrecv.models.server.render_known_hosts") as mock:
+            res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+            self.assertEqual(res.data, b"10.0.0.1 ssh-rsa abcd\n")
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def test_invalidated(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        self.client.get("/api/v1/known_hosts", headers=self.headers)
+
+        add_server("10.0.0.2", 22, "ssh-rsa data", 1)
+        res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+        self.assertEqual(
+            res.data, b"10.0.0.1 ssh-rsa abcd\n10.0.0.2 ssh-rsa data\n"
+        )
+
+        delete_server(1)
+        res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+        self.assertEqual(res.data, b"10.0.0.2 ssh-rsa data\n")
+
+    def test_other_process(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        self.client.get("/api/v1/known_hosts", headers=self.headers)
+
+        # A write in another process doesn't invalidate the cache in
+        # this one, but it changes the generation.
+        with patch("pkrecv.models.server.known_hosts.invalidate"):
+            add_server("10.0.0.2", 22, "ssh-rsa data", 1)
+        res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+        self.assertEqual(
+            res.data, b"10.0.0.1 ssh-rsa abcd\n10.0.0.2 ssh-rsa data\n"
+        )
+
+    def test_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "known_hosts")
+            self.app.config["KNOWN_HOSTS_FILE"] = path
+
+            add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+            res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+            self.assertEqual(res.data, b"10.0.0.1 ssh-rsa abcd\n")
+            res.close()
+
+            with open(path) as f:
+                self.assertEqual(f.read(), "10.0.0.1 ssh-rsa abcd\n")
+
+            with patch("pkrecv.models.server.render_known_hosts") as mock:
+                res = self.client.get(
+                    "/api/v1/known_hosts", headers=self.headers
+                )
+                self.assertEqual(res.data, b"10.0.0.1 ssh-rsa abcd\n")
+                self.assertEqual(len(mock.mock_calls), 0)
+                res.close()
+
+            add_server("10.0.0.2", 22, "ssh-rsa data", 1)
+            res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+            self.assertEqual(
+                res.data, b"10.0.0.1 ssh-rsa abcd\n10.0.0.2 ssh-rsa data\n"
+            )
+            res.close()
+
+    @patch("pkrecv.models.server.os.replace")
+    def test_file_error(self, mock: MagicMock) -> None:
+        mock.side_effect = OSError("xyz")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            self.app.config["KNOWN_HOSTS_FILE"] = os.path.join(tmp, "kh")
+            res = self.client.get("/api/v1/known_hosts", headers=self.headers)
+            self.assertEqual(res.status_code, 500)
+            self.assertEqual(os.listdir(tmp), [])
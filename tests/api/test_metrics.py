@@ -0,0 +1,88 @@
+import tempfile
+from typing import Any, Dict
+from unittest import TestCase
+
+from pkrecv.app import init_app
+from pkrecv.metrics import registry
+from pkrecv.models.db import db
+from pkrecv.models.token import add_token
+
+from ..helpers import push_context
+
+
+class MetricsTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.options = {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///",
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+        self.init({"enabled": True, "directory": self.tmp.name})
+
+    def init(self, metrics: Dict[str, Any]) -> None:
+        self.app = init_app(self.options, metrics=metrics)
+        self.app.testing = True
+        self.client = self.app.test_client()
+        push_context(self, self.app)
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        registry.configure(False)
+        self.tmp.cleanup()
+
+    def test_disabled(self) -> None:
+        self.init({"enabled": False})
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        res = self.client.get("/metrics", headers=headers)
+        self.assertEqual(res.status_code, 404)
+
+    def test_unauthorized(self) -> None:
+        res = self.client.get("/metrics")
+        self.assertEqual(res.status_code, 401)
+
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.get("/metrics", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_public(self) -> None:
+        self.init({"enabled": True, "public": True})
+        res = self.client.get("/metrics")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith("text/plain"))
+
+    def test_success(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        self.client.get("/api/v1/server", headers=headers)
+        self.client.get("/api/v1/server", headers={"Authorization": "x"})
+
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        res = self.client.get("/metrics", headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+        text = res.data.decode("utf-8")
+        labels = 'endpoint="server",method="GET"'
+        self.assertIn(
+            "pkrecv_http_request_duration_seconds_count{{{}}} 2".format(
+                labels
+            ), text
+        )
+        self.assertIn(
+            'pkrecv_http_responses_total{{{},status="401"}} 2.0'.format(
+                labels
+            ), text
+        )
+        self.assertIn('pkrecv_auth_total{result="denied"} 1.0', text)
+        self.assertIn('pkrecv_auth_total{result="failure"} 1.0', text)
+        self.assertIn('pkrecv_auth_total{result="success"} 2.0', text)
+        self.assertIn(
+            'pkrecv_db_query_duration_seconds_count{operation="SELECT"}', text
+        )
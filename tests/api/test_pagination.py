@@ -0,0 +1,28 @@
+from unittest import TestCase
+
+from munch import Munch
+
+from pkrecv.api.pagination import cursor, next_cursor
+
+
+class CursorTest(TestCase):
+    def test_roundtrip(self) -> None:
+        rows = [Munch(id=1), Munch(id=1234)]
+        self.assertEqual(cursor(next_cursor(rows, 2)), 1234)
+
+    def test_invalid(self) -> None:
+        for value in ["", "!!!!", "YWJj", "å"]:
+            with self.assertRaises(ValueError):
+                cursor(value)
+
+
+class NextCursorTest(TestCase):
+    def test_no_limit(self) -> None:
+        self.assertIsNone(next_cursor([Munch(id=1)], None))
+
+    def test_last_page(self) -> None:
+        self.assertIsNone(next_cursor([Munch(id=1)], 2))
+        self.assertIsNone(next_cursor([], 2))
+
+    def test_full_page(self) -> None:
+        self.assertIsNotNone(next_cursor([Munch(id=1), Munch(id=2)], 2))
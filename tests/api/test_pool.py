@@ -0,0 +1,25 @@
+import json
+import os
+
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase
+
+
+class PoolGetTest(FlaskTestCase):
+    def test_unauthorized(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.get("/api/v1/pool", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_success(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        res = self.client.get("/api/v1/pool", headers=headers)
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data["pool"]["pid"], os.getpid())
+        self.assertTrue("checkouts" in data["pool"])
@@ -0,0 +1,75 @@
+import os
+import tempfile
+from typing import Any, Dict
+from unittest import TestCase
+
+from pkrecv import profiling
+from pkrecv.app import init_app
+from pkrecv.models.db import db
+from pkrecv.models.token import add_token
+
+from ..helpers import push_context
+
+
+class ProfilingTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp.name, "profiles")
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.drop_all()
+        self.tmp.cleanup()
+
+    def init(self, **options: Any) -> None:
+        config = {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///",
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+        self.app = init_app(
+            config, profiling=dict(options, directory=self.directory)
+        )
+        self.app.testing = True
+        self.client = self.app.test_client()
+        push_context(self, self.app)
+
+    def get(self, role: str, headers: Dict[str, str]) -> None:
+        headers = dict(
+            headers,
+            Authorization="Bearer {}".format(add_token(role, "desc"))
+        )
+        res = self.client.get("/api/v1/server", headers=headers)
+        self.assertEqual(res.status_code, 200 if role == "admin" else 401)
+
+    def test_disabled(self) -> None:
+        self.init(sample_rate=0)
+        self.get("admin", {})
+        self.assertEqual(profiling.profiles(self.directory), [])
+
+    def test_sample_rate(self) -> None:
+        self.init(sample_rate=1, max_files=2)
+        for _ in range(3):
+            self.get("admin", {})
+
+        profiles = profiling.profiles(self.directory, "server")
+        self.assertEqual(len(profiles), 2)
+
+    def test_header(self) -> None:
+        self.init()
+        self.get("admin", {"X-Profile": "1"})
+        self.assertEqual(len(profiling.profiles(self.directory)), 1)
+
+    def test_header_name(self) -> None:
+        self.init(header="X-Trace")
+        self.get("admin", {"X-Profile": "1"})
+        self.get("admin", {"X-Trace": "1"})
+        self.assertEqual(len(profiling.profiles(self.directory)), 1)
+
+    def test_header_unauthorized(self) -> None:
+        self.init()
+        self.get("server", {"X-Profile": "1"})
+        res = self.client.get(
+            "/api/v1/server", headers={"X-Profile": "1"}
+        )
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(profiling.profiles(self.directory), [])
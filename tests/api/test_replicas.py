@@ -0,0 +1,192 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pkrecv.api.replicas import RecentWriters
+from pkrecv.app import init_app
+from pkrecv.models.db import db, read_bind, replica_reads
+from pkrecv.models.server import add_server, get_servers
+from pkrecv.models.token import add_token, invalidate_cache
+
+from ..helpers import push_context
+
+
+class ReplicaTest(TestCase):
+    """
+    Read from a replica that is a copy of the primary database file.
+    """
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.primary = os.path.join(self.tmp.name, "primary.sqlite")
+        self.replica = os.path.join(self.tmp.name, "replica.sqlite")
+        self.init()
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.engine.dispose()
+        self.tmp.cleanup()
+
+    def init(self, **replicas: object) -> None:
+        options = {
+            "SQLALCHEMY_DATABASE_URI": "sqlite:///" + self.primary,
+            "SQLALCHEMY_TRACK_MODIFICATIONS": False,
+        }
+        replicas = dict(replicas, uris="sqlite:///" + self.replica)
+        self.app = init_app(options, replicas=replicas)
+        self.app.testing = True
+        self.client = self.app.test_client()
+        push_context(self, self.app)
+        self.admin = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        self.replicate()
+
+    def replicate(self) -> None:
+        source = sqlite3.connect(self.primary)
+        destination = sqlite3.connect(self.replica)
+        try:
+            source.backup(destination)
+        finally:
+            source.close()
+            destination.close()
+
+    def get(self, path: str, **kwargs: object) -> dict:
+        res = self.client.get(path, headers=self.admin, **kwargs)
+        self.assertEqual(res.status_code, 200)
+        return dict(json.loads(res.data.decode("utf-8")))
+
+    def test_read_bind(self) -> None:
+        self.assertIsNone(read_bind())
+        with replica_reads():
+            self.assertIsNotNone(read_bind())
+            self.assertIs(read_bind(), read_bind())
+            with replica_reads(False):
+                self.assertIsNone(read_bind())
+        self.assertIsNone(read_bind())
+
+    def test_servers(self) -> None:
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(len(get_servers()), 1)
+        self.assertEqual(self.get("/api/v1/server")["servers"], [])
+
+        self.replicate()
+        self.assertEqual(len(self.get("/api/v1/server")["servers"]), 1)
+
+    def test_etag(self) -> None:
+        res = self.client.get("/api/v1/server", headers=self.admin)
+        tag = res.headers["ETag"]
+
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        headers = dict(self.admin, **{"If-None-Match": tag})
+        res = self.client.get("/api/v1/server", headers=headers)
+        self.assertEqual(res.status_code, 304)
+
+        self.replicate()
+        res = self.client.get("/api/v1/server", headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+    def test_writes(self) -> None:
+        with replica_reads():
+            add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+            self.assertEqual(len(get_servers()), 0)
+        self.assertEqual(len(get_servers()), 1)
+
+    def test_read_your_writes(self) -> None:
+        res = self.client.post(
+            "/api/v1/token",
+            headers=self.admin,
+            data={"role": "server", "description": "new"},
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(self.get("/api/v1/token")["tokens"]), 2)
+
+    def test_read_your_writes_processes(self) -> None:
+        def write() -> None:
+            # A forked worker starts with connections of its own.
+            db.engine.dispose()
+            res = self.client.post(
+                "/api/v1/token",
+                headers=self.admin,
+                data={"role": "server", "description": "new"},
+            )
+            os._exit(0 if res.status_code == 200 else 1)
+
+        process = multiprocessing.get_context("fork").Process(target=write)
+        process.start()
+        process.join()
+        self.assertEqual(process.exitcode, 0)
+        self.assertEqual(len(self.get("/api/v1/token")["tokens"]), 2)
+
+    def test_read_your_writes_disabled(self) -> None:
+        self.init(read_your_writes=0)
+        tokens = self.get("/api/v1/token")["tokens"]
+        res = self.client.post(
+            "/api/v1/token",
+            headers=self.admin,
+            data={"role": "server", "description": "new"},
+        )
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.get("/api/v1/token")["tokens"], tokens)
+
+    def test_tokens(self) -> None:
+        self.init(tokens=True)
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+
+        # The new token hasn't been replicated yet.
+        res = self.client.get("/api/v1/token", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+        self.replicate()
+        invalidate_cache()
+        res = self.client.get("/api/v1/token", headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+
+class RecentWritersTest(TestCase):
+    def setUp(self) -> None:
+        self.writers = RecentWriters()
+        self.writers.configure(5, slots=4)
+
+    def tearDown(self) -> None:
+        self.writers.configure(0)
+
+    @patch("pkrecv.api.replicas.time.monotonic")
+    def test_ttl(self, mock: MagicMock) -> None:
+        mock.return_value = 100
+        self.writers.add(1)
+        self.assertTrue(self.writers.get(1))
+        self.assertFalse(self.writers.get(2))
+
+        mock.return_value = 104.9
+        self.assertTrue(self.writers.get(1))
+        mock.return_value = 105
+        self.assertFalse(self.writers.get(1))
+
+    @patch("pkrecv.api.replicas.time.monotonic")
+    def test_evict(self, mock: MagicMock) -> None:
+        for i in range(1, 6):
+            mock.return_value = 100 + i
+            self.writers.add(i)
+        self.assertFalse(self.writers.get(1))
+        self.assertTrue(all(self.writers.get(i) for i in range(2, 6)))
+
+    def test_disabled(self) -> None:
+        self.writers.configure(0)
+        self.writers.add(1)
+        self.assertFalse(self.writers.get(1))
+
+    def test_processes(self) -> None:
+        process = multiprocessing.get_context("fork").Process(
+            target=self.writers.add, args=(1, )
+        )
+        process.start()
+        process.join()
+        self.assertTrue(self.writers.get(1))
+        self.assertFalse(self.writers.get(2))
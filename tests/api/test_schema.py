@@ -0,0 +1,65 @@
+from flask_restful import inputs
+from werkzeug.exceptions import BadRequest
+
+from pkrecv.api.schema import MISSING, Argument, Schema
+
+from ..helpers import FlaskTestCase
+
+
+class SchemaTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.schema = Schema(
+            Argument("name", required=True),
+            Argument("count", type=inputs.positive),
+            Argument("items", action="append", dest="things"),
+        )
+
+    def test_defaults(self) -> None:
+        with self.app.test_request_context("/?name=x"):
+            args = self.schema.parse()
+        self.assertEqual(args, {"name": "x", "count": None, "things": None})
+
+    def test_query_string(self) -> None:
+        url = "/?name=x&count=3&items=a&items=b"
+        with self.app.test_request_context(url):
+            args = self.schema.parse()
+        self.assertEqual(args.name, "x")
+        self.assertEqual(args.count, 3)
+        self.assertEqual(args.things, ["a", "b"])
+
+    def test_form(self) -> None:
+        data = {
+            "name": "y",
+            "items": ["c"],
+        }
+        with self.app.test_request_context("/", method="POST", data=data):
+            args = self.schema.parse()
+        self.assertEqual(args.name, "y")
+        self.assertEqual(args.things, ["c"])
+
+    def test_json(self) -> None:
+        data = {
+            "name": "z",
+            "count": 5,
+            "items": ["d", "e"],
+        }
+        with self.app.test_request_context("/", method="POST", json=data):
+            args = self.schema.parse()
+        self.assertEqual(args.name, "z")
+        self.assertEqual(args.count, 5)
+        self.assertEqual(args.things, ["d", "e"])
+
+    def test_json_not_object(self) -> None:
+        with self.app.test_request_context("/?name=x", json=[1, 2]):
+            self.assertEqual(self.schema.parse().name, "x")
+
+    def test_errors(self) -> None:
+        with self.app.test_request_context("/?count=0"):
+            with self.assertRaises(BadRequest) as cm:
+                self.schema.parse()
+
+        message = cm.exception.data["message"]  # type: ignore
+        self.assertEqual(sorted(message.keys()), ["count", "name"])
+        self.assertEqual(message["name"], MISSING)
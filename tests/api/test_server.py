@@ -1,6 +1,11 @@
 import json
 
-from pkrecv.models.server import add_server, get_servers
+from pkrecv.models.server import (
+    add_server,
+    delete_server,
+    fingerprint,
+    get_servers,
+)
 from pkrecv.models.token import add_token
 
 from ..helpers import FlaskTestCase
@@ -160,6 +165,60 @@ class ServerGetTest(FlaskTestCase):
         self.assertEqual(servers[0]["key_data"], "...")
         self.assertEqual(servers[0]["key_comment"], "")
 
+    def test_fingerprint_filter(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc1")),
+        }
+        add_server(ip="1", port=1, public_key="ssh-rsa abcd", token_id=1)
+        add_server(ip="2", port=2, public_key="ssh-rsa dGVzdA==", token_id=1)
+        add_server(ip="3", port=3, public_key="ssh-ed25519 abcd", token_id=1)
+
+        filters = {
+            "fingerprint": fingerprint("abcd"),
+        }
+        res = self.client.get("/api/v1/server", headers=headers, data=filters)
+        data = json.loads(res.data.decode("utf-8"))
+        servers = data["servers"]
+
+        self.assertEqual([s["ip"] for s in servers], ["1", "3"])
+        self.assertEqual(servers[0]["fingerprint"], fingerprint("abcd"))
+
+    def test_pagination(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc1")),
+        }
+
+        for i in range(5):
+            add_server(ip=str(i), port=i, public_key="ssh-rsa ...", token_id=1)
+
+        ids = []
+        filters = {
+            "limit": 2,
+        }
+        while True:
+            res = self.client.get(
+                "/api/v1/server", headers=headers, data=filters
+            )
+            data = json.loads(res.data.decode("utf-8"))
+            ids.append([s["id"] for s in data["servers"]])
+            if not data["next"]:
+                break
+            filters["cursor"] = data["next"]
+
+        self.assertEqual(ids, [[1, 2], [3, 4], [5]])
+
+    def test_invalid_limit(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc1")),
+        }
+
+        res = self.client.get(
+            "/api/v1/server", headers=headers, data={"limit": 0}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertTrue("limit" in data["message"])
+        self.assertEqual(res.status_code, 400)
+
 
 class ServerPostTest(FlaskTestCase):
     def test_unauthenticated(self) -> None:
@@ -240,6 +299,119 @@ class ServerPostTest(FlaskTestCase):
         self.assertEqual(servers[0].key_comment, "comment321")
 
 
+class ServerBatchPostTest(FlaskTestCase):
+    def test_unauthenticated(self) -> None:
+        res = self.client.post("/api/v1/server/batch")
+        self.assertEqual(res.data, b"Unauthorized Access")
+        self.assertEqual(res.status_code, 401)
+
+    def test_unauthorized(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("none", "desc")),
+        }
+        res = self.client.post("/api/v1/server/batch", headers=headers)
+        obj = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(obj["message"], "Permission denied")
+        self.assertEqual(res.status_code, 401)
+
+    def test_missing_public_keys(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.post("/api/v1/server/batch", headers=headers)
+        obj = json.loads(res.data.decode("utf-8"))
+        self.assertTrue("public_keys" in obj["message"].keys())
+        self.assertEqual(res.status_code, 400)
+
+    def test_invalid_public_key(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+
+        data = {
+            "public_keys": ["ssh-rsa data", "x"],
+        }
+
+        res = self.client.post(
+            "/api/v1/server/batch", headers=headers, data=data
+        )
+        obj = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(obj["message"], "invalid public keys")
+        self.assertEqual(obj["errors"], [None, "invalid public key"])
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(len(get_servers()), 0)
+
+    def test_success(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+
+        data = {
+            "public_keys": ["ssh-rsa data c1", "ssh-ed25519 abcd c2"],
+        }
+
+        res = self.client.post(
+            "/api/v1/server/batch", headers=headers, data=data
+        )
+        obj = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(obj["message"], "added")
+        self.assertEqual(res.status_code, 200)
+
+        servers = get_servers()
+        self.assertEqual(len(servers), 2)
+        self.assertEqual(servers[0].key_type, "ssh-rsa")
+        self.assertEqual(servers[0].key_data, "data")
+        self.assertEqual(servers[1].key_type, "ssh-ed25519")
+        self.assertEqual(servers[1].key_comment, "c2")
+
+
+class SharedFingerprintsGetTest(FlaskTestCase):
+    def test_unauthorized(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.get("/api/v1/server/shared", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_success(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        add_server(ip="1", port=22, public_key="ssh-rsa abcd", token_id=1)
+        add_server(ip="1", port=2222, public_key="ssh-rsa abcd", token_id=1)
+        add_server(ip="2", port=22, public_key="ssh-rsa dGVzdA==", token_id=1)
+        add_server(ip="2", port=22, public_key="ssh-dss dGVzdA==", token_id=1)
+        add_server(ip="3", port=22, public_key="ssh-rsa abcd", token_id=1)
+        add_server(ip="4", port=22, public_key="ssh-rsa YQ==", token_id=1)
+        add_server(ip="5", port=22, public_key="ssh-rsa YQ==", token_id=1)
+
+        res = self.client.get("/api/v1/server/shared", headers=headers)
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            sorted(data["fingerprints"], key=lambda f: f["ips"]), [
+                {"fingerprint": fingerprint("abcd"), "ips": ["1", "3"]},
+                {"fingerprint": fingerprint("YQ=="), "ips": ["4", "5"]},
+            ]
+        )
+
+        res = self.client.get(
+            "/api/v1/server/shared", headers=headers, data={"limit": 1}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(len(data["fingerprints"]), 1)
+
+    def test_none(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        add_server(ip="1", port=22, public_key="ssh-rsa abcd", token_id=1)
+
+        res = self.client.get("/api/v1/server/shared", headers=headers)
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(data["fingerprints"], [])
+
+
 class ServerDeleteTest(FlaskTestCase):
     def test_unauthenticated(self) -> None:
         res = self.client.delete("/api/v1/server")
@@ -327,3 +499,64 @@ class ServerDeleteTest(FlaskTestCase):
         res = self.client.get("/api/v1/server", headers=headers)
         servers = json.loads(res.data.decode("utf-8"))["servers"]
         self.assertEqual(len(servers), 2)
+
+
+class ServerChangesGetTest(FlaskTestCase):
+    def test_unauthorized(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("server", "desc")),
+        }
+        res = self.client.get("/api/v1/server/changes", headers=headers)
+        self.assertEqual(res.status_code, 401)
+
+    def test_success(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        add_server(ip="1", port=22, public_key="ssh-rsa abcd", token_id=1)
+        add_server(ip="2", port=22, public_key="ssh-rsa abcd", token_id=1)
+        delete_server(1)
+
+        res = self.client.get(
+            "/api/v1/server/changes", headers=headers, data={"limit": 2}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(
+            [(c["action"], c["ip"]) for c in data["changes"]],
+            [("insert", "1"), ("insert", "2")]
+        )
+        self.assertEqual(data["next"], 2)
+
+        res = self.client.get(
+            "/api/v1/server/changes", headers=headers, data={"since": 2}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(
+            [(c["action"], c["ip"]) for c in data["changes"]],
+            [("delete", "1")]
+        )
+        self.assertEqual(data["next"], 3)
+
+    def test_wait(self) -> None:
+        self.app.config["CHANGES_MAX_WAIT"] = 0
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        res = self.client.get(
+            "/api/v1/server/changes",
+            headers=headers,
+            data={"since": 5, "wait": 3600},
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data, {"changes": [], "next": 5})
+
+    def test_invalid(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc")),
+        }
+        res = self.client.get(
+            "/api/v1/server/changes", headers=headers, data={"since": -1}
+        )
+        self.assertEqual(res.status_code, 400)
@@ -45,6 +45,42 @@ class TokenGetTest(FlaskTestCase):
         self.assertEqual(tokens[2]["role"], "admin")
         self.assertEqual(tokens[2]["description"], "desc3")
 
+        self.assertIsNone(data["next"])
+
+    def test_pagination(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc1")),
+        }
+        add_token("server", "desc2")
+        add_token("admin", "desc3")
+
+        res = self.client.get(
+            "/api/v1/token", headers=headers, data={"limit": 2}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual([t["id"] for t in data["tokens"]], [1, 2])
+
+        filters = {
+            "limit": 2,
+            "cursor": data["next"],
+        }
+        res = self.client.get("/api/v1/token", headers=headers, data=filters)
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual([t["id"] for t in data["tokens"]], [3])
+        self.assertIsNone(data["next"])
+
+    def test_invalid_cursor(self) -> None:
+        headers = {
+            "Authorization": "Bearer {}".format(add_token("admin", "desc1")),
+        }
+
+        res = self.client.get(
+            "/api/v1/token", headers=headers, data={"cursor": "x"}
+        )
+        data = json.loads(res.data.decode("utf-8"))
+        self.assertEqual(data["message"]["cursor"], "invalid cursor")
+        self.assertEqual(res.status_code, 400)
+
 
 class TokenPostTest(FlaskTestCase):
     def test_unauthenticated(self) -> None:
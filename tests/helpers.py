@@ -1,19 +1,56 @@
+import os
+import tempfile
 from unittest import TestCase
 
+from flask import Flask
+
 from pkrecv.app import init_app
 from pkrecv.models.db import db
 
 
+def push_context(test: TestCase, app: Flask) -> None:
+    """
+    Push an application context until the end of a test.
+    """
+    context = app.app_context()
+    context.push()
+    test.addCleanup(context.pop)
+
+
 class FlaskTestCase(TestCase):
+    database_uri = "sqlite:///"
+
     def setUp(self) -> None:
         options = {
-            "SQLALCHEMY_DATABASE_URI": "sqlite:///",
+            "SQLALCHEMY_DATABASE_URI": self.database_uri,
             "SQLALCHEMY_TRACK_MODIFICATIONS": False
         }
         self.app = init_app(options)
         self.app.testing = True
         self.client = self.app.test_client()
+        push_context(self, self.app)
 
     def tearDown(self) -> None:
         db.session.remove()
         db.drop_all()
+
+
+class ThreadedFlaskTestCase(FlaskTestCase):
+    """
+    A test case backed by a database file.
+
+    Threads in an in-memory database share a single connection, so one
+    thread returning it to the pool rolls back the transaction of
+    another.
+    """
+
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, "db.sqlite")
+        self.database_uri = "sqlite:///" + path
+        super().setUp()
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        db.engine.dispose()
+        self.tmp.cleanup()
@@ -0,0 +1,200 @@
+import json
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pkrecv.models.bulk import (
+    export_servers,
+    import_servers,
+    parse_chunk,
+    parse_known_hosts,
+    parse_ndjson,
+)
+from pkrecv.models.server import (
+    ServerError,
+    fingerprint,
+    get_known_hosts,
+    get_servers,
+)
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase
+
+
+class ParseKnownHostsTest(TestCase):
+    def test_hosts(self) -> None:
+        self.assertEqual(
+            parse_known_hosts("a,[b]:2222 ssh-rsa abcd comment"),
+            [("a", 22, "ssh-rsa abcd comment"),
+             ("b", 2222, "ssh-rsa abcd comment")]
+        )
+
+    def test_tab(self) -> None:
+        self.assertEqual(
+            parse_known_hosts("a\tssh-rsa abcd"), [("a", 22, "ssh-rsa abcd")]
+        )
+
+    def test_invalid(self) -> None:
+        lines = [
+            "@revoked a ssh-rsa abcd",
+            "|1|abc|def ssh-rsa abcd",
+            "[a]:x ssh-rsa abcd",
+            "[a] ssh-rsa abcd",
+            "a",
+        ]
+        for line in lines:
+            with self.assertRaises(ServerError):
+                parse_known_hosts(line)
+
+
+class ParseNdjsonTest(TestCase):
+    def test_public_key(self) -> None:
+        line = json.dumps({"ip": "a", "public_key": "ssh-rsa abcd"})
+        self.assertEqual(parse_ndjson(line), [("a", 22, "ssh-rsa abcd")])
+
+    def test_columns(self) -> None:
+        line = json.dumps({
+            "ip": "a",
+            "port": 2222,
+            "key_type": "ssh-rsa",
+            "key_data": "abcd",
+            "key_comment": None,
+        })
+        self.assertEqual(parse_ndjson(line), [("a", 2222, "ssh-rsa abcd ")])
+
+    def test_invalid(self) -> None:
+        lines = [
+            "{",
+            "[]",
+            json.dumps({"public_key": "ssh-rsa abcd"}),
+            json.dumps({"ip": "a", "port": "22"}),
+            json.dumps({"ip": "a", "port": True}),
+        ]
+        for line in lines:
+            with self.assertRaises(ServerError):
+                parse_ndjson(line)
+
+
+class ParseChunkTest(TestCase):
+    def test_parse(self) -> None:
+        lines = [
+            (1, "# comment\n"),
+            (2, "\n"),
+            (3, "a ssh-rsa abcd x\n"),
+            (4, "b ssh-rsa1 abcd\n"),
+            (5, "c ssh-rsa abc\n"),
+        ]
+        rows, errors = parse_chunk(("known_hosts", 7, lines))
+        self.assertEqual(rows, [{
+            "ip": "a",
+            "port": 22,
+            "key_type": "ssh-rsa",
+            "key_data": "abcd",
+            "key_comment": "x",
+            "fingerprint": fingerprint("abcd"),
+            "token_id": 7,
+        }])
+        self.assertEqual([e[0] for e in errors], [4, 5])
+
+
+class ImportServersTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        add_token("server", "desc")
+
+    def test_import(self) -> None:
+        lines = ["{} ssh-rsa abcd\n".format(i) for i in range(25)]
+        lines.insert(3, "x ssh-rsa abc\n")
+        results = []
+        result = import_servers(
+            lines, "known_hosts", 1, chunk_size=10, processes=1,
+            progress=lambda r: results.append((r.lines, r.servers))
+        )
+
+        self.assertEqual(result.lines, 26)
+        self.assertEqual(result.servers, 25)
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(result.errors[0][0], 4)
+        self.assertEqual(results, [(10, 9), (20, 19), (26, 25)])
+        self.assertEqual(len(get_servers()), 25)
+
+    def test_process_pool(self) -> None:
+        lines = [
+            json.dumps({"ip": str(i), "public_key": "ssh-rsa abcd"})
+            for i in range(50)
+        ]
+        result = import_servers(
+            iter(lines), "ndjson", 1, chunk_size=7, processes=2
+        )
+        self.assertEqual(result.servers, 50)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(
+            [s.ip for s in get_servers()], [str(i) for i in range(50)]
+        )
+
+    def test_duplicates(self) -> None:
+        lines = ["a ssh-rsa abcd\n"] * 3
+        result = import_servers(lines, "known_hosts", 1, processes=1)
+        self.assertEqual(result.servers, 1)
+        result = import_servers(lines, "known_hosts", 1, processes=1)
+        self.assertEqual(result.servers, 0)
+        self.assertEqual(len(get_servers()), 1)
+
+    @patch("pkrecv.models.server.dialect")
+    def test_duplicates_generic(self, mock: MagicMock) -> None:
+        mock.return_value = "generic"
+        lines = ["a ssh-rsa abcd\n", "b ssh-rsa abcd\n"] * 3
+        result = import_servers(lines, "known_hosts", 1, processes=1)
+        self.assertEqual(result.servers, 2)
+        self.assertEqual(result.errors, [])
+        self.assertEqual(len(get_servers()), 2)
+
+    def test_invalidates_known_hosts(self) -> None:
+        self.assertEqual(get_known_hosts(), "")
+        import_servers(["a ssh-rsa abcd"], "known_hosts", 1, processes=1)
+        self.assertEqual(get_known_hosts(), "a ssh-rsa abcd\n")
+
+    def test_invalid_token(self) -> None:
+        with self.assertRaises(ServerError):
+            import_servers([], "known_hosts", 2)
+
+    def test_invalid_format(self) -> None:
+        with self.assertRaises(ServerError):
+            import_servers([], "xyz", 1)
+
+
+class ExportServersTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        add_token("server", "desc")
+        lines = ["a ssh-rsa abcd x\n", "[b]:2222 ssh-ed25519 dGVzdA==\n"]
+        import_servers(lines, "known_hosts", 1, processes=1)
+
+    def test_known_hosts(self) -> None:
+        self.assertEqual(
+            list(export_servers("known_hosts", batch_size=1)),
+            ["a ssh-rsa abcd x\n", "[b]:2222 ssh-ed25519 dGVzdA==\n"]
+        )
+
+    def test_ndjson(self) -> None:
+        lines = list(export_servers("ndjson"))
+        self.assertEqual(json.loads(lines[1]), {
+            "ip": "b",
+            "port": 2222,
+            "key_type": "ssh-ed25519",
+            "key_data": "dGVzdA==",
+            "key_comment": "",
+        })
+
+    def test_round_trip(self) -> None:
+        lines = list(export_servers("ndjson"))
+        super().tearDown()
+        super().setUp()
+        add_token("server", "desc")
+        self.assertEqual(list(export_servers("ndjson")), [])
+
+        import_servers(lines, "ndjson", 1, processes=1)
+        self.assertEqual(list(export_servers("ndjson")), lines)
+
+    def test_invalid_format(self) -> None:
+        with self.assertRaises(ServerError):
+            list(export_servers("xyz"))
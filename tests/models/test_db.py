@@ -1,22 +1,266 @@
+import datetime
+import os
+import sqlite3
+import tempfile
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
 from flask import Flask
+from sqlalchemy.exc import OperationalError
 
-from pkrecv.models.db import DBError, Model, init_db
+from pkrecv.app import init_app
+from pkrecv.models.db import (
+    DBError,
+    Generation,
+    Model,
+    Serializer,
+    bump_generation,
+    db,
+    get_generation,
+    init_db,
+    read_bind,
+    replica_binds,
+    replica_reads,
+    retry_busy,
+    sqlite_options,
+    sqlite_pragmas,
+)
+from pkrecv.models.server import (
+    Server,
+    add_server,
+    delete_server,
+    serializer,
+)
+from pkrecv.models.token import Token, add_token, delete_token
+
+from ..helpers import FlaskTestCase
 
 
 class InitDBTest(TestCase):
     def test_invalid_db(self) -> None:
         app = Flask(__name__)
-        app.app_context().push()  # type: ignore
         app.config["SQLALCHEMY_DATABASE_URI"] = "..."
         app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
-        with self.assertRaises(DBError):
-            init_db(app)
+        with app.app_context():
+            with self.assertRaises(DBError):
+                init_db(app)
+
+
+class SQLiteTest(TestCase):
+    def tearDown(self) -> None:
+        sqlite_pragmas[:] = []
+
+    def test_options(self) -> None:
+        options = {
+            "journal_mode": "WAL",
+            "synchronous": False,
+            "busy_timeout": 1000,
+            "cache_size": -2000,
+            "mmap_size": 0,
+            "temp_store": "memory",
+            "busy_retries": 3,
+        }
+        self.assertEqual(
+            sqlite_options(options), [
+                "PRAGMA journal_mode=wal",
+                "PRAGMA synchronous=off",
+                "PRAGMA busy_timeout=1000",
+                "PRAGMA cache_size=-2000",
+                "PRAGMA mmap_size=0",
+                "PRAGMA temp_store=memory",
+            ]
+        )
+        self.assertEqual(
+            sqlite_options({"temp_store": True}), ["PRAGMA temp_store=1"]
+        )
+        self.assertEqual(sqlite_options({}), [])
+
+    def test_invalid_options(self) -> None:
+        invalid = [
+            {"journal_mode": "x; DROP TABLE server"},
+            {"journal_mode": False},
+            {"busy_timeout": "1000"},
+            {"cache_size": True},
+        ]
+        for options in invalid:
+            with self.assertRaises(DBError):
+                sqlite_options(options)
+
+    def test_applied(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            options = {
+                "sqlalchemy_database_uri": "sqlite:///{}".format(
+                    os.path.join(tmp, "db.sqlite")
+                ),
+                "sqlalchemy_track_modifications": False,
+            }
+            sqlite = {
+                "journal_mode": "wal",
+                "busy_timeout": 1234,
+            }
+            with init_app(options, sqlite=sqlite).app_context():
+                with db.engine.connect() as connection:
+                    mode = connection.execute("PRAGMA journal_mode").scalar()
+                    timeout = connection.execute(
+                        "PRAGMA busy_timeout"
+                    ).scalar()
+                self.assertEqual(mode, "wal")
+                self.assertEqual(timeout, 1234)
+                db.session.remove()
+                db.engine.dispose()
+
+
+class RetryBusyTest(TestCase):
+    def setUp(self) -> None:
+        self.app = Flask(__name__)
+        self.app.config["SQLITE_BUSY_DELAY"] = 0
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+
+    def tearDown(self) -> None:
+        self.ctx.pop()
+
+    @staticmethod
+    def error(message: str) -> OperationalError:
+        return OperationalError("", {}, sqlite3.OperationalError(message))
+
+    @patch("pkrecv.models.db.db.session")
+    def test_success(self, _: MagicMock) -> None:
+        f = MagicMock()
+        f.side_effect = [self.error("database is locked"), 123]
+        self.assertEqual(retry_busy(f)(1, x=2), 123)
+        self.assertEqual(f.call_count, 2)
+        f.assert_called_with(1, x=2)
+
+    @patch("pkrecv.models.db.db.session")
+    def test_retries(self, _: MagicMock) -> None:
+        self.app.config["SQLITE_BUSY_RETRIES"] = 2
+        f = MagicMock()
+        f.side_effect = self.error("database is locked")
+        with self.assertRaises(OperationalError):
+            retry_busy(f)()
+        self.assertEqual(f.call_count, 3)
+
+    @patch("pkrecv.models.db.db.session")
+    def test_other_error(self, _: MagicMock) -> None:
+        f = MagicMock()
+        f.side_effect = self.error("no such table: x")
+        with self.assertRaises(OperationalError):
+            retry_busy(f)()
+        self.assertEqual(f.call_count, 1)
 
 
 class ModelTest(TestCase):
     def test_invalid_type(self) -> None:
         with self.assertRaises(ValueError):
             Model._convert_value(None)  # pylint: disable=W0212
+
+
+class SerializerTest(FlaskTestCase):
+    def test_columns(self) -> None:
+        self.assertEqual(
+            Serializer(Token, ["token"]).keys,
+            ["id", "role", "description", "created"],
+        )
+
+    def test_same_as_orm(self) -> None:
+        add_token("server", "desc")
+        add_server("ip1", 1, "ssh-rsa data comment", 1)
+        add_server("ip2", 2, "ssh-ed25519 abcd", 1)
+
+        rows = serializer.all(serializer.select())
+        self.assertEqual(rows, [s.as_dict for s in Server.query.all()])
+
+    def test_filters(self) -> None:
+        add_token("server", "desc")
+        add_server("ip1", 1, "ssh-rsa data comment", 1)
+        add_server("ip2", 2, "ssh-ed25519 abcd", 1)
+
+        rows = serializer.all(serializer.select(ip="ip2", port=2))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0].key_data, "abcd")
+
+    def test_datetime(self) -> None:
+        created = datetime.datetime(2019, 1, 2, 3, 4, 5, 6)
+        rows = Serializer(Token).serialize([(1, "t", "admin", "", created)])
+        self.assertEqual(rows[0].created, "2019-01-02 03:04:05")
+
+
+class ReadBindTest(FlaskTestCase):
+    def test_no_replicas(self) -> None:
+        self.assertEqual(replica_binds, [])
+        with replica_reads():
+            self.assertIsNone(read_bind())
+
+    def test_binds(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False,
+            "sqlalchemy_binds": {"other": "sqlite:///"},
+        }
+        app = init_app(options, replicas={"uris": "sqlite:///a, sqlite:///b"})
+        self.assertEqual(replica_binds, ["replica0", "replica1"])
+        self.assertEqual(
+            app.config["SQLALCHEMY_BINDS"], {
+                "other": "sqlite:///",
+                "replica0": "sqlite:///a",
+                "replica1": "sqlite:///b",
+            }
+        )
+
+
+class GenerationTest(FlaskTestCase):
+    def test_initial(self) -> None:
+        self.assertEqual(get_generation(), 0)
+        self.assertEqual(Generation.query.count(), 1)
+
+    def test_init_existing(self) -> None:
+        bump_generation()
+        db.session.commit()
+        init_db(self.app)
+        self.assertEqual(get_generation(), 1)
+        self.assertEqual(Generation.query.count(), 1)
+
+    def test_rollback(self) -> None:
+        bump_generation()
+        db.session.rollback()
+        self.assertEqual(get_generation(), 0)
+
+    def test_changes(self) -> None:
+        add_token("server", "desc")
+        self.assertEqual(get_generation(), 1)
+
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(get_generation(), 2)
+
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(get_generation(), 2)
+
+        delete_server(1)
+        self.assertEqual(get_generation(), 3)
+
+        delete_token(1)
+        self.assertEqual(get_generation(), 4)
+
+
+class QueryTimerTest(FlaskTestCase):
+    def test_failed_statement(self) -> None:
+        with patch("pkrecv.metrics.registry") as registry:
+            registry.enabled = True
+            with self.assertRaises(OperationalError):
+                db.session.execute("SELECT * FROM missing")
+            db.session.rollback()
+            registry.observe.assert_not_called()
+
+            db.session.execute("SELECT 1")
+            registry.observe.assert_called_once()
+            name, elapsed = registry.observe.call_args[0]
+            self.assertEqual(name, "pkrecv_db_query_duration_seconds")
+            self.assertGreaterEqual(elapsed, 0)
+            self.assertEqual(
+                registry.observe.call_args[1], {"operation": "SELECT"}
+            )
+
+        connection = db.session.connection()
+        self.assertNotIn("query_start", connection.info)
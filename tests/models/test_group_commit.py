@@ -0,0 +1,205 @@
+import threading
+import time
+from typing import Any, Callable, List
+from unittest.mock import MagicMock, patch
+
+from pkrecv.models import group_commit
+from pkrecv.models.group_commit import GroupCommit, GroupCommitError
+from pkrecv.models.server import (
+    ServerError,
+    add_server,
+    get_servers,
+    insert_servers,
+    new_server,
+)
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase, ThreadedFlaskTestCase
+
+
+class GroupCommitTest(ThreadedFlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        add_token("server", "desc")
+        self.group = GroupCommit()
+        self.errors = []  # type: List[Any]
+
+    def run_threads(self, targets: List[Callable]) -> None:
+        def run(target: Callable) -> None:
+            with self.app.app_context():
+                try:
+                    target()
+                    self.errors.append(None)
+                except ServerError as e:
+                    self.errors.append(str(e))
+
+        threads = [threading.Thread(target=run, args=(t, )) for t in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def submitter(self, ip: str, window: float, size: int) -> Callable:
+        server = new_server(ip, 22, "ssh-rsa abcd", 1)
+        return lambda: self.group.submit(
+            lambda: insert_servers([server]), window, size
+        )
+
+    def test_coalesced(self) -> None:
+        targets = [self.submitter(str(i), 0.5, 8) for i in range(8)]
+        with patch.object(
+                group_commit, "commit_all", wraps=group_commit.commit_all
+        ) as mock:
+            self.run_threads(targets)
+
+        self.assertEqual(mock.call_count, 1)
+        self.assertEqual(len(mock.call_args[0][0]), 8)
+        self.assertEqual(self.errors, [None] * 8)
+        self.assertEqual(len(get_servers()), 8)
+
+    def test_size(self) -> None:
+        targets = [self.submitter(str(i), 0.1, 2) for i in range(6)]
+        with patch.object(
+                group_commit, "commit_all", wraps=group_commit.commit_all
+        ) as mock:
+            self.run_threads(targets)
+
+        self.assertGreaterEqual(mock.call_count, 3)
+        for call in mock.call_args_list:
+            self.assertLessEqual(len(call[0][0]), 2)
+        self.assertEqual(len(get_servers()), 6)
+
+    def test_error(self) -> None:
+        def fail() -> None:
+            raise ServerError("xyz")
+
+        targets = [self.submitter(str(i), 0.5, 4) for i in range(3)]
+        targets.append(lambda: self.group.submit(fail, 0.5, 4))
+        self.run_threads(targets)
+
+        self.assertEqual(sorted(self.errors, key=str), [None] * 3 + ["xyz"])
+        self.assertEqual(len(get_servers()), 3)
+
+    def test_single_error(self) -> None:
+        def fail() -> None:
+            raise ServerError("xyz")
+
+        with self.assertRaises(ServerError):
+            self.group.submit(fail, 0, 4)
+
+    def test_hand_over(self) -> None:
+        started = threading.Event()
+        release = threading.Event()
+        queued = []  # type: List[bool]
+        threads = []  # type: List[Any]
+
+        def submitter(ip: str) -> Callable:
+            server = new_server(ip, 22, "ssh-rsa abcd", 1)
+
+            def work() -> None:
+                threads.append((ip, threading.current_thread().name))
+                if ip == "0":
+                    started.set()
+                    release.wait()
+                insert_servers([server])
+
+            def submit() -> None:
+                threading.current_thread().name = ip
+                self.group.submit(work, 0, 1)
+
+            return submit
+
+        def release_queued() -> None:
+            # The others queue while the first leader commits.
+            started.wait()
+            deadline = time.monotonic() + 5
+            while len(getattr(self.group, "_pending")) < 5:
+                if time.monotonic() > deadline:
+                    break
+                time.sleep(0.01)
+            queued.append(len(getattr(self.group, "_pending")) == 5)
+            release.set()
+
+        targets = [submitter(str(i)) for i in range(6)]
+        first = threading.Thread(target=self.run_threads, args=(targets[:1], ))
+        first.start()
+        started.wait()
+        self.run_threads(targets[1:] + [release_queued])
+        first.join()
+
+        # Each of them is committed by its own thread rather than by the
+        # first leader.
+        self.assertEqual(queued, [True])
+        self.assertEqual(len(threads), 6)
+        for ip, name in threads:
+            self.assertEqual(ip, name)
+        self.assertEqual(len(get_servers()), 6)
+
+    def test_interrupted(self) -> None:
+        class Interrupt(BaseException):
+            pass
+
+        def interrupt() -> None:
+            raise Interrupt()
+
+        errors = []  # type: List[str]
+
+        def run(work: Callable) -> None:
+            with self.app.app_context():
+                try:
+                    self.group.submit(work, 0.5, 4)
+                    errors.append("")
+                except (Interrupt, GroupCommitError) as e:
+                    errors.append(type(e).__name__)
+
+        def work() -> None:
+            pass
+
+        targets = [work] * 3 + [interrupt]
+        threads = [threading.Thread(target=run, args=(t, )) for t in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors.count("Interrupt"), 1)
+        self.assertEqual(errors.count("GroupCommitError"), 3)
+
+        self.submitter("ip", 0, 4)()
+        self.assertEqual(len(get_servers()), 1)
+
+
+class AddServerGroupCommitTest(FlaskTestCase):
+    @patch("pkrecv.models.server.group_commit")
+    def test_enabled(self, mock: MagicMock) -> None:
+        self.app.config["GROUP_COMMIT_WINDOW"] = 5
+        self.app.config["GROUP_COMMIT_SIZE"] = 10
+
+        add_server("ip", 22, "ssh-rsa abcd", 1)
+        work, window, size = mock.submit.call_args[0]
+        self.assertEqual(window, 0.005)
+        self.assertEqual(size, 10)
+        self.assertEqual(len(get_servers()), 0)
+
+        add_token("server", "desc")
+        work()
+        self.assertEqual(len(get_servers()), 1)
+
+
+class AddServerConcurrentTest(ThreadedFlaskTestCase):
+    def test_concurrent(self) -> None:
+        self.app.config["GROUP_COMMIT_WINDOW"] = 100
+        add_token("server", "desc")
+
+        def run(i: int) -> None:
+            with self.app.app_context():
+                add_server(str(i), 22, "ssh-rsa abcd", 1)
+
+        threads = [threading.Thread(target=run, args=(i, )) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(get_servers()), 5)
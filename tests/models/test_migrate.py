@@ -0,0 +1,192 @@
+import sqlite3
+from unittest import skipUnless
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import SQLAlchemyError
+
+from pkrecv.models.db import DBError, SchemaVersion, db
+from pkrecv.models.migrate import (
+    create_index,
+    get_index,
+    get_version,
+    latest_version,
+    migrate,
+    seed_server_change,
+)
+from pkrecv.models.server import (
+    Server,
+    add_server,
+    fingerprint,
+    get_changes,
+    get_servers,
+)
+from pkrecv.models.token import add_token
+
+from ..helpers import FlaskTestCase
+
+
+def server_indexes() -> list:
+    return sorted(i["name"] for i in inspect(db.engine).get_indexes("server"))
+
+
+class MigrateTest(FlaskTestCase):
+    def test_fresh(self) -> None:
+        self.assertEqual(get_version(), latest_version())
+        self.assertEqual(migrate(), [])
+
+    def test_legacy(self) -> None:
+        for index in Server.__table__.indexes:
+            index.drop(db.engine)
+        db.engine.execute(SchemaVersion.__table__.delete())
+        self.assertEqual(get_version(), 0)
+        self.assertEqual(server_indexes(), [])
+
+        applied = migrate()
+        self.assertEqual([m.version for m in applied], [1, 2, 3, 4])
+        self.assertEqual(get_version(), latest_version())
+        self.assertEqual(
+            server_indexes(), [
+                "ix_server_created",
+                "ix_server_fingerprint",
+                "ix_server_ip",
+                "ix_server_key_type",
+                "ix_server_token_id",
+                "uq_server_key",
+            ]
+        )
+
+    def test_idempotent(self) -> None:
+        db.engine.execute(SchemaVersion.__table__.delete())
+        self.assertEqual([m.version for m in migrate()], [1, 2, 3, 4])
+        self.assertEqual(len(server_indexes()), 6)
+
+    def test_duplicates(self) -> None:
+        get_index(Server, "uq_server_key").drop(db.engine)
+        db.engine.execute(SchemaVersion.__table__.delete())
+
+        add_token("server", "desc")
+        rows = [
+            ("10.0.0.1", 22, "ssh-rsa", "abcd", "1"),
+            ("10.0.0.1", 22, "ssh-rsa", "abcd", "2"),
+            ("10.0.0.2", 22, "ssh-rsa", "abcd", "3"),
+            ("10.0.0.1", 22, "ssh-rsa", "abcd", "4"),
+            ("10.0.0.1", 23, "ssh-rsa", "abcd", "5"),
+        ]
+        for ip, port, key_type, key_data, key_comment in rows:
+            db.engine.execute(
+                Server.__table__.insert(),
+                ip=ip,
+                port=port,
+                key_type=key_type,
+                key_data=key_data,
+                key_comment=key_comment,
+                fingerprint="",
+                token_id=1,
+            )
+
+        migrate()
+        servers = get_servers()
+        self.assertEqual([s.key_comment for s in servers], ["1", "3", "5"])
+        self.assertTrue("uq_server_key" in server_indexes())
+
+    @skipUnless(
+        sqlite3.sqlite_version_info >= (3, 35), "DROP COLUMN is unsupported"
+    )
+    def test_fingerprint(self) -> None:
+        get_index(Server, "ix_server_fingerprint").drop(db.engine)
+        db.engine.execute("ALTER TABLE server DROP COLUMN fingerprint")
+        db.engine.execute(SchemaVersion.__table__.update().values(version=2))
+
+        add_token("server", "desc")
+        for i in range(1001):
+            db.engine.execute(
+                "INSERT INTO server "
+                "(ip, port, key_type, key_data, key_comment, created, "
+                "token_id) VALUES (?, 22, 'ssh-rsa', ?, '', "
+                "CURRENT_TIMESTAMP, 1)", str(i), "abcd" if i else "a"
+            )
+
+        self.assertEqual([m.version for m in migrate()], [3, 4])
+        self.assertTrue("ix_server_fingerprint" in server_indexes())
+
+        servers = get_servers()
+        self.assertEqual(servers[0].fingerprint, "")
+        self.assertEqual(
+            {s.fingerprint for s in servers[1:]}, {fingerprint("abcd")}
+        )
+
+    def test_server_change(self) -> None:
+        db.engine.execute(SchemaVersion.__table__.update().values(version=3))
+
+        add_token("server", "desc")
+        for ip in ["10.0.0.1", "10.0.0.2"]:
+            db.engine.execute(
+                Server.__table__.insert(),
+                ip=ip,
+                port=22,
+                key_type="ssh-rsa",
+                key_data="abcd",
+                key_comment="",
+                fingerprint=fingerprint("abcd"),
+                token_id=1,
+            )
+
+        self.assertEqual([m.version for m in migrate()], [4])
+        changes = get_changes(0)
+        self.assertEqual([c.action for c in changes], ["insert", "insert"])
+        self.assertEqual([c.ip for c in changes], ["10.0.0.1", "10.0.0.2"])
+        self.assertEqual([c.server_id for c in changes], [1, 2])
+
+        with db.engine.connect() as connection:
+            seed_server_change(connection)
+        self.assertEqual(len(get_changes(0)), 2)
+
+    def test_server_change_logged(self) -> None:
+        db.engine.execute(SchemaVersion.__table__.update().values(version=3))
+
+        add_token("server", "desc")
+        db.engine.execute(
+            Server.__table__.insert(),
+            ip="10.0.0.1",
+            port=22,
+            key_type="ssh-rsa",
+            key_data="abcd",
+            key_comment="",
+            fingerprint=fingerprint("abcd"),
+            token_id=1,
+        )
+
+        # A registration is accepted before the migration runs.
+        add_server("10.0.0.2", 22, "ssh-rsa abcd", 1)
+
+        self.assertEqual([m.version for m in migrate()], [4])
+        changes = get_changes(0)
+        self.assertEqual([c.ip for c in changes], ["10.0.0.2", "10.0.0.1"])
+        self.assertEqual([c.server_id for c in changes], [2, 1])
+
+    def test_error(self) -> None:
+        db.engine.execute(SchemaVersion.__table__.delete())
+        with patch("pkrecv.models.migrate.create_index") as mock:
+            mock.side_effect = SQLAlchemyError("x")
+            with self.assertRaises(DBError):
+                migrate()
+        self.assertEqual(get_version(), 0)
+
+    @patch("pkrecv.models.migrate.inspect")
+    def test_create_index_postgresql(self, mock: MagicMock) -> None:
+        mock.return_value.get_indexes.return_value = []
+        connection = MagicMock()
+        connection.dialect.name = "postgresql"
+        index = get_index(Server, "ix_server_ip")
+
+        with patch.object(index, "create") as create:
+            create_index(connection, index)
+            create.assert_called_once_with(
+                connection.execution_options.return_value
+            )
+        self.assertFalse(index.dialect_options["postgresql"]["concurrently"])
+
+    def test_unknown_index(self) -> None:
+        with self.assertRaises(DBError):
+            get_index(Server, "ix_server_xyz")
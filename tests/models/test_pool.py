@@ -0,0 +1,106 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from pkrecv.app import AppError, init_app
+from pkrecv.models.db import db
+from pkrecv.models.pool import (
+    InstrumentedQueuePool,
+    engine_options,
+    stats,
+    warm_up,
+)
+
+from ..helpers import push_context
+
+
+class EngineOptionsTest(TestCase):
+    def test_empty(self) -> None:
+        self.assertEqual(engine_options({}), {})
+
+    def test_options(self) -> None:
+        config = {
+            "POOL_SIZE": 5,
+            "POOL_MAX_OVERFLOW": 10,
+            "POOL_TIMEOUT": 2.5,
+            "POOL_RECYCLE": 3600,
+            "POOL_PRE_PING": True,
+            "POOL_WARMUP": 2,
+        }
+        self.assertEqual(
+            engine_options(config), {
+                "pool_size": 5,
+                "max_overflow": 10,
+                "pool_timeout": 2.5,
+                "pool_recycle": 3600,
+                "pool_pre_ping": True,
+                "poolclass": InstrumentedQueuePool,
+            }
+        )
+
+    def test_no_sizing(self) -> None:
+        self.assertEqual(
+            engine_options({"POOL_PRE_PING": False}), {"pool_pre_ping": False}
+        )
+
+    def test_invalid(self) -> None:
+        invalid = [
+            {"POOL_SIZE": "5"},
+            {"POOL_SIZE": True},
+            {"POOL_TIMEOUT": "x"},
+            {"POOL_PRE_PING": 1},
+            {"POOL_WARMUP": 1.5},
+        ]
+        for config in invalid:
+            with self.assertRaises(ValueError):
+                engine_options(config)
+
+    def test_init_app(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False,
+        }
+        with self.assertRaises(AppError):
+            init_app(options, pool={"size": "x"})
+
+
+class InstrumentedPoolTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.options = {
+            "sqlalchemy_database_uri": "sqlite:///{}".format(
+                os.path.join(self.tmp.name, "db.sqlite")
+            ),
+            "sqlalchemy_track_modifications": False,
+        }
+
+    def tearDown(self) -> None:
+        db.session.remove()
+        db.engine.dispose()
+        self.tmp.cleanup()
+
+    def test_counters(self) -> None:
+        stats.reset()
+        push_context(
+            self, init_app(self.options, pool={"size": 2, "max_overflow": 1})
+        )
+        self.assertIsInstance(db.engine.pool, InstrumentedQueuePool)
+
+        warm_up(db.engine, 3)
+
+        # The overflow connection is closed when it is checked in.
+        counters = stats.as_dict()
+        self.assertEqual(counters.connects, 3)
+        self.assertEqual(counters.closes, 1)
+        self.assertEqual(counters.connections, 2)
+        self.assertGreaterEqual(counters.checkouts, 3)
+        self.assertEqual(counters.checked_out, 0)
+        self.assertEqual(counters.max_overflow, 1)
+        self.assertGreaterEqual(counters.max_connection_age, 0)
+
+        db.engine.dispose()
+        self.assertEqual(stats.as_dict().connections, 0)
+
+    def test_default_pool(self) -> None:
+        push_context(self, init_app(self.options))
+        self.assertNotIsInstance(db.engine.pool, InstrumentedQueuePool)
@@ -1,15 +1,33 @@
+import threading
+import time
+from typing import Any, List
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+
+from pkrecv.models.db import db, get_generation
 from pkrecv.models.server import (
+    Server,
+    ServerBatchError,
     ServerError,
     add_server,
+    add_servers,
     delete_server,
+    fingerprint,
+    get_changes,
     get_servers,
+    get_shared_fingerprints,
+    id_ranges,
+    insert_servers,
+    new_server,
+    registered_keys,
     split_key,
 )
 from pkrecv.models.token import add_token
 
-from ..helpers import FlaskTestCase
+from ..helpers import FlaskTestCase, ThreadedFlaskTestCase
 
 
 class AddServerTest(FlaskTestCase):
@@ -42,6 +60,80 @@ class AddServerTest(FlaskTestCase):
         self.assertEqual(servers[0].key_comment, "comment")
         self.assertEqual(servers[0].token_id, 1)
 
+    def test_duplicate(self) -> None:
+        add_token("server", "desc")
+        add_server("ip", 22, "ssh-rsa data comment", 1)
+        add_server("ip", 22, "ssh-rsa data other", 1)
+        add_server("ip", 22, "ssh-rsa data", 1)
+        add_server("ip", 2222, "ssh-rsa data", 1)
+
+        servers = get_servers()
+        self.assertEqual(len(servers), 2)
+        self.assertEqual(servers[0].port, 22)
+        self.assertEqual(servers[0].key_comment, "comment")
+        self.assertEqual(servers[1].port, 2222)
+
+    @patch("pkrecv.models.server.dialect")
+    def test_duplicate_generic(self, mock: MagicMock) -> None:
+        mock.return_value = "generic"
+
+        add_token("server", "desc")
+        add_server("ip", 22, "ssh-rsa data comment", 1)
+        add_server("ip", 22, "ssh-rsa data comment", 1)
+        add_servers("ip", 22, ["ssh-rsa data", "ssh-rsa abcd"], 1)
+
+        servers = get_servers()
+        self.assertEqual(len(servers), 2)
+        self.assertEqual(servers[1].key_data, "abcd")
+
+    @patch("pkrecv.models.server.dialect")
+    def test_duplicate_in_batch(self, mock: MagicMock) -> None:
+        add_token("server", "desc")
+        for name in ["sqlite", "generic"]:
+            mock.return_value = name
+            add_servers(name, 22, ["ssh-rsa data a", "ssh-rsa data b"], 1)
+
+        servers = get_servers()
+        self.assertEqual([s.ip for s in servers], ["sqlite", "generic"])
+        self.assertEqual([s.key_comment for s in servers], ["a", "a"])
+
+    @patch("pkrecv.models.server.dialect")
+    def test_generic_queries(self, mock: MagicMock) -> None:
+        mock.return_value = "generic"
+        add_token("server", "desc")
+        add_servers("ip", 22, ["ssh-rsa abcd", "ssh-rsa data"], 1)
+
+        statements = []  # type: List[str]
+
+        def record(*args: Any) -> None:
+            statements.append(args[2])
+
+        keys = ["ssh-rsa abcd", "ssh-rsa data", "ssh-rsa efgh"]
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            add_servers("ip", 22, keys, 1)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        # One lookup of registered keys and one of the inserted ids.
+        lookups = [s for s in statements if s.startswith("SELECT server.ip")]
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(len(get_servers()), 3)
+
+    @patch("pkrecv.models.server.dialect")
+    def test_postgresql(self, mock: MagicMock) -> None:
+        mock.return_value = "postgresql"
+
+        with patch("pkrecv.models.server.db.session.execute") as execute:
+            add_server("ip", 22, "ssh-rsa data comment", 1)
+
+        stmts = [
+            str(c[0][0].compile(dialect=postgresql.dialect()))
+            for c in execute.call_args_list
+        ]
+        conflict = "ON CONFLICT (ip, port, key_type, key_data) DO NOTHING"
+        self.assertTrue(any(conflict in stmt for stmt in stmts))
+
     def test_strip_key(self) -> None:
         add_token("server", "desc")
         add_server("ip", 1234, "   ssh-rsa    data     comment    \n\n\n", 1)
@@ -52,6 +144,49 @@ class AddServerTest(FlaskTestCase):
         self.assertEqual(servers[0].key_comment, "comment")
 
 
+class AddServersTest(FlaskTestCase):
+    def test_invalid_key(self) -> None:
+        add_token("server", "desc")
+
+        keys = ["ssh-rsa data", "", "ssh-ed25519 abc", "ssh-ed25519 data"]
+        with self.assertRaises(ServerBatchError) as cm:
+            add_servers("ip", 1234, keys, 1)
+
+        self.assertEqual(
+            cm.exception.errors,
+            [None, "invalid public key", "abc is not a valid key", None]
+        )
+        self.assertEqual(len(get_servers()), 0)
+
+    def test_success(self) -> None:
+        add_token("server", "desc")
+
+        keys = ["ssh-rsa data c1", "ssh-ed25519 abcd", "ssh-dss dGVzdA== c3"]
+        add_servers("ip", 1234, keys, 1)
+
+        servers = get_servers()
+        self.assertEqual(len(servers), 3)
+        self.assertEqual(servers[0].key_type, "ssh-rsa")
+        self.assertEqual(servers[0].key_comment, "c1")
+        self.assertEqual(servers[1].key_type, "ssh-ed25519")
+        self.assertEqual(servers[1].key_data, "abcd")
+        self.assertEqual(servers[2].key_type, "ssh-dss")
+        self.assertEqual(servers[2].ip, "ip")
+        self.assertEqual(servers[2].port, 1234)
+        self.assertEqual(servers[2].token_id, 1)
+
+    def test_duplicate(self) -> None:
+        add_token("server", "desc")
+        add_server("ip", 1234, "ssh-rsa data", 1)
+
+        keys = ["ssh-rsa data", "ssh-ed25519 abcd", "ssh-ed25519 abcd"]
+        add_servers("ip", 1234, keys, 1)
+
+        servers = get_servers()
+        self.assertEqual(len(servers), 2)
+        self.assertEqual(servers[1].key_type, "ssh-ed25519")
+
+
 class DeleteServerTest(FlaskTestCase):
     def test_invalid_id(self) -> None:
         with self.assertRaises(ServerError):
@@ -110,6 +245,197 @@ class GetServersTest(FlaskTestCase):
         servers = get_servers()
         self.assertEqual(len(servers), 10)
 
+    def test_limit_after(self) -> None:
+        add_token("server", "desc")
+
+        for i in range(10):
+            add_server("ip", i, "ssh-rsa data comment", 1)
+
+        servers = get_servers(limit=3, after=4)
+        self.assertEqual([s.id for s in servers], [5, 6, 7])
+
+        servers = get_servers(limit=3, after=9)
+        self.assertEqual([s.id for s in servers], [10])
+
+
+class FingerprintTest(FlaskTestCase):
+    def test_openssh(self) -> None:
+        # ssh-keygen -lf
+        key_data = (
+            "AAAAC3NzaC1lZDI1NTE5AAAAIE37Jw2juU7JhAp70apa6KoPFJkfeKWZxXq2DWXj"
+            "MDRI"
+        )
+        self.assertEqual(
+            fingerprint(key_data),
+            "SHA256:DqIQ2EqrWy3r+CfCvldztq6raX1J2ArRS35ME7S140A"
+        )
+
+    def test_add_server(self) -> None:
+        add_token("server", "desc")
+        add_server("ip", 22, "ssh-rsa dGVzdA== comment", 1)
+        self.assertEqual(
+            get_servers()[0].fingerprint, fingerprint("dGVzdA==")
+        )
+
+    def test_index(self) -> None:
+        for filters in ["fingerprint = 'x'", "fingerprint = 'x' AND ip = 'y'"]:
+            plan = db.engine.execute(
+                "EXPLAIN QUERY PLAN SELECT ip FROM server WHERE " + filters
+            ).fetchall()
+            self.assertIn("INDEX ix_server_fingerprint", plan[0][-1])
+
+    def test_shared(self) -> None:
+        add_token("server", "desc")
+        add_server("1", 22, "ssh-rsa abcd", 1)
+        add_server("1", 23, "ssh-rsa abcd", 1)
+        self.assertEqual(get_shared_fingerprints(), [])
+
+        add_server("2", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(
+            get_shared_fingerprints(),
+            [{"fingerprint": fingerprint("abcd"), "ips": ["1", "2"]}]
+        )
+
+    def test_shared_empty(self) -> None:
+        add_token("server", "desc")
+        add_server("1", 22, "ssh-rsa YQ==", 1)
+        add_server("2", 22, "ssh-rsa Yg==", 1)
+        db.session.execute(Server.__table__.update().values(fingerprint=""))
+        db.session.commit()
+        self.assertEqual(get_shared_fingerprints(), [])
+
+
+class GetChangesTest(FlaskTestCase):
+    def test_insert_delete(self) -> None:
+        add_token("server", "desc")
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        add_servers("10.0.0.2", 22, ["ssh-rsa YQ==", "ssh-rsa Yg=="], 1)
+        delete_server(1)
+
+        changes = get_changes(0)
+        self.assertEqual(
+            [(c.seq, c.action, c.server_id) for c in changes], [
+                (1, "insert", 1),
+                (2, "insert", 2),
+                (3, "insert", 3),
+                (4, "delete", 1),
+            ]
+        )
+        self.assertEqual(changes[3].ip, "10.0.0.1")
+        self.assertEqual(changes[3].key_data, "abcd")
+        self.assertEqual(changes[3].fingerprint, fingerprint("abcd"))
+
+    def test_since_limit(self) -> None:
+        add_token("server", "desc")
+        for i in range(5):
+            add_server(str(i), 22, "ssh-rsa abcd", 1)
+
+        changes = get_changes(1, limit=2)
+        self.assertEqual([c.seq for c in changes], [2, 3])
+        self.assertEqual(get_changes(5), [])
+
+    def test_duplicate(self) -> None:
+        add_token("server", "desc")
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        self.assertEqual(len(get_changes(0)), 1)
+
+    def test_ignored_rows(self) -> None:
+        add_token("server", "desc")
+        add_server("10.0.0.1", 22, "ssh-rsa YQ==", 1)
+        keys = ["ssh-rsa abcd", "ssh-rsa YQ==", "ssh-rsa Yg=="]
+        add_servers("10.0.0.1", 22, keys, 1)
+
+        servers = [(s.id, s.key_data) for s in get_servers()]
+        changes = [(c.server_id, c.key_data) for c in get_changes(0)]
+        self.assertEqual(changes, servers)
+
+    @patch("pkrecv.models.server.dialect")
+    def test_concurrent_generic(self, mock: MagicMock) -> None:
+        mock.return_value = "generic"
+        add_token("server", "desc")
+        add_server("10.0.0.1", 22, "ssh-rsa YQ==", 1)
+
+        # The key is registered after it was looked up.
+        lookups = [{}]  # type: List[Any]
+        with patch("pkrecv.models.server.registered_keys") as lookup:
+            lookup.side_effect = lambda rows: (
+                lookups.pop() if lookups else registered_keys(rows)
+            )
+            keys = ["ssh-rsa abcd", "ssh-rsa YQ==", "ssh-rsa Yg=="]
+            add_servers("10.0.0.1", 22, keys, 1)
+
+        servers = [(s.id, s.key_data) for s in get_servers()]
+        self.assertEqual(len(servers), 3)
+        changes = [(c.server_id, c.key_data) for c in get_changes(0)]
+        self.assertEqual(changes, servers)
+
+    def test_written_on_commit(self) -> None:
+        add_token("server", "desc")
+        generation = get_generation()
+
+        statements = []  # type: List[str]
+
+        def record(*args: Any) -> None:
+            statements.append(args[2])
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            insert_servers([new_server("10.0.0.1", 22, "ssh-rsa abcd", 1)])
+            self.assertFalse(any("generation" in s for s in statements))
+            self.assertFalse(any("server_change" in s for s in statements))
+            db.session.commit()
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+
+        self.assertTrue(statements[-2].startswith("UPDATE generation"))
+        self.assertTrue(statements[-1].startswith("INSERT INTO server_change"))
+        self.assertEqual(get_generation(), generation + 1)
+        self.assertEqual(len(get_changes(0)), 1)
+
+    def test_rollback(self) -> None:
+        add_token("server", "desc")
+        generation = get_generation()
+
+        insert_servers([new_server("10.0.0.1", 22, "ssh-rsa abcd", 1)])
+        db.session.rollback()
+        db.session.commit()
+
+        self.assertEqual(get_generation(), generation)
+        self.assertEqual(get_changes(0), [])
+        self.assertNotIn("server_changes", db.session.info)
+
+    def test_id_ranges(self) -> None:
+        self.assertEqual(id_ranges([]), [])
+        self.assertEqual(
+            id_ranges([7, 1, 2, 3, 5, 6, 9]), [(1, 3), (5, 7), (9, 9)]
+        )
+
+    def test_wait_timeout(self) -> None:
+        start = time.monotonic()
+        self.assertEqual(get_changes(0, wait=0.2, interval=0.05), [])
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+
+
+class GetChangesWaitTest(ThreadedFlaskTestCase):
+    def test_notify(self) -> None:
+        add_token("server", "desc")
+        result = []  # type: list
+
+        def run() -> None:
+            with self.app.app_context():
+                result.extend(get_changes(0, wait=10, interval=10))
+
+        thread = threading.Thread(target=run)
+        start = time.monotonic()
+        thread.start()
+        time.sleep(0.1)
+        add_server("10.0.0.1", 22, "ssh-rsa abcd", 1)
+        thread.join()
+
+        self.assertLess(time.monotonic() - start, 5)
+        self.assertEqual([c.ip for c in result], ["10.0.0.1"])
+
 
 class SplitKeyTest(TestCase):
     def test_empty(self) -> None:
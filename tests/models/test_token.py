@@ -1,15 +1,24 @@
 import re
+from typing import Any, List
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
+from sqlalchemy import event
+
+from pkrecv.models.db import bump_generation, db
 from pkrecv.models.token import (
+    SignedTokens,
     Token,
     TokenError,
     add_token,
+    cache,
     delete_token,
     generate_token,
     get_tokens,
+    lookup_token,
+    negative_cache,
     sha256,
+    signed_tokens,
 )
 
 from ..helpers import FlaskTestCase
@@ -117,6 +126,216 @@ class GetTokensTest(FlaskTestCase):
         self.assertEqual(len(get_tokens()), 13)
 
 
+class LookupTokenTest(FlaskTestCase):
+    def test_success(self) -> None:
+        token = add_token("server", "desc")
+
+        t = lookup_token(token)
+        self.assertEqual(t.id, 1)
+        self.assertEqual(t.role, "server")
+        self.assertEqual(len(cache), 1)
+
+        with patch("pkrecv.models.token.serializer") as mock:
+            self.assertEqual(lookup_token(token), t)
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def test_negative(self) -> None:
+        self.assertIsNone(lookup_token("abcd"))
+        self.assertEqual(len(negative_cache), 1)
+
+        with patch("pkrecv.models.token.serializer") as mock:
+            self.assertIsNone(lookup_token("abcd"))
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def test_delete_invalidates(self) -> None:
+        token = add_token("admin", "desc")
+        self.assertEqual(lookup_token(token).id, 1)
+
+        delete_token(1)
+        self.assertIsNone(lookup_token(token))
+
+    @patch("pkrecv.models.token.generate_token")
+    def test_add_invalidates(self, mock: MagicMock) -> None:
+        mock.return_value = b"abcd"
+        self.assertIsNone(lookup_token("abcd"))
+
+        add_token("admin", "desc")
+        self.assertEqual(lookup_token("abcd").id, 1)
+
+
+class SignedTokenTest(FlaskTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        signed_tokens.configure("secret", 30)
+
+    def test_no_secret(self) -> None:
+        signed_tokens.configure(None, 30)
+        with self.assertRaises(TokenError):
+            add_token("admin", "desc", signed=True)
+        self.assertEqual(get_tokens(), [])
+
+    def test_success(self) -> None:
+        add_token("server", "desc")
+        token = add_token("admin", "desc", signed=True)
+        self.assertEqual(len(token.split(".")), 2)
+
+        t = lookup_token(token)
+        self.assertEqual(t, {"id": 2, "role": "admin"})
+
+        with patch("pkrecv.models.token.db.session.execute") as mock:
+            self.assertEqual(lookup_token(token), t)
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def test_invalid(self) -> None:
+        token = add_token("server", "desc", signed=True)
+        payload, signature = token.split(".")
+        self.assertIsNone(lookup_token(payload + "." + signature[1:]))
+        self.assertIsNone(lookup_token("a.b"))
+        self.assertIsNone(lookup_token("."))
+
+        signed_tokens.configure("other", 30)
+        self.assertIsNone(lookup_token(token))
+
+    def test_role(self) -> None:
+        token = add_token("server", "desc", signed=True)
+        Token.query.filter_by(id=1).update({"role": "admin"})
+        signed_tokens.invalidate()
+        self.assertIsNone(lookup_token(token))
+
+    def test_delete(self) -> None:
+        token = add_token("admin", "desc", signed=True)
+        self.assertEqual(lookup_token(token).id, 1)
+
+        delete_token(1)
+        self.assertIsNone(lookup_token(token))
+
+        # The id of the deleted token is reused.
+        new = add_token("admin", "desc", signed=True)
+        self.assertEqual(lookup_token(new).id, 1)
+        self.assertIsNone(lookup_token(token))
+
+    def test_refresh(self) -> None:
+        token = add_token("admin", "desc", signed=True)
+        self.assertEqual(lookup_token(token).id, 1)
+
+        # A deletion in another process is noticed after the interval.
+        Token.query.filter_by(id=1).delete()
+        self.assertEqual(lookup_token(token).id, 1)
+
+        signed_tokens.configure("secret", 0)
+        self.assertIsNone(lookup_token(token))
+
+    def add_elsewhere(self) -> str:
+        """
+        Add a signed token as another process would, without
+        invalidating the tokens in this one.
+        """
+        t = Token(token="", role="admin", description="desc")
+        db.session.add(t)
+        db.session.flush()
+        token = signed_tokens.dumps(t.id, "admin")
+        t.token = sha256(bytes(token, "utf-8"))
+        bump_generation()
+        db.session.commit()
+        return token
+
+    def test_miss(self) -> None:
+        signed_tokens.configure("secret", 30, 0)
+        self.assertEqual(lookup_token(add_token("admin", "", True)).id, 1)
+        self.assertEqual(lookup_token(self.add_elsewhere()).id, 2)
+
+    def test_miss_interval(self) -> None:
+        signed_tokens.configure("secret", 30, 30)
+        self.assertEqual(lookup_token(add_token("admin", "", True)).id, 1)
+
+        token = self.add_elsewhere()
+        self.assertIsNone(lookup_token(token))
+        with patch("pkrecv.models.token.db.session.execute") as mock:
+            self.assertIsNone(lookup_token(token))
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def test_deleted_id(self) -> None:
+        signed_tokens.configure("secret", 30, 0)
+        token = add_token("admin", "", True)
+        add_token("admin", "", True)
+        delete_token(1)
+        self.assertIsNone(lookup_token(token))
+
+        # Ids below the highest known one are never reloaded for.
+        with patch("pkrecv.models.token.db.session.execute") as mock:
+            self.assertIsNone(lookup_token(token))
+            self.assertEqual(len(mock.mock_calls), 0)
+
+    def statements(self, token: str) -> List[str]:
+        """
+        Look up a token and retrieve the token queries that were
+        executed.
+        """
+        statements = []  # type: List[str]
+
+        def record(*args: Any) -> None:
+            statements.append(args[2])
+
+        event.listen(db.engine, "before_cursor_execute", record)
+        try:
+            lookup_token(token)
+        finally:
+            event.remove(db.engine, "before_cursor_execute", record)
+        return [s for s in statements if "FROM token" in s]
+
+    def test_unchanged(self) -> None:
+        token = add_token("admin", "", True)
+        signed_tokens.configure("secret", 0)
+        self.assertEqual(len(self.statements(token)), 1)
+        self.assertEqual(self.statements(token), [])
+
+    def test_incremental(self) -> None:
+        signed_tokens.configure("secret", 30, 0)
+        for _ in range(3):
+            add_token("admin", "", True)
+        self.assertEqual(lookup_token(add_token("admin", "", True)).id, 4)
+
+        token = self.add_elsewhere()
+        statements = self.statements(token)
+        self.assertEqual(len(statements), 2)
+        self.assertTrue(all("WHERE token.id" in s for s in statements))
+        self.assertEqual(lookup_token(token).id, 5)
+
+    def test_deleted_elsewhere(self) -> None:
+        signed_tokens.configure("secret", 30, 0)
+        token = add_token("admin", "", True)
+        add_token("admin", "", True)
+        self.assertEqual(lookup_token(token).id, 1)
+
+        Token.query.filter_by(id=1).delete()
+        db.session.commit()
+        self.assertEqual(lookup_token(self.add_elsewhere()).id, 3)
+        self.assertIsNone(lookup_token(token))
+
+    def test_reused_elsewhere(self) -> None:
+        signed_tokens.configure("secret", 30, 0)
+        token = add_token("admin", "", True)
+        self.assertEqual(lookup_token(token).id, 1)
+
+        Token.query.filter_by(id=1).delete()
+        db.session.commit()
+        self.assertEqual(lookup_token(self.add_elsewhere()).id, 1)
+        self.assertIsNone(lookup_token(token))
+
+    def test_unlocked_reload(self) -> None:
+        token = add_token("admin", "desc", signed=True)
+        lock = getattr(signed_tokens, "_lock")
+        read = getattr(SignedTokens, "_read")
+
+        def load(*args: Any) -> Any:
+            self.assertFalse(lock.locked())
+            return read(*args)
+
+        with patch.object(signed_tokens, "_read", side_effect=load) as mock:
+            self.assertEqual(lookup_token(token).id, 1)
+            self.assertEqual(mock.call_count, 1)
+
+
 class GenerateTokenTest(TestCase):
     def test_length(self) -> None:
         self.assertEqual(len(generate_token(5)), 10)
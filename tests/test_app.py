@@ -1,6 +1,12 @@
+import os
+import tempfile
 from unittest import TestCase
 
+from flask import has_app_context
+
+from pkrecv import ratelimit
 from pkrecv.app import AppError, init_app
+from pkrecv.models import token
 
 
 class InitAppTest(TestCase):
@@ -14,6 +20,32 @@ class InitAppTest(TestCase):
         self.assertEqual(app.config["SQLALCHEMY_DATABASE_URI"], "sqlite:///")
         self.assertEqual(app.config["SQLALCHEMY_TRACK_MODIFICATIONS"], False)
 
+    def test_no_context(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False
+        }
+        init_app(options)
+        self.assertFalse(has_app_context())
+
+    def test_sections(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False
+        }
+        app = init_app(options, sqlite={"Busy_Retries": 3})
+
+        self.assertEqual(app.config["SQLITE_BUSY_RETRIES"], 3)
+
+    def test_invalid_sqlite(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False
+        }
+
+        with self.assertRaises(AppError):
+            init_app(options, sqlite={"journal_mode": "x"})
+
     def test_invalid_db(self) -> None:
         options = {
             "sqlalchemy_database_URI": "...",
@@ -22,3 +54,43 @@ class InitAppTest(TestCase):
 
         with self.assertRaises(AppError):
             init_app(options)
+
+    def test_token_cache(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False,
+            "token_cache_size": 12,
+            "token_cache_ttl": 34,
+            "token_cache_negative_ttl": 56,
+        }
+        init_app(options)
+
+        self.assertEqual(token.cache.size, 12)
+        self.assertEqual(token.cache.ttl, 34)
+        self.assertEqual(token.negative_cache.size, 12)
+        self.assertEqual(token.negative_cache.ttl, 56)
+
+    def test_ratelimit(self) -> None:
+        options = {
+            "sqlalchemy_database_uri": "sqlite:///",
+            "sqlalchemy_track_modifications": False,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "buckets")
+            init_app(
+                options,
+                ratelimit={
+                    "enabled": True,
+                    "path": path,
+                    "server_rate": 2,
+                    "server_total_rate": 10,
+                    "server_total_burst": 20,
+                }
+            )
+            self.addCleanup(ratelimit.limiter.configure, False, {}, {})
+
+            limiter = ratelimit.limiter
+            self.assertTrue(limiter.enabled)
+            self.assertEqual(limiter.path, path)
+            self.assertEqual(limiter.limits, {"server": (2, 2)})
+            self.assertEqual(limiter.role_limits, {"server": (10, 20)})
@@ -0,0 +1,66 @@
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pkrecv.cache import Cache
+
+
+class CacheTest(TestCase):
+    def test_get_set(self) -> None:
+        cache = Cache(size=2, ttl=10)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("a", 123), 123)
+
+        cache.set("a", 1)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_lru(self) -> None:
+        cache = Cache(size=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual(cache.get("a"), 1)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+
+    @patch("pkrecv.cache.time.monotonic")
+    def test_ttl(self, mock: MagicMock) -> None:
+        mock.return_value = 100
+        cache = Cache(size=2, ttl=10)
+        cache.set("a", 1)
+        cache.set("b", 2, ttl=20)
+
+        mock.return_value = 115
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_invalidate(self) -> None:
+        cache = Cache(size=2, ttl=10)
+        cache.set("a", 1)
+        cache.invalidate()
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_generation(self) -> None:
+        cache = Cache(size=2, ttl=10)
+        generation = cache.generation
+        cache.invalidate()
+        cache.set("a", 1, generation=generation)
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("a", 1, generation=cache.generation)
+        self.assertEqual(cache.get("a"), 1)
+
+    def test_configure(self) -> None:
+        cache = Cache(size=2, ttl=10)
+        cache.set("a", 1)
+        cache.configure(0, 5)
+        self.assertIsNone(cache.get("a"))
+
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.ttl, 5)
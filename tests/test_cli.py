@@ -1,11 +1,15 @@
+import os
+import subprocess
+import sys
 import tempfile
 from unittest import TestCase
 from unittest.mock import MagicMock, patch
 
 from click.testing import CliRunner
+from flask import has_app_context
 
 from pkrecv import app, cli, config
-from pkrecv.models import token
+from pkrecv.models import db, migrate, token
 
 
 class CliTest(TestCase):
@@ -31,7 +35,7 @@ class CliTest(TestCase):
         self.assertEqual(result.output, "ERROR: asdf\n")
         self.assertEqual(result.exit_code, 1)
 
-    @patch("pkrecv.app.init_app")
+    @patch("pkrecv.app.init_models")
     def test_app_error(self, mock: MagicMock) -> None:
         mock.side_effect = app.AppError("xyz")
 
@@ -39,6 +43,22 @@ class CliTest(TestCase):
             "--config-file",
             self.config.name,
             "add-token",
+            "--role",
+            "admin",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(result.output, "ERROR: xyz\n")
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("pkrecv.app.init_app")
+    def test_serve_app_error(self, mock: MagicMock) -> None:
+        mock.side_effect = app.AppError("xyz")
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "serve",
         ]
         runner = CliRunner()
         result = runner.invoke(cli.cli, args)
@@ -94,6 +114,262 @@ class AddTokenTest(TestCase):
         result = runner.invoke(cli.cli, args)
         self.assertEqual(result.output, "Token: abcd\n")
         self.assertEqual(result.exit_code, 0)
+        mock.assert_called_once_with("admin", None, False)
+
+    @patch("pkrecv.models.token.add_token")
+    def test_token_signed(self, mock: MagicMock) -> None:
+        mock.return_value = "abcd.efgh"
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "add-token",
+            "--role",
+            "admin",
+            "--signed",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(result.output, "Token: abcd.efgh\n")
+        self.assertEqual(result.exit_code, 0)
+        mock.assert_called_once_with("admin", None, True)
+
+
+class MigrateTest(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.config = tempfile.NamedTemporaryFile()
+        self.config.write(
+            b"""
+            [flask]
+            sqlalchemy_database_uri = sqlite:///:memory:
+            sqlalchemy_track_modifications = false
+            """
+        )
+        self.config.flush()
+
+    def tearDown(self) -> None:
+        self.config.close()
+
+    @patch("pkrecv.models.migrate.migrate")
+    def test_db_error(self, mock: MagicMock) -> None:
+        mock.side_effect = db.DBError("xyz")
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "migrate",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(result.output, "ERROR: xyz\n")
+        self.assertEqual(result.exit_code, 1)
+
+    @patch("pkrecv.models.migrate.migrate")
+    def test_success(self, mock: MagicMock) -> None:
+        mock.return_value = [migrate.migrations[0]]
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "migrate",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(
+            result.output, "Applied migration 1: {}\n"
+            "Schema version: {}\n".format(
+                migrate.migrations[0].description, migrate.latest_version()
+            )
+        )
+        self.assertEqual(result.exit_code, 0)
+
+
+class BulkTest(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = tempfile.NamedTemporaryFile()
+        self.config.write(
+            """
+            [flask]
+            sqlalchemy_database_uri = sqlite:///{}/db.sqlite
+            sqlalchemy_track_modifications = false
+            """.format(self.tmp.name).encode("utf-8")
+        )
+        self.config.flush()
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "add-token",
+            "--role",
+            "server",
+        ]
+        CliRunner().invoke(cli.cli, args)
+
+    def tearDown(self) -> None:
+        self.config.close()
+        self.tmp.cleanup()
+
+    def test_import_export(self) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "import",
+            "--token-id",
+            "1",
+            "--processes",
+            "1",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(
+            cli.cli, args, input="a ssh-rsa abcd\n[b]:2222 ssh-rsa abcd\n"
+        )
+        self.assertEqual(
+            result.output, "\rImported 2 servers from 2 lines\n"
+        )
+        self.assertEqual(result.exit_code, 0)
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "export",
+        ]
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(
+            result.output, "a ssh-rsa abcd\n[b]:2222 ssh-rsa abcd\n"
+        )
+        self.assertEqual(result.exit_code, 0)
+        self.assertFalse(has_app_context())
+
+    def test_import_errors(self) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "import",
+            "--token-id",
+            "1",
+            "--format",
+            "ndjson",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input='{"ip": "a"}\n{\n')
+        self.assertEqual(
+            result.output, "\rImported 0 servers from 2 lines\n"
+            "ERROR: line 1: invalid public key\n"
+            "ERROR: line 2: invalid JSON\n"
+        )
+        self.assertEqual(result.exit_code, 1)
+
+    def test_import_invalid_token(self) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "import",
+            "--token-id",
+            "2",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args, input="")
+        self.assertEqual(result.output, "ERROR: invalid token id 2\n")
+        self.assertEqual(result.exit_code, 1)
+
+
+class ProfileReportTest(TestCase):
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = tempfile.NamedTemporaryFile()
+        self.config.write(
+            """
+            [flask]
+            sqlalchemy_database_uri = sqlite:///:memory:
+            sqlalchemy_track_modifications = false
+
+            [profiling]
+            directory = {}
+            """.format(self.tmp.name).encode("utf-8")
+        )
+        self.config.flush()
+
+    def tearDown(self) -> None:
+        self.config.close()
+        self.tmp.cleanup()
+
+    @patch("pkrecv.profiling.report")
+    def test_report(self, mock: MagicMock) -> None:
+        mock.return_value = "report\n"
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "profile-report",
+            "--top",
+            "5",
+            "--endpoint",
+            "server",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        mock.assert_called_once_with(self.tmp.name, 5, "cumulative", "server")
+        self.assertEqual(result.output, "report\n")
+        self.assertEqual(result.exit_code, 0)
+
+    @patch("pkrecv.profiling.report")
+    def test_directory(self, mock: MagicMock) -> None:
+        mock.return_value = ""
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "profile-report",
+            "--directory",
+            "xyz",
+            "--sort",
+            "tottime",
+        ]
+        runner = CliRunner()
+        runner.invoke(cli.cli, args)
+        mock.assert_called_once_with("xyz", 20, "tottime", None)
+
+    def test_error(self) -> None:
+        args = [
+            "--config-file",
+            self.config.name,
+            "profile-report",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(
+            result.output, "ERROR: no profiles in {}\n".format(self.tmp.name)
+        )
+        self.assertEqual(result.exit_code, 1)
+
+    def test_no_directory(self) -> None:
+        self.config.seek(0)
+        self.config.truncate()
+        self.config.write(
+            b"""
+            [flask]
+            sqlalchemy_database_uri = sqlite:///:memory:
+            sqlalchemy_track_modifications = false
+            """
+        )
+        self.config.flush()
+
+        args = [
+            "--config-file",
+            self.config.name,
+            "profile-report",
+        ]
+        runner = CliRunner()
+        result = runner.invoke(cli.cli, args)
+        self.assertEqual(result.output, "ERROR: no profiling directory\n")
+        self.assertEqual(result.exit_code, 1)
 
 
 class ServeTest(TestCase):
@@ -125,3 +401,46 @@ class ServeTest(TestCase):
 
         self.assertEqual(len(mock.mock_calls), 1)
         self.assertEqual(result.exit_code, 0)
+
+
+class ImportTest(TestCase):
+    script = """
+import sys
+from pkrecv import cli
+cli.cli(sys.argv[1:], standalone_mode=False)
+print(",".join(m for m in {modules} if m in sys.modules))
+"""
+
+    def setUp(self) -> None:
+        super().setUp()
+
+        self.config = tempfile.NamedTemporaryFile()
+        self.config.write(
+            b"""
+            [flask]
+            sqlalchemy_database_uri = sqlite:///:memory:
+            sqlalchemy_track_modifications = false
+            """
+        )
+        self.config.flush()
+
+    def tearDown(self) -> None:
+        self.config.close()
+
+    def run_cli(self, *args: str) -> str:
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        script = self.script.format(modules=["gunicorn", "flask_restful"])
+        result = subprocess.run(
+            [sys.executable, "-c", script, "--config-file", self.config.name]
+            + list(args),
+            cwd=root,
+            stdout=subprocess.PIPE,
+            check=True
+        )
+        return result.stdout.decode("utf-8").splitlines()[-1]
+
+    def test_add_token(self) -> None:
+        self.assertEqual(self.run_cli("add-token", "--role", "admin"), "")
+
+    def test_migrate(self) -> None:
+        self.assertEqual(self.run_cli("migrate"), "")
@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from pkrecv.metrics import METRICS, Registry
+
+
+class RegistryTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = Registry(METRICS)
+        self.registry.configure(True, self.tmp.name, 3600)
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def test_disabled(self) -> None:
+        self.registry.configure(False)
+        self.registry.inc("pkrecv_auth_total", result="success")
+        self.assertEqual(self.registry.collect(), {})
+        self.assertIsNone(self.registry.directory)
+
+    def test_counter(self) -> None:
+        self.registry.inc("pkrecv_auth_total", result="success")
+        self.registry.inc("pkrecv_auth_total", result="success")
+        self.registry.inc("pkrecv_auth_total", result="failure")
+
+        text = self.registry.render()
+        self.assertIn("# TYPE pkrecv_auth_total counter", text)
+        self.assertIn('pkrecv_auth_total{result="success"} 2.0', text)
+        self.assertIn('pkrecv_auth_total{result="failure"} 1.0', text)
+
+    def test_histogram(self) -> None:
+        name = "pkrecv_db_query_duration_seconds"
+        self.registry.observe(name, 0.0001, operation="SELECT")
+        self.registry.observe(name, 0.002, operation="SELECT")
+        self.registry.observe(name, 100, operation="SELECT")
+
+        text = self.registry.render()
+        labels = 'operation="SELECT"'
+        self.assertIn(
+            '{}_bucket{{{},le="0.0001"}} 1'.format(name, labels), text
+        )
+        self.assertIn(
+            '{}_bucket{{{},le="0.005"}} 2'.format(name, labels), text
+        )
+        self.assertIn('{}_bucket{{{},le="+Inf"}} 3'.format(name, labels), text)
+        self.assertIn('{}_count{{{}}} 3'.format(name, labels), text)
+        self.assertIn('{}_sum{{{}}} 100.0021'.format(name, labels), text)
+
+    def test_escape(self) -> None:
+        self.registry.inc("pkrecv_auth_total", result='a"b\\c\nd')
+        self.assertIn(
+            'pkrecv_auth_total{result="a\\"b\\\\c\\nd"} 1.0',
+            self.registry.render()
+        )
+
+    def test_processes(self) -> None:
+        other = [
+            ["pkrecv_auth_total", [["result", "success"]], 5],
+            ["pkrecv_db_query_duration_seconds", [["operation", "SELECT"]],
+             [1, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0.5]],
+            ["unknown", [], 1],
+        ]
+        with open(os.path.join(self.tmp.name, "1.json"), "w") as f:
+            json.dump(other, f)
+        with open(os.path.join(self.tmp.name, "2.json"), "w") as f:
+            f.write("{")
+
+        self.registry.inc("pkrecv_auth_total", result="success")
+        self.registry.observe(
+            "pkrecv_db_query_duration_seconds", 0.25, operation="SELECT"
+        )
+
+        values = self.registry.collect()
+        self.assertEqual(
+            values[("pkrecv_auth_total", (("result", "success"), ))], 6
+        )
+        self.assertEqual(
+            values[("pkrecv_db_query_duration_seconds",
+                    (("operation", "SELECT"), ))],
+            [1, 0, 0, 0, 0, 0, 0, 1, 0, 0, 0.75]
+        )
+        self.assertNotIn(("unknown", ()), values)
+        self.assertTrue(
+            os.path.exists(
+                os.path.join(self.tmp.name, "{}.json".format(os.getpid()))
+            )
+        )
+
+    def test_configure_removes_snapshots(self) -> None:
+        path = os.path.join(self.tmp.name, "1.json")
+        with open(path, "w") as f:
+            f.write("[]")
+
+        self.registry.configure(True, self.tmp.name)
+        self.assertFalse(os.path.exists(path))
+
+    def test_temporary_directory(self) -> None:
+        self.registry.configure(True)
+        directory = self.registry.directory
+        try:
+            self.assertTrue(os.path.isdir(directory))
+            self.registry.write()
+            self.registry.cleanup()
+            self.assertFalse(os.path.exists(directory))
+            self.assertIsNone(self.registry.directory)
+        finally:
+            if os.path.isdir(directory):
+                os.rmdir(directory)
+
+    def test_cleanup_keeps_directory(self) -> None:
+        self.registry.write()
+        self.registry.cleanup()
+        self.assertTrue(os.path.isdir(self.tmp.name))
+        self.assertEqual(len(os.listdir(self.tmp.name)), 1)
+
+    def test_reconfigure_temporary(self) -> None:
+        self.registry.configure(True)
+        directory = self.registry.directory
+        self.registry.configure(True, self.tmp.name)
+        self.assertFalse(os.path.exists(directory))
+        self.assertEqual(self.registry.directory, self.tmp.name)
+
+    def test_interval(self) -> None:
+        self.registry.configure(True, self.tmp.name, 0)
+        self.registry.inc("pkrecv_auth_total", result="success")
+        path = os.path.join(self.tmp.name, "{}.json".format(os.getpid()))
+        with open(path, "r") as f:
+            self.assertEqual(len(json.load(f)), 1)
+
+    def test_fork(self) -> None:
+        self.registry.inc("pkrecv_auth_total", result="success")
+        with patch("os.getpid", return_value=os.getpid() + 1):
+            self.registry.inc("pkrecv_auth_total", result="failure")
+            self.registry.write()
+
+        path = os.path.join(self.tmp.name, "{}.json".format(os.getpid() + 1))
+        with open(path, "r") as f:
+            self.assertEqual(
+                json.load(f),
+                [["pkrecv_auth_total", [["result", "failure"]], 1]]
+            )
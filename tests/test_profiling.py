@@ -0,0 +1,77 @@
+import cProfile
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from pkrecv import profiling
+
+
+class ProfilingTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self) -> None:
+        self.tmp.cleanup()
+
+    def profile(self, endpoint: str, duration: float, max_files: int) -> str:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        sorted(range(100))
+        profiler.disable()
+        return profiling.save(
+            profiler, self.tmp.name, endpoint, duration, max_files
+        )
+
+    def test_save(self) -> None:
+        path = self.profile("server", 0.0123, 10)
+        name = os.path.basename(path)
+        self.assertTrue(name.endswith("-{}-server-12ms.prof".format(
+            os.getpid()
+        )))
+        self.assertEqual(profiling.profiles(self.tmp.name), [path])
+
+    def test_sanitize(self) -> None:
+        path = self.profile("a/b c", 0, 10)
+        self.assertTrue(path.endswith("-a_b_c-0ms.prof"))
+
+    def test_rotate(self) -> None:
+        with patch("time.time", side_effect=[1.0, 2.0, 3.0, 4.0]):
+            paths = [self.profile("server", 0, 2) for _ in range(4)]
+        self.assertEqual(profiling.profiles(self.tmp.name), paths[2:])
+
+    def test_profiles_endpoint(self) -> None:
+        server = self.profile("server", 0, 10)
+        self.profile("token", 0, 10)
+        with open(os.path.join(self.tmp.name, "other.prof"), "w"):
+            pass
+
+        self.assertEqual(
+            profiling.profiles(self.tmp.name, "server"), [server]
+        )
+        self.assertEqual(len(profiling.profiles(self.tmp.name)), 2)
+
+    def test_report(self) -> None:
+        self.profile("server", 0.01, 10)
+        self.profile("server", 0.03, 10)
+        self.profile("token", 0.5, 10)
+
+        report = profiling.report(self.tmp.name, 5, "tottime", "server")
+        self.assertTrue(report.startswith("2 profiles, 20ms mean, 30ms max"))
+        self.assertIn("sorted", report)
+
+    def test_report_empty(self) -> None:
+        with self.assertRaises(profiling.ProfilingError):
+            profiling.report(self.tmp.name)
+
+    def test_report_invalid_sort(self) -> None:
+        self.profile("server", 0, 10)
+        with self.assertRaises(profiling.ProfilingError):
+            profiling.report(self.tmp.name, sort="xyz")
+
+    def test_report_corrupt(self) -> None:
+        path = os.path.join(self.tmp.name, "1.0-1-server-1ms.prof")
+        with open(path, "w") as f:
+            f.write("xyz")
+        with self.assertRaises(profiling.ProfilingError):
+            profiling.report(self.tmp.name)
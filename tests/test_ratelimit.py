@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from pkrecv.ratelimit import Limit, RateLimiter, parse_limits
+
+
+class RateLimiterTest(TestCase):
+    def setUp(self) -> None:
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "buckets")
+        self.limiter = RateLimiter()
+        self.limiter.configure(
+            True, {"server": Limit(1, 3)}, {}, self.path, slots=64
+        )
+
+    def tearDown(self) -> None:
+        self.limiter.configure(False, {}, {})
+        self.tmp.cleanup()
+
+    def test_disabled(self) -> None:
+        self.limiter.configure(False, {"server": Limit(1, 3)}, {})
+        self.assertIsNone(self.limiter.path)
+        for _ in range(10):
+            self.assertEqual(self.limiter.check(1, "server"), 0)
+
+    def test_no_limits(self) -> None:
+        self.limiter.configure(True, {}, {})
+        self.assertFalse(self.limiter.enabled)
+
+    def test_unlimited_role(self) -> None:
+        for _ in range(10):
+            self.assertEqual(self.limiter.check(1, "admin"), 0)
+
+    @patch("pkrecv.ratelimit.time.monotonic")
+    def test_token(self, mock: MagicMock) -> None:
+        mock.return_value = 100
+        for _ in range(3):
+            self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(1, "server"), 1)
+        self.assertEqual(self.limiter.check(2, "server"), 0)
+
+        mock.return_value = 100.5
+        self.assertEqual(self.limiter.check(1, "server"), 0.5)
+
+        mock.return_value = 101
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(1, "server"), 1)
+
+        mock.return_value = 1000
+        for _ in range(3):
+            self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(1, "server"), 1)
+
+    @patch("pkrecv.ratelimit.time.monotonic")
+    def test_role(self, mock: MagicMock) -> None:
+        mock.return_value = 100
+        self.limiter.configure(
+            True, {"server": Limit(1, 2)}, {"server": Limit(1, 3)}, self.path
+        )
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(2, "server"), 0)
+        self.assertEqual(self.limiter.check(3, "server"), 1)
+
+        # A token that is rejected by its own bucket doesn't take from
+        # the bucket of the role.
+        mock.return_value = 101
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertEqual(self.limiter.check(1, "server"), 1)
+        self.assertEqual(self.limiter.check(3, "server"), 1)
+
+    @patch("pkrecv.ratelimit.time.monotonic")
+    def test_eviction(self, mock: MagicMock) -> None:
+        mock.return_value = 100
+        self.limiter.configure(
+            True, {"server": Limit(1, 1)}, {}, self.path, slots=4
+        )
+        for token_id in range(1, 5):
+            self.assertEqual(self.limiter.check(token_id, "server"), 0)
+
+        mock.return_value = 100.5
+        self.assertEqual(self.limiter.check(5, "server"), 0)
+        self.assertEqual(self.limiter.check(5, "server"), 1)
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+
+    def test_configure_clears(self) -> None:
+        for _ in range(3):
+            self.limiter.check(1, "server")
+        self.assertNotEqual(self.limiter.check(1, "server"), 0)
+
+        self.limiter.configure(
+            True, {"server": Limit(1, 3)}, {}, self.path, slots=64
+        )
+        self.assertEqual(self.limiter.check(1, "server"), 0)
+
+    def test_temporary_file(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            with patch("tempfile.tempdir", tmp):
+                self.limiter.configure(True, {"server": Limit(1, 3)}, {})
+            self.assertIsNone(self.limiter.path)
+            self.assertEqual(os.listdir(tmp), [])
+
+        for _ in range(3):
+            self.assertEqual(self.limiter.check(1, "server"), 0)
+        self.assertNotEqual(self.limiter.check(1, "server"), 0)
+
+    def test_processes(self) -> None:
+        self.limiter.configure(
+            True, {"server": Limit(0.001, 50)}, {}, self.path
+        )
+        ctx = multiprocessing.get_context("fork")
+        allowed = ctx.Value("i", 0)
+
+        def consume() -> None:
+            for _ in range(40):
+                if not self.limiter.check(1, "server"):
+                    with allowed.get_lock():
+                        allowed.value += 1
+
+        processes = [ctx.Process(target=consume) for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(allowed.value, 50)
+
+
+class ParseLimitsTest(TestCase):
+    def test_parse(self) -> None:
+        config = {
+            "RATELIMIT_SERVER_RATE": 2,
+            "RATELIMIT_SERVER_BURST": 10,
+            "RATELIMIT_SERVER_TOTAL_RATE": 0.5,
+            "RATELIMIT_NONE_RATE": 0.1,
+        }
+        limits, role_limits = parse_limits(config, ["admin", "server", "none"])
+        self.assertEqual(
+            limits, {
+                "server": Limit(2.0, 10.0),
+                "none": Limit(0.1, 1.0),
+            }
+        )
+        self.assertEqual(role_limits, {"server": Limit(0.5, 1.0)})
@@ -1,5 +1,6 @@
 from argparse import ArgumentParser
 from unittest import TestCase
+from unittest.mock import MagicMock, patch
 
 from flask import Flask
 
@@ -24,8 +25,83 @@ class LoadConfigTest(TestCase):
         self.assertEqual(gunicorn.cfg.bind, ["127.0.0.1:1234"])
 
 
+class LimitWaitTest(TestCase):
+    def test_sync(self) -> None:
+        app = Flask("name")
+        Gunicorn(app, {})
+        self.assertEqual(app.config["CHANGES_MAX_WAIT"], 25)
+
+        app.config["CHANGES_MAX_WAIT"] = 10
+        Gunicorn(app, {"timeout": 60})
+        self.assertEqual(app.config["CHANGES_MAX_WAIT"], 10)
+
+        Gunicorn(app, {"timeout": 12})
+        self.assertEqual(app.config["CHANGES_MAX_WAIT"], 7)
+
+        Gunicorn(app, {"timeout": 3})
+        self.assertEqual(app.config["CHANGES_MAX_WAIT"], 0)
+
+    def test_async(self) -> None:
+        app = Flask("name")
+        Gunicorn(app, {"worker_class": "gthread", "timeout": 10})
+        self.assertNotIn("CHANGES_MAX_WAIT", app.config)
+
+
 class TestLoad(TestCase):
     def test_app(self) -> None:
         app = Flask("name")
         gunicorn = Gunicorn(app, {})
         self.assertIs(gunicorn.load(), app)
+
+    @patch("pkrecv.wsgi.gc")
+    def test_preload(self, mock: MagicMock) -> None:
+        Gunicorn(Flask("name"), {}).load()
+        self.assertEqual(mock.freeze.call_count, 0)
+
+        Gunicorn(Flask("name"), {"preload_app": True}).load()
+        mock.freeze.assert_called_once_with()
+
+
+class ForkTest(TestCase):
+    def test_hooks(self) -> None:
+        gunicorn = Gunicorn(Flask("name"), {})
+        self.assertEqual(gunicorn.cfg.pre_fork, gunicorn.pre_fork)
+        self.assertEqual(gunicorn.cfg.post_fork, gunicorn.post_fork)
+
+    def test_pre_fork(self) -> None:
+        with patch("pkrecv.wsgi.db") as db:
+            Gunicorn(Flask("name"), {}).cfg.pre_fork(None, None)
+            db.engine.dispose.assert_called_once_with()
+
+    @patch("pkrecv.models.pool.warm_up")
+    def test_post_fork(self, mock: MagicMock) -> None:
+        app = Flask("name")
+        with patch("pkrecv.wsgi.db") as db:
+            Gunicorn(app, {}).cfg.post_fork(None, None)
+            db.engine.dispose.assert_called_once_with()
+            self.assertEqual(mock.call_count, 0)
+
+    @patch("pkrecv.models.pool.warm_up")
+    def test_warm_up(self, mock: MagicMock) -> None:
+        app = Flask("name")
+        app.config["POOL_WARMUP"] = 3
+        with patch("pkrecv.wsgi.db") as db:
+            Gunicorn(app, {}).cfg.post_fork(None, None)
+            db.engine.dispose.assert_called_once_with()
+            mock.assert_called_once_with(db.engine, 3)
+
+
+class WorkerExitTest(TestCase):
+    @patch("pkrecv.metrics.registry.write")
+    def test_write(self, mock: MagicMock) -> None:
+        gunicorn = Gunicorn(Flask("name"), {})
+        gunicorn.cfg.worker_exit(None, None)
+        mock.assert_called_once_with()
+
+
+class OnExitTest(TestCase):
+    @patch("pkrecv.metrics.registry.cleanup")
+    def test_cleanup(self, mock: MagicMock) -> None:
+        gunicorn = Gunicorn(Flask("name"), {})
+        gunicorn.cfg.on_exit(None)
+        mock.assert_called_once_with()